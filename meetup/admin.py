@@ -6,35 +6,93 @@ from .models import (
     Schedule,
     Question,
     Donation,
+    DonationTotals,
+    DonationDayTotals,
     Friend,
     EventGuests,
+    Broadcast,
+    OutgoingMessage,
 )
 
+# Наибольшее значение INTEGER в SQLite
+MAX_INTEGER = 2 ** 63 - 1
+
+
+def is_integer(term):
+    """Строка из цифр ASCII, которая помещается в INTEGER.
+
+    isdigit() пропускает и цифры вроде '²', которые не читает int(),
+    а слишком длинное число не передать в запрос.
+    """
+    return term.isascii() and term.isdigit() and len(term) <= len(str(MAX_INTEGER)) and int(term) <= MAX_INTEGER
+
+
+class GuestSearchMixin:
+    """Поиск гостя по индексам: число ищется по телеграм ID, текст — по началу имени.
+
+    Стандартный поиск admin (icontains по всем search_fields) читает
+    всю таблицу гостей на каждый запрос.
+    """
+
+    # Путь к гостю от модели страницы, пустой для самих гостей
+    guest_path = 'guest'
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        prefix = f'{self.guest_path}__' if self.guest_path else ''
+        if is_integer(term):
+            return queryset.filter(**{f'{prefix}telegram_id': int(term)}), False
+        return queryset.filter(**{f'{prefix}name__istartswith': term}), False
+
 
 @admin.register(EventGuests)
-class EventGuestsAdmin(admin.ModelAdmin):
-    list_display = ('event', 'guest')
-    list_filter = ('event', 'guest')
+class EventGuestsAdmin(GuestSearchMixin, admin.ModelAdmin):
+    list_display = ('event', 'guest', 'subscribed')
+    list_filter = ('event', 'subscribed')
+    list_select_related = ('event', 'guest')
+    search_fields = ('^guest__name',)
+    autocomplete_fields = ('guest',)
+    show_full_result_count = False
 
 
 @admin.register(Friend)
-class FriendAdmin(admin.ModelAdmin):
-    pass
+class FriendAdmin(GuestSearchMixin, admin.ModelAdmin):
+    list_display = ('guest', 'friend')
+    list_select_related = ('guest', 'friend')
+    search_fields = ('^guest__name',)
+    autocomplete_fields = ('guest', 'friend')
+    show_full_result_count = False
 
 
 @admin.register(Guest)
-class GuestAdmin(admin.ModelAdmin):
-    pass
+class GuestAdmin(GuestSearchMixin, admin.ModelAdmin):
+    guest_path = ''
+    list_display = ('name', 'telegram_id', 'phone', 'open_for_contact')
+    list_filter = ('open_for_contact',)
+    # Сортировка по индексу guest_name_idx: подсказки в полях
+    # автодополнения читают первые совпадения, а не всю таблицу
+    ordering = ('name', 'id')
+    search_fields = ('^name',)
+    search_help_text = 'Телеграм ID или начало имени'
+    show_full_result_count = False
 
 
 @admin.register(Schedule)
 class ScheduleAdmin(admin.ModelAdmin):
-    pass
+    list_display = ('topic', 'event', 'start_at', 'speaker', 'active')
+    list_filter = ('event',)
+    list_select_related = ('event', 'speaker')
+    ordering = ('event', 'start_at')
+    search_fields = ('topic',)
+    autocomplete_fields = ('speaker',)
 
 
 class ScheduleInline(admin.TabularInline):
     extra=0
     model = Schedule
+    autocomplete_fields = ('speaker',)
 
 
 @admin.register(Event)
@@ -46,10 +104,88 @@ class EventAdmin(admin.ModelAdmin):
 
 
 @admin.register(Question)
-class QuestionAdmin(admin.ModelAdmin):
-    pass
+class QuestionAdmin(GuestSearchMixin, admin.ModelAdmin):
+    list_display = ('__str__', 'schedule', 'guest')
+    list_filter = ('schedule__event',)
+    list_select_related = ('schedule', 'guest')
+    search_fields = ('^guest__name',)
+    autocomplete_fields = ('schedule', 'guest')
+    show_full_result_count = False
 
 
 @admin.register(Donation)
-class DonationAdmin(admin.ModelAdmin):
-    pass
+class DonationAdmin(GuestSearchMixin, admin.ModelAdmin):
+    """Итоги мероприятий пересчитываются после каждой правки донатов"""
+
+    list_display = ('created_at', 'amount', 'guest', 'event')
+    list_filter = ('event',)
+    list_select_related = ('guest', 'event')
+    search_fields = ('^guest__name',)
+    autocomplete_fields = ('guest',)
+    show_full_result_count = False
+
+    def save_model(self, request, obj, form, change):
+        event_ids = {obj.event_id}
+        if change:
+            event_ids.update(Donation.objects.filter(pk=obj.pk).values_list('event_id', flat=True))
+        super().save_model(request, obj, form, change)
+        rebuild_totals(event_ids)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        rebuild_totals({obj.event_id})
+
+    def delete_queryset(self, request, queryset):
+        event_ids = set(queryset.values_list('event_id', flat=True))
+        super().delete_queryset(request, queryset)
+        rebuild_totals(event_ids)
+
+
+def rebuild_totals(event_ids):
+    # db_operations вызывает django.setup() и не может импортироваться,
+    # пока загружаются приложения
+    from .db_operations import rebuild_donation_totals
+
+    event_ids = {event_id for event_id in event_ids if event_id is not None}
+    if event_ids:
+        rebuild_donation_totals(event_ids)
+
+
+class ReadOnlyAdmin(admin.ModelAdmin):
+    """Таблица, которую ведет сам бот: в админке ее можно только смотреть"""
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(DonationTotals)
+class DonationTotalsAdmin(ReadOnlyAdmin):
+    list_display = ('event', 'count', 'amount')
+    list_select_related = ('event',)
+
+
+@admin.register(DonationDayTotals)
+class DonationDayTotalsAdmin(ReadOnlyAdmin):
+    list_display = ('event', 'day', 'count', 'amount')
+    list_filter = ('event',)
+    list_select_related = ('event',)
+
+
+@admin.register(Broadcast)
+class BroadcastAdmin(admin.ModelAdmin):
+    list_display = ('title', 'created_at', 'finished_at')
+
+
+@admin.register(OutgoingMessage)
+class OutgoingMessageAdmin(admin.ModelAdmin):
+    list_display = ('chat_id', 'broadcast', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status',)
+    list_select_related = ('broadcast',)
+    raw_id_fields = ('broadcast',)
+    show_full_result_count = False
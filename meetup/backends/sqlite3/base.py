@@ -0,0 +1,14 @@
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """SQLite, в котором транзакции сразу берут блокировку на запись.
+
+    Обычный BEGIN откладывает блокировку до первой записи. Если к этому
+    моменту базу уже изменил другой процесс, SQLite не ждет `timeout`,
+    а сразу отвечает "database is locked". BEGIN IMMEDIATE ждет
+    блокировку в начале транзакции, как и одиночные запросы.
+    """
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE')
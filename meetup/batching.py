@@ -0,0 +1,177 @@
+import asyncio
+import logging
+import time
+
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = 0.25
+MAX_BATCH = 500
+# Сколько раз подряд пачка может не записаться, прежде чем записи
+# будут записаны по одной, а те, что не записываются, отброшены
+MAX_RETRIES = 10
+
+
+class BatchWriter:
+    """Копит записи в памяти и сбрасывает их в базу пачками.
+
+    `flush` — корутина, которая получает список накопленных записей и
+    пишет их одним пакетом. Запись происходит раз в `interval` секунд
+    или сразу, как только накопилось `max_size` записей.
+
+    Для каждой записи считается задержка от `add` до записи в базу.
+
+    Если пачка не записалась, записи возвращаются в буфер. После
+    `max_retries` неудач подряд записи пишутся по одной, а те, что не
+    записываются, попадают в лог и отбрасываются: одна испорченная
+    запись не должна навсегда останавливать остальные.
+    """
+
+    def __init__(self, flush, interval=FLUSH_INTERVAL, max_size=MAX_BATCH, max_retries=MAX_RETRIES):
+        self.flush_items = flush
+        self.interval = interval
+        self.max_size = max_size
+        self.max_retries = max_retries
+        self._items = []
+        self._wakeup = asyncio.Event()
+        self._lock = asyncio.Lock()
+        self._task = None
+        self.written = 0
+        self.batches = 0
+        self.failures = 0
+        self.dropped = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def add(self, item):
+        self._items.append((time.monotonic(), item))
+        if len(self._items) >= self.max_size:
+            self._wakeup.set()
+
+    @property
+    def pending(self):
+        return len(self._items)
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        """Останавливает фоновую запись и сбрасывает все, что осталось в буфере"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    async def run(self):
+        while True:
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception('Ошибка при пакетной записи')
+
+    async def flush(self):
+        async with self._lock:
+            items, self._items = self._items, []
+            if not items:
+                return 0
+            try:
+                await self.flush_items([item for _, item in items])
+            except Exception:
+                self.failures += 1
+                if self.failures < self.max_retries:
+                    # Возвращаем записи в буфер, чтобы не потерять их при сбое
+                    self._items[:0] = items
+                    raise
+                items = await self._flush_one_by_one(items)
+            except BaseException:
+                self._items[:0] = items
+                raise
+            self.failures = 0
+            flushed_at = time.monotonic()
+            for added_at, _ in items:
+                latency = flushed_at - added_at
+                self.total_latency += latency
+                self.max_latency = max(self.max_latency, latency)
+            self.written += len(items)
+            self.batches += 1
+            return len(items)
+
+    async def _flush_one_by_one(self, items):
+        written = []
+        for added_at, item in items:
+            try:
+                await self.flush_items([item])
+            except Exception:
+                self.dropped += 1
+                logger.exception('Запись отброшена после %s неудачных попыток: %r', self.failures, item)
+            else:
+                written.append((added_at, item))
+        return written
+
+    def stats(self):
+        return {
+            'written': self.written,
+            'batches': self.batches,
+            'pending': self.pending,
+            'dropped': self.dropped,
+            'avg_latency_ms': self.total_latency * 1000 / self.written if self.written else 0.0,
+            'max_latency_ms': self.max_latency * 1000,
+        }
+
+
+class Debouncer:
+    """Сводит частые изменения в одно действие за окно `interval` секунд.
+
+    Первый `trigger(key)` открывает окно для ключа, повторные до его
+    окончания ничего не добавляют. Когда окно закрывается, корутина
+    `action(key)` вызывается один раз и должна сама прочитать последнее
+    состояние. Изменения во время выполнения действия открывают новое окно.
+    """
+
+    def __init__(self, action, interval):
+        self.action = action
+        self.interval = interval
+        self._windows = {}
+        self._running = set()
+        self.triggered = 0
+        self.fired = 0
+
+    def trigger(self, key):
+        self.triggered += 1
+        if key not in self._windows:
+            self._windows[key] = asyncio.create_task(self._fire_later(key))
+
+    async def stop(self):
+        """Выполняет действия по открытым окнам, не дожидаясь их окончания"""
+        windows, self._windows = self._windows, {}
+        for task in windows.values():
+            task.cancel()
+        await asyncio.gather(*windows.values(), *self._running, return_exceptions=True)
+        for key in windows:
+            await self._fire(key)
+
+    async def _fire_later(self, key):
+        await asyncio.sleep(self.interval)
+        del self._windows[key]
+        task = asyncio.current_task()
+        self._running.add(task)
+        try:
+            await self._fire(key)
+        finally:
+            self._running.discard(task)
+
+    async def _fire(self, key):
+        self.fired += 1
+        try:
+            await self.action(key)
+        except Exception:
+            logger.exception('Ошибка при отложенном действии для %s', key)
+
+    def stats(self):
+        return {'triggered': self.triggered, 'fired': self.fired, 'pending': len(self._windows)}
@@ -0,0 +1,111 @@
+import asyncio
+import logging
+
+from telebot.asyncio_helper import ApiTelegramException
+
+
+logger = logging.getLogger(__name__)
+
+# Лимиты Bot API: около 30 сообщений в секунду на бота
+# и не больше одного сообщения в секунду в один чат.
+GLOBAL_RATE = 25
+PER_CHAT_INTERVAL = 1.0
+CONCURRENCY = 20
+MAX_RETRIES = 3
+
+
+class RateLimiter:
+    """Равномерно распределяет отправки: не чаще `rate` в секунду.
+
+    Каждый вызов `acquire` резервирует следующий свободный слот, поэтому
+    блокировка не нужна — между чтением и записью слота нет await.
+    """
+
+    def __init__(self, rate):
+        self.interval = 1 / rate
+        self._next_slot = 0.0
+
+    async def acquire(self):
+        now = asyncio.get_running_loop().time()
+        slot = max(now, self._next_slot)
+        self._next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def pause(self, delay):
+        """Сдвигает все следующие слоты на `delay` секунд (ответ 429)."""
+        now = asyncio.get_running_loop().time()
+        self._next_slot = max(self._next_slot, now + delay)
+
+
+class ChatRateLimiter:
+    """Не чаще одного сообщения в `interval` секунд в каждый чат."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._next_slots = {}
+
+    async def acquire(self, chat_id):
+        now = asyncio.get_running_loop().time()
+        slot = max(now, self._next_slots.get(chat_id, 0.0))
+        self._next_slots[chat_id] = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+        self._forget_expired(now)
+
+    def _forget_expired(self, now):
+        # Словарь не должен расти вместе с числом адресатов
+        if len(self._next_slots) > 10000:
+            self._next_slots = {
+                chat_id: slot for chat_id, slot in self._next_slots.items() if slot > now
+            }
+
+
+class RetryLater(Exception):
+    """Временная ошибка: сообщение стоит отправить позже"""
+
+
+def get_retry_after(error):
+    if isinstance(error, ApiTelegramException) and error.error_code == 429:
+        return error.result_json.get('parameters', {}).get('retry_after', 1)
+
+
+class Broadcaster:
+    """Отправка сообщений с соблюдением лимитов Telegram.
+
+    Рассылки ставятся в очередь OutgoingMessage и доставляются через
+    `send_one` обработчиком очереди (`outbox.OutboxWorker`), который
+    отправляет до `concurrency` сообщений одновременно.
+    """
+
+    def __init__(self, bot, rate=GLOBAL_RATE, per_chat_interval=PER_CHAT_INTERVAL,
+                 concurrency=CONCURRENCY, max_retries=MAX_RETRIES):
+        self.bot = bot
+        self.limiter = RateLimiter(rate)
+        self.chat_limiter = ChatRateLimiter(per_chat_interval)
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+
+    async def send_one(self, chat_id, text, **kwargs):
+        """Отправляет одно сообщение, повторяя его после 429.
+
+        Возвращает True при успехе, False — если сообщение доставить нельзя
+        (бот заблокирован, чат не найден). Если исчерпаны попытки или
+        произошла сетевая ошибка, выбрасывает RetryLater.
+        """
+        for _ in range(self.max_retries):
+            await self.chat_limiter.acquire(chat_id)
+            await self.limiter.acquire()
+            try:
+                await self.bot.send_message(chat_id=chat_id, text=text, **kwargs)
+                return True
+            except ApiTelegramException as error:
+                retry_after = get_retry_after(error)
+                if retry_after is None:
+                    logger.warning('Не удалось отправить сообщение в чат %s: %s', chat_id, error.description)
+                    return False
+                logger.info('Telegram просит подождать %s c.', retry_after)
+                self.limiter.pause(retry_after)
+            except Exception as error:
+                raise RetryLater(str(error)) from error
+        raise RetryLater('Превышено число попыток после ответов 429')
@@ -0,0 +1,119 @@
+import threading
+import time
+from datetime import datetime
+
+from django.conf import settings
+
+from .models import Event, Schedule
+
+
+_MISSING = object()
+
+
+class CachedValue:
+    """Значение из базы, которое хранится в памяти процесса до инвалидации.
+
+    Инвалидация происходит по сигналам моделей и явно из db_operations.
+    Сигналы не доходят до других процессов (например, до админки Django),
+    поэтому значение дополнительно устаревает через `ttl` секунд.
+    """
+
+    def __init__(self, loader, ttl=None):
+        self.loader = loader
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._value = _MISSING
+        self._loaded_at = 0.0
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            if self._value is not _MISSING and not self._expired():
+                self.hits += 1
+                return self._value
+            self.misses += 1
+            generation = self._generation
+
+        value = self.loader()
+
+        with self._lock:
+            # Если пока шел запрос значение успели инвалидировать,
+            # загруженное значение могло устареть — не сохраняем его
+            if generation == self._generation:
+                self._value = value
+                self._loaded_at = time.monotonic()
+        return value
+
+    def peek(self):
+        """Текущее значение без обращения к базе или None"""
+        value = self._value
+        return None if value is _MISSING else value
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._value = _MISSING
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+    def _expired(self):
+        return self.ttl is not None and time.monotonic() - self._loaded_at > self.ttl
+
+
+class KeyedCache:
+    """Набор CachedValue по ключу, например (event_id, режим отображения)"""
+
+    def __init__(self, loader, ttl=None):
+        self.loader = loader
+        self.ttl = ttl
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def get(self, *key):
+        with self._lock:
+            cached = self._values.get(key)
+            if cached is None:
+                cached = self._values[key] = CachedValue(lambda: self.loader(*key), self.ttl)
+        return cached.get()
+
+    def invalidate(self, *prefix):
+        """Сбрасывает значения, ключ которых начинается с `prefix`"""
+        with self._lock:
+            values = [
+                cached for key, cached in self._values.items() if key[:len(prefix)] == prefix
+            ]
+        for cached in values:
+            cached.invalidate()
+
+    def stats(self):
+        with self._lock:
+            values = list(self._values.values())
+        return {
+            'hits': sum(cached.hits for cached in values),
+            'misses': sum(cached.misses for cached in values),
+        }
+
+
+def load_active_event():
+    return Event.objects.filter(date__gte=datetime.today(), active=True).first()
+
+
+def load_active_schedule():
+    event = active_event_cache.get()
+    if not event:
+        return None
+    return Schedule.objects.filter(event_id=event.id, active=True).select_related('speaker').first()
+
+
+active_event_cache = CachedValue(load_active_event, ttl=getattr(settings, 'ACTIVE_CACHE_TTL', 60))
+active_schedule_cache = CachedValue(load_active_schedule, ttl=getattr(settings, 'ACTIVE_CACHE_TTL', 60))
+
+
+def cache_stats():
+    return {
+        'active_event': active_event_cache.stats(),
+        'active_schedule': active_schedule_cache.stats(),
+    }
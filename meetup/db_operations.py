@@ -1,18 +1,30 @@
+import logging
 import os
 import django
 
 os.environ['DJANGO_SETTINGS_MODULE'] = 'pythonmeetup.settings'
 django.setup()
 
-from .models import Event, Schedule, Guest, Question, EventGuests, Donation
+from .models import Event, Schedule, Guest, Question, EventGuests, Donation, DonationTotals, DonationDayTotals
+from .cache import active_event_cache, active_schedule_cache
+from .rendering import get_schedule_text, get_speech_keyboard, invalidate_event_views
 from typing import NamedTuple
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 
 from django.shortcuts import get_object_or_404
 from django.http import Http404
-from django.db.models import Count, Sum, F
+from django.db import transaction
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
 
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
 class Speech(NamedTuple):
     time: str
     topic: str
@@ -29,7 +41,7 @@ template_schedule = [
 ]
 
 def get_all_events() -> list[Event]:
-    return Event.objects.all()
+    return list(Event.objects.all())
 
 
 def get_event(event_id) -> Event:
@@ -56,11 +68,13 @@ def create_new_event(topic, date) -> None:
 
 
 def update_event(event_id, topic, date) -> None:
-    Event.objects.filter(id=event_id).update(topic=topic, date=date)    
+    Event.objects.filter(id=event_id).update(topic=topic, date=date)
+    active_event_cache.invalidate()
+    active_schedule_cache.invalidate()
 
 
 def get_event_schedules(event_id) -> list[Schedule]:
-    return Schedule.objects.filter(event__id=event_id).order_by('start_at')
+    return list(Schedule.objects.filter(event__id=event_id).select_related('speaker').order_by('start_at'))
 
 
 def get_event_speakers_ids(event_id) -> list[int]:
@@ -79,13 +93,18 @@ def get_active_event_schedule(event_id) -> Schedule:
     return active_schedule if active_schedule else None
 
 
-def set_active_schedule(speech_id) -> None:
-      Schedule.objects.all().update(active=False)
-      Schedule.objects.filter(id=speech_id).update(active=True)
+def set_active_schedule(event_id, speech_id) -> None:
+    # Одним UPDATE снимаем отметку со старого доклада и ставим на новый,
+    # затрагивая только эти две строки выбранного мероприятия
+    Schedule.objects.filter(Q(active=True) | Q(id=speech_id), event_id=event_id).update(
+        active=Case(When(id=speech_id, then=Value(True)), default=Value(False))
+    )
+    active_schedule_cache.invalidate()
+    invalidate_event_views(event_id)
     
 
 def get_speech(speech_id) -> Schedule:
-    return Schedule.objects.get(id=speech_id)
+    return Schedule.objects.select_related('speaker').get(id=speech_id)
 
 
 def create_speech(event_id, start_at='09:00:00', end_at='09:00:00', topic='Новое...') -> Schedule:
@@ -103,8 +122,11 @@ def delete_speech(speech_id) -> None:
 def update_speech(speech_id: int, update_speech_data: dict) -> Speech:
 
     Schedule.objects.filter(id=speech_id).update(**update_speech_data)
+    active_schedule_cache.invalidate()
+    speech = get_speech(speech_id)
+    invalidate_event_views(speech.event_id)
  
-    return Schedule.objects.get(id=speech_id)
+    return speech
  
 
 def update_speech_speaker(speech_id: int, update_speech_data: dict) -> Speech:
@@ -113,8 +135,11 @@ def update_speech_speaker(speech_id: int, update_speech_data: dict) -> Speech:
     
     speaker, _ = Guest.objects.update_or_create(telegram_id=telegram_id, defaults={'name': name})
     Schedule.objects.filter(id=speech_id).update(speaker=speaker)
+    active_schedule_cache.invalidate()
+    speech = get_speech(speech_id)
+    invalidate_event_views(speech.event_id)
  
-    return Schedule.objects.get(id=speech_id)
+    return speech
     
 
 def add_guest_to_event(telegram_id, event):
@@ -122,6 +147,54 @@ def add_guest_to_event(telegram_id, event):
     EventGuests.objects.update_or_create(guest=guest, event=event)
 
 
+def add_guests_to_events(checkins) -> None:
+    """Пакетная отметка гостей: `checkins` — пары (telegram_id, event_id).
+
+    Уже известных гостей и повторные отметки пропускает уникальный индекс.
+    Отметки на мероприятия, удаленные до записи пачки, отбрасываются.
+    """
+    event_ids = {event_id for _, event_id in checkins}
+    with transaction.atomic():
+        existing = set(Event.objects.filter(id__in=event_ids).values_list('id', flat=True))
+        if event_ids - existing:
+            logger.warning('Мероприятия удалены до записи отметок гостей: %s', sorted(event_ids - existing))
+            checkins = [(telegram_id, event_id) for telegram_id, event_id in checkins if event_id in existing]
+            if not checkins:
+                return
+        telegram_ids = {telegram_id for telegram_id, _ in checkins}
+        Guest.objects.bulk_create(
+            [Guest(telegram_id=telegram_id) for telegram_id in telegram_ids],
+            ignore_conflicts=True,
+        )
+        guest_ids = dict(
+            Guest.objects.filter(telegram_id__in=telegram_ids).values_list('telegram_id', 'id')
+        )
+        EventGuests.objects.bulk_create(
+            [
+                EventGuests(guest_id=guest_ids[telegram_id], event_id=event_id)
+                for telegram_id, event_id in set(checkins)
+            ],
+            ignore_conflicts=True,
+        )
+
+
+def set_subscription(telegram_id, event_id, subscribed) -> None:
+    """Подписка гостя мероприятия на сообщения о текущем выступлении"""
+    with transaction.atomic():
+        add_guests_to_events([(telegram_id, event_id)])
+        EventGuests.objects.filter(event_id=event_id, guest__telegram_id=telegram_id).update(subscribed=subscribed)
+
+
+def is_subscribed(telegram_id, event_id) -> bool:
+    return EventGuests.objects.filter(event_id=event_id, guest__telegram_id=telegram_id, subscribed=True).exists()
+
+
+def get_subscribers_ids(event_id) -> list[int]:
+    return list(
+        EventGuests.objects.filter(event_id=event_id, subscribed=True).values_list('guest__telegram_id', flat=True)
+    )
+
+
 def create_guest(name, phone, kind, projects, public, telegram_id) -> None:
     Guest.objects.update_or_create(
         telegram_id=telegram_id,
@@ -135,22 +208,29 @@ def create_guest(name, phone, kind, projects, public, telegram_id) -> None:
     )
 
 def set_active_event(event_id) -> Event:
+    Event.objects.filter(Q(active=True) | Q(id=event_id)).update(
+        active=Case(When(id=event_id, then=Value(True)), default=Value(False))
+    )
+    active_event_cache.invalidate()
+    active_schedule_cache.invalidate()
     
-    Event.objects.all().update(active=False)
-    current_event = Event.objects.get(id=event_id)
-    current_event.active = True
-    current_event.save()
-    
-    return current_event
+    return Event.objects.get(id=event_id)
 
 
 def get_active_event() -> Event:
-    return Event.objects.filter(date__gte=datetime.today(), active=True).first()
+    event = active_event_cache.get()
+    if event and event.date < datetime.today().date():
+        # Мероприятие закончилось, пока значение лежало в кэше
+        active_event_cache.invalidate()
+        active_schedule_cache.invalidate()
+        event = active_event_cache.get()
+    return event
 
 
-def get_contacts(telegram_id):
+def get_contacts(telegram_id, limit=None) -> list[Guest]:
     current_event = get_active_event()
-    return Guest.objects.filter(open_for_contact=True, event=current_event).exclude(telegram_id=telegram_id)  # FIXME: выводить только пользователей текущего мероприятия
+    contacts = Guest.objects.filter(open_for_contact=True, event=current_event).exclude(telegram_id=telegram_id)  # FIXME: выводить только пользователей текущего мероприятия
+    return list(contacts[:limit])
 
 
 def get_guest(telegram_id) -> Guest:
@@ -161,18 +241,42 @@ def get_guest(telegram_id) -> Guest:
 
 
 def get_active_schedule():
-    try:
-        return get_object_or_404(Schedule, active=True)
-    except Http404:
-        return
+    return active_schedule_cache.get()
 
 
 def create_question(question, schedule, guest):
     Question.objects.create(question=question, schedule=schedule, guest=guest)
 
 
+def create_questions(questions) -> None:
+    """Пакетное сохранение вопросов: `questions` — тройки (telegram_id, schedule_id, текст).
+
+    Гостей находим одним запросом, вопрос незарегистрированного гостя
+    сохраняется без автора, как и в `create_question`. Вопрос к докладу,
+    удаленному до записи пачки, сохраняется без доклада — так же, как
+    вопросы, записанные раньше (on_delete=SET_NULL).
+    """
+    schedule_ids = {schedule_id for _, schedule_id, _ in questions if schedule_id is not None}
+    existing = set(Schedule.objects.filter(id__in=schedule_ids).values_list('id', flat=True))
+    if schedule_ids - existing:
+        logger.warning('Доклады удалены до записи вопросов: %s', sorted(schedule_ids - existing))
+    guest_ids = dict(
+        Guest.objects.filter(
+            telegram_id__in={telegram_id for telegram_id, _, _ in questions}
+        ).values_list('telegram_id', 'id')
+    )
+    Question.objects.bulk_create(
+        Question(
+            question=text,
+            schedule_id=schedule_id if schedule_id in existing else None,
+            guest_id=guest_ids.get(telegram_id),
+        )
+        for telegram_id, schedule_id, text in questions
+    )
+
+
 def get_speaker_questions(event, speaker):
-    speeches = Schedule.objects.filter(event=event, speaker=speaker)
+    speeches = Schedule.objects.filter(event=event, speaker=speaker).order_by('start_at').prefetch_related('questions')
     
     formatted_questions = '\n'
     
@@ -186,10 +290,100 @@ def get_speaker_questions(event, speaker):
             
 
 def save_payment(amount, event, guest):
-    Donation.objects.create(amount=amount, event=event, guest=guest)
-    
+    """Сохраняет донат и в той же транзакции обновляет итоги мероприятия"""
+    with transaction.atomic():
+        donation = Donation.objects.create(amount=amount, event=event, guest=guest)
+        if event:
+            add_to_totals(DonationTotals, amount, event=event)
+            add_to_totals(DonationDayTotals, amount, event=event, day=timezone.localdate(donation.created_at))
+
+
+def add_to_totals(model, amount, **keys):
+    updated = model.objects.filter(**keys).update(count=F('count') + 1, amount=F('amount') + amount)
+    if not updated:
+        model.objects.create(count=1, amount=amount, **keys)
 
-def report_donations(event_id) -> dict():
 
-    return Event.objects.filter(id=event_id).aggregate(count=Count('donations'), summa=Sum('donations__amount'))
-    
\ No newline at end of file
+def report_donations(event_id) -> dict():
+    totals = DonationTotals.objects.filter(event_id=event_id).values('count', 'amount').first()
+    if not totals:
+        return {'count': 0, 'summa': 0}
+    return {'count': totals['count'], 'summa': totals['amount']}
+
+
+def rebuild_donation_totals(event_ids=None) -> int:
+    """Пересчитывает итоги по таблице донатов, например после правок в админке.
+
+    Возвращает число мероприятий с донатами.
+    """
+    donations = Donation.objects.filter(event__isnull=False).order_by()
+    totals = DonationTotals.objects.all()
+    days = DonationDayTotals.objects.all()
+    if event_ids is not None:
+        donations = donations.filter(event_id__in=event_ids)
+        totals = totals.filter(event_id__in=event_ids)
+        days = days.filter(event_id__in=event_ids)
+
+    with transaction.atomic():
+        totals.delete()
+        days.delete()
+        created = DonationTotals.objects.bulk_create(
+            DonationTotals(**row)
+            for row in donations.values('event_id').annotate(count=Count('id'), amount=Sum('amount'))
+        )
+        DonationDayTotals.objects.bulk_create(
+            DonationDayTotals(**row)
+            for row in donations.annotate(day=TruncDate('created_at')).values('event_id', 'day').annotate(
+                count=Count('id'),
+                amount=Sum('amount'),
+            )
+        )
+    return len(created)
+
+
+# Асинхронные версии операций для бота на AsyncTeleBot.
+# ORM вызывается в отдельном ограниченном пуле потоков, чтобы медленная
+# запись в SQLite не блокировала обработку остальных апдейтов.
+db_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'DB_THREAD_POOL_SIZE', 8),
+    thread_name_prefix='meetup-db',
+)
+
+
+def to_async(func):
+    return sync_to_async(func, thread_sensitive=False, executor=db_executor)
+
+
+aget_all_events = to_async(get_all_events)
+aget_event = to_async(get_event)
+adelete_event = to_async(delete_event)
+acreate_new_event = to_async(create_new_event)
+aupdate_event = to_async(update_event)
+aget_event_schedules = to_async(get_event_schedules)
+aget_event_speakers_ids = to_async(get_event_speakers_ids)
+aget_event_guests_ids = to_async(get_event_guests_ids)
+aget_active_event_schedule = to_async(get_active_event_schedule)
+aset_active_schedule = to_async(set_active_schedule)
+aget_speech = to_async(get_speech)
+acreate_speech = to_async(create_speech)
+adelete_speech = to_async(delete_speech)
+aupdate_speech = to_async(update_speech)
+aupdate_speech_speaker = to_async(update_speech_speaker)
+aadd_guest_to_event = to_async(add_guest_to_event)
+aadd_guests_to_events = to_async(add_guests_to_events)
+aset_subscription = to_async(set_subscription)
+ais_subscribed = to_async(is_subscribed)
+aget_subscribers_ids = to_async(get_subscribers_ids)
+acreate_guest = to_async(create_guest)
+aset_active_event = to_async(set_active_event)
+aget_active_event = to_async(get_active_event)
+aget_contacts = to_async(get_contacts)
+aget_guest = to_async(get_guest)
+aget_active_schedule = to_async(get_active_schedule)
+acreate_question = to_async(create_question)
+acreate_questions = to_async(create_questions)
+aget_speaker_questions = to_async(get_speaker_questions)
+asave_payment = to_async(save_payment)
+areport_donations = to_async(report_donations)
+aget_schedule_text = to_async(get_schedule_text)
+aget_speech_keyboard = to_async(get_speech_keyboard)
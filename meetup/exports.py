@@ -0,0 +1,118 @@
+import csv
+import io
+from typing import NamedTuple
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Donation, EventGuests, Guest, Question
+
+
+CHUNK_SIZE = 2000
+FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+}
+
+
+class Export(NamedTuple):
+    queryset: object
+    # Пары (заголовок столбца, поле для values_list)
+    columns: tuple
+    # Поле мероприятия для фильтра --event или None
+    event_field: str = None
+
+
+EXPORTS = {
+    'guests': Export(
+        Guest.objects.order_by('id'),
+        (
+            ('id', 'id'),
+            ('telegram_id', 'telegram_id'),
+            ('name', 'name'),
+            ('phone', 'phone'),
+            ('kind_activity', 'kind_activity'),
+            ('projects', 'projects'),
+            ('open_for_contact', 'open_for_contact'),
+        ),
+    ),
+    'attendance': Export(
+        EventGuests.objects.order_by('event_id', 'id'),
+        (
+            ('event_id', 'event_id'),
+            ('event_date', 'event__date'),
+            ('event_topic', 'event__topic'),
+            ('telegram_id', 'guest__telegram_id'),
+            ('name', 'guest__name'),
+            ('subscribed', 'subscribed'),
+        ),
+        'event_id',
+    ),
+    'questions': Export(
+        Question.objects.order_by('schedule__event_id', 'schedule__start_at', 'schedule_id', 'id'),
+        (
+            ('event_id', 'schedule__event_id'),
+            ('talk_id', 'schedule_id'),
+            ('talk_start', 'schedule__start_at'),
+            ('talk_topic', 'schedule__topic'),
+            ('speaker', 'schedule__speaker__name'),
+            ('question', 'question'),
+            ('telegram_id', 'guest__telegram_id'),
+            ('name', 'guest__name'),
+        ),
+        'schedule__event_id',
+    ),
+    'donations': Export(
+        Donation.objects.order_by('id'),
+        (
+            ('id', 'id'),
+            ('event_id', 'event_id'),
+            ('created_at', 'created_at'),
+            ('amount', 'amount'),
+            ('telegram_id', 'guest__telegram_id'),
+            ('name', 'guest__name'),
+        ),
+        'event_id',
+    ),
+}
+
+
+def export_rows(name, event_id=None, chunk_size=CHUNK_SIZE):
+    """Строки выгрузки одним запросом, который читается из базы частями"""
+    export = EXPORTS[name]
+    queryset = export.queryset
+    if event_id is not None and export.event_field:
+        queryset = queryset.filter(**{export.event_field: event_id})
+    fields = [field for _, field in export.columns]
+    return queryset.values_list(*fields).iterator(chunk_size=chunk_size)
+
+
+def stream_export(name, export_format='csv', event_id=None, chunk_size=CHUNK_SIZE):
+    """Выгрузка в CSV или NDJSON кусками текста по `chunk_size` строк.
+
+    В памяти одновременно находится не больше одного куска, поэтому
+    выгрузка любого размера начинает отдаваться сразу.
+    """
+    header = [column for column, _ in EXPORTS[name].columns]
+    buffer = io.StringIO()
+    if export_format == 'csv':
+        writer = csv.writer(buffer)
+        write = writer.writerow
+        writer.writerow(header)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    else:
+        encoder = DjangoJSONEncoder(ensure_ascii=False)
+
+        def write(row):
+            buffer.write(encoder.encode(dict(zip(header, row))))
+            buffer.write('\n')
+
+    for number, row in enumerate(export_rows(name, event_id, chunk_size), 1):
+        write(row)
+        if number % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -0,0 +1,144 @@
+import asyncio
+import itertools
+import random
+import time
+from collections import Counter, defaultdict, deque
+from urllib.parse import parse_qsl
+
+from aiohttp import web
+
+
+# Методы, ответ на которые считается ответом бота пользователю
+REPLY_METHODS = {'sendMessage', 'editMessageText', 'sendInvoice'}
+THROTTLED_METHODS = REPLY_METHODS | {'deleteMessage', 'answerCallbackQuery'}
+
+
+class FakeTelegram:
+    """Локальная замена Bot API для нагрузочного тестирования бота.
+
+    Реализует методы, которыми пользуется бот, с задержкой ответа
+    `latency` ± `jitter` секунд. С вероятностью `error_rate` вместо
+    ответа возвращает 429 Too Many Requests. Обновления для бота
+    добавляются через `push_message` и `push_callback`, ответы бота
+    каждому чату складываются в очередь `replies[chat_id]`.
+    """
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, retry_after=1, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.updates = deque()
+        self.calls = Counter()
+        self.throttled = 0
+        self.replies = defaultdict(asyncio.Queue)
+        self.url = None
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._new_updates = asyncio.Event()
+        self._runner = None
+
+    async def start(self, host='127.0.0.1', port=0):
+        app = web.Application()
+        app.router.add_route('*', '/bot{token}/{method}', self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        host, port = self._runner.addresses[0][:2]
+        self.url = f'http://{host}:{port}'
+        return self.url
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    async def handle(self, request):
+        method = request.match_info['method']
+        params = dict(request.query)
+        # telebot передает параметры в теле запроса даже для GET
+        if request.content_type == 'application/x-www-form-urlencoded':
+            params.update(parse_qsl(await request.text()))
+        elif request.method == 'POST':
+            params.update(await request.post())
+        self.calls[method] += 1
+
+        if method == 'getUpdates':
+            return self.ok(await self.get_updates(params))
+
+        if self.latency or self.jitter:
+            await asyncio.sleep(max(self.latency + self.rng.uniform(-self.jitter, self.jitter), 0))
+        if method in THROTTLED_METHODS and self.rng.random() < self.error_rate:
+            self.throttled += 1
+            return web.json_response({
+                'ok': False,
+                'error_code': 429,
+                'description': f'Too Many Requests: retry after {self.retry_after}',
+                'parameters': {'retry_after': self.retry_after},
+            })
+
+        if method == 'getMe':
+            return self.ok({'id': 1, 'is_bot': True, 'first_name': 'Meetup', 'username': 'meetup_bot'})
+        if method in REPLY_METHODS:
+            return self.ok(self.reply(method, params))
+        return self.ok(True)
+
+    def ok(self, result):
+        return web.json_response({'ok': True, 'result': result})
+
+    def reply(self, method, params):
+        chat_id = int(params['chat_id'])
+        self.replies[chat_id].put_nowait((method, params.get('text', ''), time.perf_counter()))
+        return {
+            'message_id': int(params.get('message_id') or next(self._message_ids)),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'text': params.get('text', ''),
+        }
+
+    async def get_updates(self, params):
+        offset = int(params.get('offset') or 0)
+        limit = int(params.get('limit') or 100)
+        while self.updates and self.updates[0]['update_id'] < offset:
+            self.updates.popleft()
+        if not self.updates:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), float(params.get('timeout') or 0))
+            except asyncio.TimeoutError:
+                pass
+        return list(itertools.islice(self.updates, limit))
+
+    def push(self, update):
+        update['update_id'] = next(self._update_ids)
+        self.updates.append(update)
+        self._new_updates.set()
+        return time.perf_counter()
+
+    def push_message(self, chat_id, text):
+        message = {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': f'Гость {chat_id}'},
+            'text': text,
+        }
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return self.push({'message': message})
+
+    def push_callback(self, chat_id, data):
+        return self.push({
+            'callback_query': {
+                'id': str(next(self._message_ids)),
+                'chat_instance': str(chat_id),
+                'data': data,
+                'from': {'id': chat_id, 'is_bot': False, 'first_name': f'Гость {chat_id}'},
+                'message': {
+                    'message_id': next(self._message_ids),
+                    'date': int(time.time()),
+                    'chat': {'id': chat_id, 'type': 'private'},
+                    'text': '',
+                },
+            },
+        })
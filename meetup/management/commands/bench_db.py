@@ -0,0 +1,189 @@
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import tempfile
+import time as timer
+from datetime import date, datetime
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+import meetup.db_operations as db
+from meetup.cache import active_event_cache, active_schedule_cache
+from meetup.models import Event, EventGuests, Guest, Schedule
+from meetup.rendering import invalidate_event_views
+from meetup.seeding import seed_dataset
+
+
+# Сколько мероприятий в среднем посещает каждый гость
+ATTENDED_EVENTS = 3
+
+DATASETS = {
+    'small': {'guests': 1000, 'events': 5, 'questions_per_talk': 5},
+    'medium': {'guests': 50000, 'events': 50, 'questions_per_talk': 20},
+    'large': {'guests': 500000, 'events': 200, 'questions_per_talk': 50},
+}
+
+
+def cold(func):
+    """Операция без кэшей процесса — замеряем работу с базой"""
+    def wrapper(*args):
+        active_event_cache.invalidate()
+        active_schedule_cache.invalidate()
+        invalidate_event_views()
+        return func(*args)
+    return wrapper
+
+
+def rolled_back(func):
+    """Запись, которая откатывается, чтобы не менять набор данных между повторами"""
+    def wrapper(*args):
+        with transaction.atomic():
+            func(*args)
+            transaction.set_rollback(True)
+    return wrapper
+
+
+def build_operations(context):
+    event = context['event']
+    speaker = context['speaker']
+    telegram_id = context['telegram_id']
+    speech_ids = context['speech_ids']
+    new_telegram_ids = range(10 ** 9, 10 ** 9 + 100)
+    return {
+        'get_all_events': lambda: db.get_all_events(),
+        'get_event': lambda: db.get_event(event.id),
+        'get_event_schedules': lambda: db.get_event_schedules(event.id),
+        'get_event_speakers_ids': lambda: db.get_event_speakers_ids(event.id),
+        'get_event_guests_ids': lambda: db.get_event_guests_ids(event.id),
+        'get_active_event': cold(db.get_active_event),
+        'get_active_schedule': cold(db.get_active_schedule),
+        'get_contacts': cold(lambda: db.get_contacts(telegram_id, limit=5)),
+        'get_guest': lambda: db.get_guest(telegram_id),
+        'get_speaker_questions': lambda: db.get_speaker_questions(event, speaker),
+        'report_donations': lambda: db.report_donations(event.id),
+        'get_schedule_text': cold(lambda: db.get_schedule_text(event.id)),
+        'get_speech_keyboard': cold(lambda: db.get_speech_keyboard(event.id, control=True)),
+        'create_new_event': rolled_back(lambda: db.create_new_event('Новое мероприятие', date.today())),
+        'set_active_schedule': rolled_back(lambda: db.set_active_schedule(event.id, speech_ids[-1])),
+        'update_speech': rolled_back(lambda: db.update_speech(speech_ids[0], {'topic': 'Новая тема'})),
+        'add_guests_to_events': rolled_back(
+            lambda: db.add_guests_to_events([(telegram_id, event.id) for telegram_id in new_telegram_ids])
+        ),
+        'create_questions': rolled_back(
+            lambda: db.create_questions([(telegram_id, speech_ids[0], 'Вопрос')] * 100)
+        ),
+        'save_payment': rolled_back(lambda: db.save_payment(500, event, speaker)),
+    }
+
+
+def measure(operation, repeat):
+    operation()
+    timings = []
+    with CaptureQueriesContext(connection) as queries:
+        for _ in range(repeat):
+            started = timer.perf_counter()
+            operation()
+            timings.append((timer.perf_counter() - started) * 1000)
+    return {
+        'median_ms': round(statistics.median(timings), 3),
+        'min_ms': round(min(timings), 3),
+        'max_ms': round(max(timings), 3),
+        'queries': len(queries) // repeat,
+    }
+
+
+class Command(BaseCommand):
+    help = 'Замеры операций meetup.db_operations на наборах данных разного размера'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--datasets', nargs='+', choices=DATASETS, default=['small', 'medium'])
+        parser.add_argument('--operations', nargs='+', help='только эти операции')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--output', help='файл для отчета в JSON')
+        parser.add_argument('--compare', help='прошлый отчет в JSON для сравнения')
+
+    def handle(self, *args, **options):
+        report = {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'sqlite': sqlite3.sqlite_version,
+            },
+            'repeat': options['repeat'],
+            'datasets': {},
+        }
+        for name in options['datasets']:
+            report['datasets'][name] = self.bench_dataset(name, options)
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, ensure_ascii=False, indent=2, sort_keys=True)
+            self.stdout.write(f'Отчет сохранен в {options["output"]}')
+        if options['compare']:
+            with open(options['compare']) as previous:
+                self.compare(json.load(previous), report)
+
+    def bench_dataset(self, name, options):
+        sizes = DATASETS[name]
+        test_name = os.path.join(tempfile.mkdtemp(), f'bench_db_{name}.sqlite3')
+        connection.settings_dict['TEST']['NAME'] = test_name
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.stdout.write(self.style.MIGRATE_HEADING(f'{name}: заполнение базы {sizes}'))
+            started = timer.perf_counter()
+            rows = seed_dataset(
+                guests=sizes['guests'],
+                events=sizes['events'],
+                attendance=min(ATTENDED_EVENTS / sizes['events'], 1),
+                questions_per_talk=sizes['questions_per_talk'],
+                donations=0.1,
+            )
+            seed_seconds = timer.perf_counter() - started
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+            operations = build_operations(self.get_context())
+            if options['operations']:
+                unknown = set(options['operations']) - set(operations)
+                if unknown:
+                    raise CommandError(f'Неизвестные операции: {", ".join(sorted(unknown))}')
+                operations = {key: operations[key] for key in options['operations']}
+
+            results = {}
+            for operation_name, operation in operations.items():
+                results[operation_name] = measure(operation, options['repeat'])
+                result = results[operation_name]
+                self.stdout.write(
+                    f'  {operation_name:<24} {result["median_ms"]:>10.3f} мс {result["queries"]:>4} запросов'
+                )
+            return {'rows': rows, 'seed_seconds': round(seed_seconds, 2), 'operations': results}
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def get_context(self):
+        event = Event.objects.get(active=True)
+        speaker = Guest.objects.filter(schedules__event=event).first()
+        telegram_id = EventGuests.objects.filter(event=event).values_list('guest__telegram_id', flat=True).first()
+        speech_ids = list(Schedule.objects.filter(event=event).order_by('start_at').values_list('id', flat=True))
+        return {'event': event, 'speaker': speaker, 'telegram_id': telegram_id, 'speech_ids': speech_ids}
+
+    def compare(self, previous, current):
+        self.stdout.write(self.style.MIGRATE_HEADING('Сравнение с прошлым отчетом (медиана)'))
+        for name, dataset in current['datasets'].items():
+            old_operations = previous.get('datasets', {}).get(name, {}).get('operations', {})
+            for operation_name, result in dataset['operations'].items():
+                old = old_operations.get(operation_name)
+                if not old:
+                    continue
+                ratio = result['median_ms'] / old['median_ms'] if old['median_ms'] else 0
+                queries = '' if old['queries'] == result['queries'] else f' запросов {old["queries"]} -> {result["queries"]}'
+                self.stdout.write(
+                    f'  {name}/{operation_name:<24} {old["median_ms"]:>10.3f} -> {result["median_ms"]:>10.3f} мс '
+                    f'(x{ratio:.2f}){queries}'
+                )
@@ -0,0 +1,94 @@
+import asyncio
+import os
+import statistics
+import tempfile
+import time as timer
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+import meetup.db_operations as db
+from meetup.batching import BatchWriter
+from meetup.models import Guest, Question, Schedule
+from meetup.seeding import seed_dataset
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(int(len(values) * share), len(values) - 1)] if values else 0.0
+
+
+async def ask_questions(count, rate, handle):
+    """Имитирует поток вопросов: `count` сообщений с частотой `rate` в секунду"""
+    acks = []
+
+    async def ask(number):
+        await asyncio.sleep(number / rate)
+        started = timer.perf_counter()
+        await handle(number)
+        acks.append(timer.perf_counter() - started)
+
+    await asyncio.gather(*[ask(number) for number in range(count)])
+    return acks
+
+
+class Command(BaseCommand):
+    help = 'Пропускная способность и задержка приема вопросов: по одному против пакетной записи'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--questions', type=int, default=2000)
+        parser.add_argument('--rate', type=int, default=500, help='вопросов в секунду')
+        parser.add_argument('--interval', type=float, default=0.1, help='период записи пачки, с')
+        parser.add_argument('--batch', type=int, default=100, help='максимальный размер пачки')
+
+    def handle(self, *args, **options):
+        # Файловая база, чтобы потоки пула работали с ней как в боевом режиме
+        test_name = os.path.join(tempfile.mkdtemp(), 'bench_questions.sqlite3')
+        connection.settings_dict['TEST']['NAME'] = test_name
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            seed_dataset(guests=1000, events=1)
+            telegram_ids = list(Guest.objects.values_list('telegram_id', flat=True))
+            schedule = Schedule.objects.first()
+            connection.close()
+            for name, bench in (('по одному', self.bench_single), ('пачками', self.bench_batched)):
+                Question.objects.all().delete()
+                connection.close()
+                self.report(name, *asyncio.run(bench(telegram_ids, schedule, options)))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    async def bench_single(self, telegram_ids, schedule, options):
+        async def handle(number):
+            telegram_id = telegram_ids[number % len(telegram_ids)]
+            guest = await db.aget_guest(telegram_id)
+            await db.acreate_question(f'Вопрос {number}', schedule, guest)
+
+        started = timer.perf_counter()
+        acks = await ask_questions(options['questions'], options['rate'], handle)
+        elapsed = timer.perf_counter() - started
+        return acks, statistics.mean(acks), max(acks), elapsed
+
+    async def bench_batched(self, telegram_ids, schedule, options):
+        writer = BatchWriter(db.acreate_questions, interval=options['interval'], max_size=options['batch'])
+        writer.start()
+
+        async def handle(number):
+            writer.add((telegram_ids[number % len(telegram_ids)], schedule.id, f'Вопрос {number}'))
+
+        started = timer.perf_counter()
+        acks = await ask_questions(options['questions'], options['rate'], handle)
+        await writer.stop()
+        elapsed = timer.perf_counter() - started
+        stats = writer.stats()
+        return acks, stats['avg_latency_ms'] / 1000, stats['max_latency_ms'] / 1000, elapsed
+
+    def report(self, name, acks, saved_avg, saved_max, elapsed):
+        stored = Question.objects.count()
+        self.stdout.write(self.style.MIGRATE_HEADING(name))
+        self.stdout.write(f'  сохранено {stored} вопросов за {elapsed:.2f} с ({stored / elapsed:.0f} в секунду)')
+        self.stdout.write(
+            f'  ответ гостю: среднее {statistics.mean(acks) * 1000:.2f} мс, '
+            f'p95 {percentile(acks, 0.95) * 1000:.2f} мс'
+        )
+        self.stdout.write(f'  до записи в базу: среднее {saved_avg * 1000:.2f} мс, максимум {saved_max * 1000:.2f} мс')
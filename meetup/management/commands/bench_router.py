@@ -0,0 +1,61 @@
+import random
+import timeit
+
+from django.core.management.base import BaseCommand
+
+from meetup.router import CallbackRouter, make_callback_data
+
+
+def build_router(size):
+    router = CallbackRouter()
+    for number in range(size):
+        router.route(f'handler{number}', int, int)(lambda call, *args: None)
+    return router
+
+
+def build_startswith_chain(size):
+    """Прежняя схема: предикаты startswith проверяются по порядку"""
+    chain = []
+    for number in range(size):
+        prefix = f'handler{number}_'
+        chain.append((lambda data, prefix=prefix: data.startswith(prefix), lambda call: None))
+    return chain
+
+
+def resolve_startswith(chain, data):
+    for predicate, handler in chain:
+        if predicate(data):
+            return handler
+
+
+def nanoseconds_per_call(resolve, samples, total_calls):
+    rounds = max(total_calls // len(samples), 1)
+    elapsed = timeit.timeit(lambda: [resolve(data) for data in samples], number=rounds)
+    return elapsed * 1e9 / (rounds * len(samples))
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает стоимость выбора обработчика callback: словарь против цепочки startswith'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[10, 40, 100, 1000, 10000])
+        parser.add_argument('--calls', type=int, default=100000)
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'{"обработчиков":>12} {"router, нс":>12} {"startswith, нс":>15}')
+        for size in options['sizes']:
+            router = build_router(size)
+            chain = build_startswith_chain(size)
+            rng = random.Random(size)
+            numbers = [rng.randrange(size) for _ in range(1000)]
+            router_samples = [make_callback_data(f'handler{number}', 1, 2) for number in numbers]
+            chain_samples = [f'handler{number}_1_2' for number in numbers]
+
+            router_ns = nanoseconds_per_call(router.resolve, router_samples, options['calls'])
+            # Цепочка на больших размерах медленная, поэтому вызовов меньше
+            chain_ns = nanoseconds_per_call(
+                lambda data: resolve_startswith(chain, data),
+                chain_samples,
+                options['calls'] // max(size // 10, 1),
+            )
+            self.stdout.write(f'{size:>12} {router_ns:>12.0f} {chain_ns:>15.0f}')
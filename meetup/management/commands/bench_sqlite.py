@@ -0,0 +1,115 @@
+import os
+import tempfile
+import threading
+import time as timer
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection, transaction
+from django.test.utils import override_settings
+
+from meetup.models import EventGuests, Guest, Question, Schedule
+from meetup.seeding import seed_dataset
+
+
+# Стандартные настройки SQLite и Django: журнал отката, полная
+# синхронизация и ожидание блокировки 5 секунд
+DEFAULT_PROFILE = ({'journal_mode': 'delete', 'synchronous': 'full'}, 5)
+
+
+def bot_write(number, schedule_id, guest_ids):
+    """Короткая запись, как при вопросе спикеру или отметке на мероприятии"""
+    with transaction.atomic():
+        Question.objects.create(
+            question=f'Вопрос {number}',
+            schedule_id=schedule_id,
+            guest_id=guest_ids[number % len(guest_ids)],
+        )
+
+
+def admin_read(number, schedule_id, guest_ids):
+    """Чтение, как при открытии списков в админке"""
+    list(Guest.objects.order_by('-id')[:100])
+    Guest.objects.count()
+    EventGuests.objects.filter(guest_id=guest_ids[number % len(guest_ids)]).count()
+
+
+class Command(BaseCommand):
+    help = 'Конкурентные записи бота и чтения админки со стандартными и боевыми настройками SQLite'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--readers', type=int, default=4)
+        parser.add_argument('--seconds', type=float, default=5)
+        parser.add_argument('--guests', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        test_name = os.path.join(tempfile.mkdtemp(), 'bench_sqlite.sqlite3')
+        connection.settings_dict['TEST']['NAME'] = test_name
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        old_timeout = connection.settings_dict['OPTIONS'].get('timeout')
+        try:
+            seed_dataset(guests=options['guests'], events=5)
+            schedule_id = Schedule.objects.values_list('id', flat=True).first()
+            guest_ids = list(Guest.objects.values_list('id', flat=True))
+            profiles = (
+                ('стандартный', DEFAULT_PROFILE),
+                ('боевой', (settings.SQLITE_PRAGMAS, old_timeout or 5)),
+            )
+            results = {}
+            for name, (pragmas, timeout) in profiles:
+                connection.close()
+                connection.settings_dict['OPTIONS']['timeout'] = timeout
+                with override_settings(SQLITE_PRAGMAS=pragmas):
+                    results[name] = self.run_profile(schedule_id, guest_ids, options)
+                connection.close()
+            self.report(results, options['seconds'])
+        finally:
+            connection.settings_dict['OPTIONS']['timeout'] = old_timeout
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def run_profile(self, schedule_id, guest_ids, options):
+        counters = {'writes': 0, 'reads': 0, 'locked': 0}
+        lock = threading.Lock()
+        deadline = timer.monotonic() + options['seconds']
+
+        def worker(operation, counter):
+            number = 0
+            try:
+                while timer.monotonic() < deadline:
+                    number += 1
+                    try:
+                        operation(number, schedule_id, guest_ids)
+                    except OperationalError:
+                        with lock:
+                            counters['locked'] += 1
+                        continue
+                    with lock:
+                        counters[counter] += 1
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=worker, args=(bot_write, 'writes'))
+            for _ in range(options['writers'])
+        ] + [
+            threading.Thread(target=worker, args=(admin_read, 'reads'))
+            for _ in range(options['readers'])
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return counters
+
+    def report(self, results, seconds):
+        self.stdout.write(f'{"профиль":>12} {"записей/с":>10} {"чтений/с":>10} {"блокировок":>11}')
+        for name, counters in results.items():
+            self.stdout.write(
+                f'{name:>12} {counters["writes"] / seconds:>10.0f} '
+                f'{counters["reads"] / seconds:>10.0f} {counters["locked"]:>11}'
+            )
+        base, tuned = results.values()
+        for counter, label in (('writes', 'записи'), ('reads', 'чтения')):
+            if base[counter]:
+                self.stdout.write(f'Прирост {label}: x{tuned[counter] / base[counter]:.1f}')
@@ -0,0 +1,89 @@
+import time as timer
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from meetup.models import Event, EventGuests, Guest, Schedule
+from meetup.seeding import seed_dataset
+
+
+INDEXED_MODELS = [Event, Guest, Schedule]
+
+
+def hot_queries():
+    event = Event.objects.filter(active=True).first()
+    guest = EventGuests.objects.filter(event=event).values_list('guest__telegram_id', flat=True).first()
+    return [
+        ('Активное мероприятие', Event.objects.filter(date__gte=datetime.today(), active=True)[:1]),
+        ('Активный доклад мероприятия', Schedule.objects.filter(event_id=event.id, active=True)[:1]),
+        ('Расписание мероприятия', Schedule.objects.filter(event_id=event.id).order_by('start_at')),
+        (
+            'Контакты на мероприятии',
+            Guest.objects.filter(open_for_contact=True, event=event).exclude(telegram_id=guest)[:5],
+        ),
+        ('Гости мероприятия', EventGuests.objects.filter(event_id=event.id).values_list('guest__telegram_id')),
+        (
+            'Отметка гостя на мероприятии',
+            EventGuests.objects.filter(event_id=event.id, guest__telegram_id=guest),
+        ),
+    ]
+
+
+def explain(queryset):
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def measure(queryset, repeat):
+    started = timer.perf_counter()
+    for _ in range(repeat):
+        list(queryset.all())
+    return (timer.perf_counter() - started) * 1000 / repeat
+
+
+class Command(BaseCommand):
+    help = 'Планы запросов бота до и после индексов на временной базе с синтетическими данными'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--guests', type=int, default=100000)
+        parser.add_argument('--events', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.stdout.write(f'Заполнение базы: {options["guests"]} гостей, {options["events"]} мероприятий...')
+            seed_dataset(guests=options['guests'], events=options['events'])
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+            self.report(options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def report(self, repeat):
+        results = {}
+        for phase, drop_indexes in (('до', True), ('после', False)):
+            with transaction.atomic():
+                if drop_indexes:
+                    self.drop_indexes()
+                for name, queryset in hot_queries():
+                    results.setdefault(name, {})[phase] = (explain(queryset), measure(queryset, repeat))
+                transaction.set_rollback(True)
+
+        for name, phases in results.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            for phase, (plan, elapsed) in phases.items():
+                self.stdout.write(f'  {phase}: {elapsed:.3f} мс')
+                for line in plan:
+                    self.stdout.write(f'    {line}')
+
+    def drop_indexes(self):
+        # Уникальное ограничение гостей мероприятия SQLite хранит в самой
+        # таблице, удалить его можно только пересозданием таблицы
+        with connection.cursor() as cursor:
+            for model in INDEXED_MODELS:
+                for index in model._meta.indexes:
+                    cursor.execute(f'DROP INDEX "{index.name}"')
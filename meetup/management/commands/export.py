@@ -0,0 +1,31 @@
+import os
+import time as timer
+
+from django.core.management.base import BaseCommand
+
+from meetup.exports import CHUNK_SIZE, EXPORTS, FORMATS, stream_export
+
+
+class Command(BaseCommand):
+    help = 'Выгрузка гостей, посещений, вопросов или донатов в CSV или NDJSON'
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', choices=EXPORTS)
+        parser.add_argument('--format', choices=FORMATS, default='csv')
+        parser.add_argument('--event', type=int, help='только это мероприятие')
+        parser.add_argument('--output', help='файл, по умолчанию вывод в консоль')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        started = timer.perf_counter()
+        chunks = stream_export(options['name'], options['format'], options['event'], options['chunk_size'])
+        if not options['output']:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending='')
+            return
+
+        with open(options['output'], 'w', encoding='utf-8', newline='') as output:
+            for chunk in chunks:
+                output.write(chunk)
+        size = os.path.getsize(options['output']) / 1024 / 1024
+        self.stderr.write(f'{options["output"]}: {size:.1f} Мб за {timer.perf_counter() - started:.1f} с')
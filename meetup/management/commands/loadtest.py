@@ -0,0 +1,193 @@
+import asyncio
+import os
+import statistics
+import tempfile
+import threading
+import time as timer
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from meetup.fake_telegram import REPLY_METHODS, FakeTelegram
+from meetup.querylog import query_log
+from meetup.seeding import seed_dataset
+
+
+FIRST_CHAT_ID = 10 ** 9
+
+# Путь гостя по боту: тип обновления, данные и название шага для отчета
+SCENARIO = [
+    ('message', '/start', 'start'),
+    ('callback', 'register', 'register'),
+    ('message', 'Иван Иванов', 'register'),
+    ('message', '+79990000000', 'register'),
+    ('message', 'Разработчик', 'register'),
+    ('message', 'Бот для митапов', 'register'),
+    ('callback', 'create_guest:yes', 'register'),
+    ('callback', 'db_create_guest', 'register'),
+    ('callback', 'schedule', 'schedule'),
+    ('callback', 'question', 'question'),
+    ('message', 'Как масштабировать бота?', 'question'),
+]
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(int(len(values) * share), len(values) - 1)] if values else 0.0
+
+
+class LoadGenerator:
+    """Гости, которые проходят SCENARIO и ждут ответа бота на каждом шаге"""
+
+    def __init__(self, telegram, guests, concurrency, think_time, reply_timeout):
+        self.telegram = telegram
+        self.guests = guests
+        self.concurrency = concurrency
+        self.think_time = think_time
+        self.reply_timeout = reply_timeout
+        self.latencies = defaultdict(list)
+        self.lost = defaultdict(int)
+        self.updates = 0
+
+    async def run(self):
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def guest(number):
+            async with semaphore:
+                await self.walk(FIRST_CHAT_ID + number)
+
+        started = timer.perf_counter()
+        await asyncio.gather(*[guest(number) for number in range(self.guests)])
+        return timer.perf_counter() - started
+
+    async def walk(self, chat_id):
+        replies = self.telegram.replies[chat_id]
+        for kind, data, step in SCENARIO:
+            while not replies.empty():
+                replies.get_nowait()
+            if kind == 'message':
+                sent_at = self.telegram.push_message(chat_id, data)
+            else:
+                sent_at = self.telegram.push_callback(chat_id, data)
+            self.updates += 1
+            if not await self.wait_reply(replies, step, sent_at):
+                return
+            if self.think_time:
+                await asyncio.sleep(self.think_time)
+
+    async def wait_reply(self, replies, step, sent_at):
+        deadline = timer.perf_counter() + self.reply_timeout
+        while True:
+            try:
+                method, _, replied_at = await asyncio.wait_for(replies.get(), deadline - timer.perf_counter())
+            except (asyncio.TimeoutError, ValueError):
+                self.lost[step] += 1
+                return False
+            if method in REPLY_METHODS:
+                self.latencies[step].append(replied_at - sent_at)
+                return True
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный тест бота на локальной замене Telegram Bot API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--guests', type=int, default=1000)
+        parser.add_argument('--concurrency', type=int, default=200, help='гостей одновременно')
+        parser.add_argument('--think-time', type=float, default=0.0, help='пауза гостя между шагами, с')
+        parser.add_argument('--latency', type=float, default=0.05, help='задержка ответа API, с')
+        parser.add_argument('--jitter', type=float, default=0.02)
+        parser.add_argument('--error-rate', type=float, default=0.0, help='доля ответов 429')
+        parser.add_argument('--reply-timeout', type=float, default=10.0)
+        parser.add_argument('--port', type=int, default=0)
+        parser.add_argument(
+            '--external',
+            action='store_true',
+            help='не запускать бота, а ждать его отдельно: TELEGRAM_API_URL=... python meetup_bot.py',
+        )
+
+    def handle(self, *args, **options):
+        telegram = FakeTelegram(options['latency'], options['jitter'], options['error_rate'])
+        generator = LoadGenerator(
+            telegram,
+            options['guests'],
+            options['concurrency'],
+            options['think_time'],
+            options['reply_timeout'],
+        )
+        # Замена API и гости работают в своем потоке, чтобы не делить
+        # цикл событий с ботом и не искажать замеры
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+        url = asyncio.run_coroutine_threadsafe(telegram.start(port=options['port']), loop).result()
+
+        try:
+            if options['external']:
+                self.stdout.write(f'Запустите бота: TELEGRAM_API_URL={url} python meetup_bot.py')
+                elapsed = asyncio.run_coroutine_threadsafe(generator.run(), loop).result()
+            else:
+                elapsed = self.run_with_bot(url, generator, loop)
+        finally:
+            asyncio.run_coroutine_threadsafe(telegram.stop(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+
+        self.report(generator, telegram, elapsed)
+
+    def run_with_bot(self, url, generator, loop):
+        test_name = os.path.join(tempfile.mkdtemp(), 'loadtest.sqlite3')
+        connection.settings_dict['TEST']['NAME'] = test_name
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            seed_dataset(guests=20, events=1)
+            connection.close()
+
+            os.environ['TELEGRAM_API_URL'] = url
+            os.environ.setdefault('BOT_TOKEN', '1:loadtest')
+            os.environ.setdefault('PAYMENTS_TOKEN', 'loadtest')
+            import meetup_bot
+
+            async def run():
+                await meetup_bot.start_workers()
+                polling = asyncio.create_task(meetup_bot.bot.infinity_polling(timeout=1))
+                try:
+                    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(generator.run(), loop))
+                finally:
+                    polling.cancel()
+                    await asyncio.gather(polling, return_exceptions=True)
+                    await meetup_bot.stop_workers()
+                    await meetup_bot.bot.close_session()
+
+            return asyncio.run(run())
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def report(self, generator, telegram, elapsed):
+        all_latencies = [latency for latencies in generator.latencies.values() for latency in latencies]
+        self.stdout.write(
+            f'Гостей: {generator.guests}, обновлений: {generator.updates} за {elapsed:.2f} с '
+            f'({generator.updates / elapsed:.0f} в секунду)'
+        )
+        self.stdout.write(f'Ответов 429 от API: {telegram.throttled}')
+        self.stdout.write(f'{"шаг":>10} {"ответов":>8} {"без ответа":>11} {"p50, мс":>9} {"p95, мс":>9} {"p99, мс":>9}')
+        rows = list(generator.latencies.items()) + [('всего', all_latencies)]
+        for step, latencies in rows:
+            lost = sum(generator.lost.values()) if step == 'всего' else generator.lost[step]
+            self.stdout.write(
+                f'{step:>10} {len(latencies):>8} {lost:>11} '
+                f'{percentile(latencies, 0.5) * 1000:>9.1f} '
+                f'{percentile(latencies, 0.95) * 1000:>9.1f} '
+                f'{percentile(latencies, 0.99) * 1000:>9.1f}'
+            )
+        if all_latencies:
+            self.stdout.write(f'Средняя задержка: {statistics.mean(all_latencies) * 1000:.1f} мс')
+        if settings.SQL_LOG:
+            self.stdout.write(f'Самые тяжелые запросы (медленных: {query_log.slow}):')
+            for item in query_log.top():
+                self.stdout.write(
+                    f'{item["seconds"] * 1000:>9.0f} мс {item["count"]:>7} шт. '
+                    f'{", ".join(item["callers"])}: {item["fingerprint"][:160]}'
+                )
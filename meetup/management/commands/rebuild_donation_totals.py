@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from meetup.db_operations import rebuild_donation_totals
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает итоги донатов по мероприятиям и дням по таблице донатов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', nargs='+', type=int, help='только эти мероприятия')
+
+    def handle(self, *args, **options):
+        events = rebuild_donation_totals(options['events'])
+        self.stdout.write(f'Итоги пересчитаны, мероприятий с донатами: {events}')
@@ -0,0 +1,46 @@
+import time as timer
+
+from django.core.management.base import BaseCommand
+
+from meetup.seeding import CHUNK_SIZE, seed_dataset
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу синтетическими гостями, друзьями, мероприятиями, докладами, '
+        'вопросами и донатами. Данные добавляются к существующим, последнее '
+        'созданное мероприятие становится активным.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--guests', type=int, default=10000)
+        parser.add_argument('--events', type=int, default=20)
+        parser.add_argument('--talks', type=int, default=7, help='докладов на мероприятии')
+        parser.add_argument('--attendance', type=float, default=0.3, help='доля гостей на каждом мероприятии')
+        parser.add_argument('--open-for-contact', type=float, default=0.3)
+        parser.add_argument('--friends', type=int, default=3, help='друзей у каждого гостя')
+        parser.add_argument('--questions', type=int, default=10, help='вопросов к каждому докладу')
+        parser.add_argument('--donations', type=float, default=0.1, help='доля гостей мероприятия с донатом')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        started = timer.perf_counter()
+        rows = seed_dataset(
+            guests=options['guests'],
+            events=options['events'],
+            talks_per_event=options['talks'],
+            attendance=options['attendance'],
+            open_for_contact=options['open_for_contact'],
+            questions_per_talk=options['questions'],
+            donations=options['donations'],
+            friends_per_guest=options['friends'],
+            seed=options['seed'],
+            chunk_size=options['chunk_size'],
+        )
+        elapsed = timer.perf_counter() - started
+
+        for name, count in rows.items():
+            self.stdout.write(f'{name:>12}: {count}')
+        total = sum(rows.values())
+        self.stdout.write(self.style.SUCCESS(f'Создано {total} строк за {elapsed:.1f} с ({total / elapsed:.0f} в секунду)'))
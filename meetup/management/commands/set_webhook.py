@@ -0,0 +1,45 @@
+import asyncio
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+
+class Command(BaseCommand):
+    help = 'Переключает бота на webhook по адресу сайта или обратно на опрос Telegram'
+
+    def add_arguments(self, parser):
+        parser.add_argument('base_url', nargs='?', help='адрес сайта, например https://meetup.example.com')
+        # Одно соединение: Telegram присылает обновления по одному и по
+        # порядку, и ChatScheduler сохраняет порядок сообщений каждого чата
+        parser.add_argument('--max-connections', type=int, default=1)
+        parser.add_argument('--delete', action='store_true', help='удалить webhook и вернуться к опросу')
+
+    def handle(self, *args, **options):
+        from meetup_bot import bot
+
+        if options['delete']:
+            asyncio.run(self.delete(bot))
+            self.stdout.write('Webhook удален, бот можно запускать через python meetup_bot.py')
+            return
+
+        if not options['base_url']:
+            raise CommandError('Укажите адрес сайта')
+        if not settings.WEBHOOK_SECRET:
+            raise CommandError('Задайте переменную окружения WEBHOOK_SECRET')
+
+        url = options['base_url'].rstrip('/') + reverse('telegram_webhook')
+        asyncio.run(self.set(bot, url, options['max_connections']))
+        self.stdout.write(f'Webhook установлен: {url}')
+
+    async def set(self, bot, url, max_connections):
+        try:
+            await bot.set_webhook(url, secret_token=settings.WEBHOOK_SECRET, max_connections=max_connections)
+        finally:
+            await bot.close_session()
+
+    async def delete(self, bot):
+        try:
+            await bot.delete_webhook()
+        finally:
+            await bot.close_session()
@@ -0,0 +1,275 @@
+import asyncio
+import functools
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from telebot import asyncio_helper
+
+
+logger = logging.getLogger(__name__)
+
+SAMPLE_RATE = getattr(settings, 'METRICS_SAMPLE_RATE', 1.0)
+LOG_INTERVAL = getattr(settings, 'METRICS_LOG_INTERVAL', 60)
+# Границы корзин гистограммы времени обработки, с
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LOG_TOP = 10
+NO_HANDLER = 'none'
+
+_current_sample = ContextVar('handler_sample', default=None)
+
+
+class Sample:
+    """Замер обработки одного обновления"""
+
+    __slots__ = ('handler', 'prefix', 'db', 'api')
+
+    def __init__(self):
+        self.handler = NO_HANDLER
+        self.prefix = ''
+        # Длительности запросов. Запросы к базе выполняются в потоках
+        # пула, поэтому только добавляем в список — это атомарно
+        self.db = []
+        self.api = []
+
+
+class HandlerStats:
+    __slots__ = ('count', 'seconds', 'max_seconds', 'buckets', 'db_queries', 'db_seconds', 'api_calls', 'api_seconds')
+
+    def __init__(self, buckets):
+        self.count = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.buckets = [0] * len(buckets)
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.api_calls = 0
+        self.api_seconds = 0.0
+
+    def add(self, seconds, sample, bounds):
+        self.count += 1
+        self.seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+        for number, bound in enumerate(bounds):
+            if seconds <= bound:
+                self.buckets[number] += 1
+                break
+        self.db_queries += len(sample.db)
+        self.db_seconds += sum(sample.db)
+        self.api_calls += len(sample.api)
+        self.api_seconds += sum(sample.api)
+
+
+class HandlerMetrics:
+    """Время обработки обновлений по обработчикам.
+
+    Для каждой пары (обработчик, префикс callback_data) считает время
+    обработки, число и время запросов к базе и к Bot API. Замеряется
+    доля `sample_rate` обновлений, остальные обрабатываются без
+    накладных расходов. Данные отдаются в текстовом формате Prometheus
+    (`render`) и раз в `log_interval` секунд пишутся в лог.
+
+    Через `register` можно добавить в вывод свои показатели, например
+    глубину очередей.
+    """
+
+    def __init__(self, sample_rate=SAMPLE_RATE, log_interval=LOG_INTERVAL, buckets=BUCKETS):
+        self.sample_rate = sample_rate
+        self.log_interval = log_interval
+        self.bounds = buckets
+        self.stats = {}
+        self.sampled = 0
+        self.skipped = 0
+        self.collectors = {}
+        self._window = {}
+        self._lock = threading.Lock()
+        self._task = None
+
+    @contextmanager
+    def measure(self):
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            self.skipped += 1
+            yield None
+            return
+        sample = Sample()
+        token = _current_sample.set(sample)
+        started = time.perf_counter()
+        try:
+            yield sample
+        finally:
+            seconds = time.perf_counter() - started
+            _current_sample.reset(token)
+            self.record(sample, seconds)
+
+    def record(self, sample, seconds):
+        key = (sample.handler, sample.prefix)
+        with self._lock:
+            self.sampled += 1
+            for stats in (self.stats, self._window):
+                if key not in stats:
+                    stats[key] = HandlerStats(self.bounds)
+                stats[key].add(seconds, sample, self.bounds)
+
+    def register(self, name, help_text, metric_type, collect):
+        """Добавляет показатель: `collect()` возвращает пары (метки, значение)"""
+        self.collectors[name] = (help_text, metric_type, collect)
+
+    def start(self):
+        if self.log_interval:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self.log_summary()
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.log_interval)
+            self.log_summary()
+
+    def log_summary(self):
+        """Пишет в лог самые долгие обработчики с прошлой сводки"""
+        with self._lock:
+            window, self._window = self._window, {}
+        if not window:
+            return
+        lines = []
+        top = sorted(window.items(), key=lambda item: item[1].seconds, reverse=True)[:LOG_TOP]
+        for (handler, prefix), stats in top:
+            lines.append(
+                f'{handler}[{prefix}]: {stats.count} шт., '
+                f'среднее {stats.seconds * 1000 / stats.count:.1f} мс, макс. {stats.max_seconds * 1000:.1f} мс, '
+                f'база {stats.db_queries / stats.count:.1f} запр./{stats.db_seconds * 1000 / stats.count:.1f} мс, '
+                f'API {stats.api_calls / stats.count:.1f} запр./{stats.api_seconds * 1000 / stats.count:.1f} мс'
+            )
+        logger.info('Обработчики за %s с:\n%s', self.log_interval, '\n'.join(lines))
+
+    def render(self):
+        """Показатели в текстовом формате Prometheus"""
+        with self._lock:
+            stats = [(key, _copy_stats(value)) for key, value in sorted(self.stats.items())]
+            sampled, skipped = self.sampled, self.skipped
+
+        lines = []
+        add_header(lines, 'meetup_handler_seconds', 'Время обработки обновления', 'histogram')
+        for (handler, prefix), value in stats:
+            labels = {'handler': handler, 'prefix': prefix}
+            cumulative = 0
+            for bound, count in zip(self.bounds, value.buckets):
+                cumulative += count
+                lines.append(sample_line('meetup_handler_seconds_bucket', {**labels, 'le': bound}, cumulative))
+            lines.append(sample_line('meetup_handler_seconds_bucket', {**labels, 'le': '+Inf'}, value.count))
+            lines.append(sample_line('meetup_handler_seconds_sum', labels, value.seconds))
+            lines.append(sample_line('meetup_handler_seconds_count', labels, value.count))
+
+        for name, help_text, field in (
+            ('meetup_handler_db_queries_total', 'Запросов к базе', 'db_queries'),
+            ('meetup_handler_db_seconds_total', 'Время запросов к базе', 'db_seconds'),
+            ('meetup_handler_api_calls_total', 'Запросов к Bot API', 'api_calls'),
+            ('meetup_handler_api_seconds_total', 'Время запросов к Bot API', 'api_seconds'),
+        ):
+            add_header(lines, name, help_text, 'counter')
+            for (handler, prefix), value in stats:
+                lines.append(sample_line(name, {'handler': handler, 'prefix': prefix}, getattr(value, field)))
+
+        add_header(lines, 'meetup_updates_sampled_total', 'Замеренных обновлений', 'counter')
+        lines.append(sample_line('meetup_updates_sampled_total', {}, sampled))
+        add_header(lines, 'meetup_updates_skipped_total', 'Обновлений без замера', 'counter')
+        lines.append(sample_line('meetup_updates_skipped_total', {}, skipped))
+        add_header(lines, 'meetup_metrics_sample_rate', 'Доля замеряемых обновлений', 'gauge')
+        lines.append(sample_line('meetup_metrics_sample_rate', {}, self.sample_rate))
+
+        for name, (help_text, metric_type, collect) in self.collectors.items():
+            try:
+                values = list(collect())
+            except Exception:
+                logger.exception('Не удалось собрать показатель %s', name)
+                continue
+            add_header(lines, name, help_text, metric_type)
+            for labels, value in values:
+                lines.append(sample_line(name, labels, value))
+        return '\n'.join(lines) + '\n'
+
+
+def _copy_stats(stats):
+    copy = HandlerStats(())
+    for field in HandlerStats.__slots__:
+        value = getattr(stats, field)
+        setattr(copy, field, list(value) if isinstance(value, list) else value)
+    return copy
+
+
+def add_header(lines, name, help_text, metric_type):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} {metric_type}')
+
+
+def sample_line(name, labels, value):
+    if not labels:
+        return f'{name} {value}'
+    pairs = ','.join(f'{key}="{escape_label(value)}"' for key, value in labels.items())
+    return f'{name}{{{pairs}}} {value}'
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def set_handler(name, prefix=''):
+    """Отмечает, какой обработчик выполняет текущее обновление"""
+    sample = _current_sample.get()
+    if sample is not None:
+        sample.handler = name
+        sample.prefix = prefix
+
+
+def labelled(handler):
+    """Обработчик TeleBot, который отмечает себя в замере обновления"""
+    @functools.wraps(handler)
+    async def wrapper(*args, **kwargs):
+        set_handler(handler.__name__)
+        return await handler(*args, **kwargs)
+    return wrapper
+
+
+def execute_wrapper(execute, sql, params, many, context):
+    """Обертка запросов к базе (connection.execute_wrappers)"""
+    sample = _current_sample.get()
+    if sample is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        sample.db.append(time.perf_counter() - started)
+
+
+def instrument_telegram_api():
+    """Учитывает запросы к Bot API в замерах обработчиков"""
+    process_request = asyncio_helper._process_request
+    if getattr(process_request, 'instrumented', False):
+        return
+
+    @functools.wraps(process_request)
+    async def _process_request(*args, **kwargs):
+        sample = _current_sample.get()
+        if sample is None:
+            return await process_request(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return await process_request(*args, **kwargs)
+        finally:
+            sample.api.append(time.perf_counter() - started)
+
+    _process_request.instrumented = True
+    asyncio_helper._process_request = _process_request
+
+
+handler_metrics = HandlerMetrics()
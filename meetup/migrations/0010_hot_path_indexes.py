@@ -0,0 +1,41 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:05
+
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def remove_duplicate_event_guests(apps, schema_editor):
+    EventGuests = apps.get_model('meetup', 'EventGuests')
+    keep_ids = EventGuests.objects.values('event', 'guest').annotate(keep_id=Min('id')).values('keep_id')
+    EventGuests.objects.exclude(id__in=keep_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meetup', '0009_outbox'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(condition=models.Q(('active', True)), fields=['date'], name='event_active_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='guest',
+            index=models.Index(condition=models.Q(('open_for_contact', True)), fields=['id'], name='guest_open_for_contact_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='schedule',
+            index=models.Index(fields=['event', 'start_at'], name='schedule_event_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='schedule',
+            index=models.Index(condition=models.Q(('active', True)), fields=['event'], name='schedule_event_active_idx'),
+        ),
+        migrations.RunPython(remove_duplicate_event_guests, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='eventguests',
+            constraint=models.UniqueConstraint(fields=('event', 'guest'), name='unique_event_guest'),
+        ),
+    ]
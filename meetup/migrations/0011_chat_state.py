@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:11
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meetup', '0010_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chat_id', models.BigIntegerField(verbose_name='Чат')),
+                ('user_id', models.BigIntegerField(verbose_name='Пользователь')),
+                ('state', models.CharField(blank=True, max_length=100, verbose_name='Состояние')),
+                ('data', models.JSONField(blank=True, default=dict, verbose_name='Данные')),
+                ('updated_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Изменено')),
+            ],
+            options={
+                'verbose_name': 'состояние диалога',
+                'verbose_name_plural': 'состояния диалогов',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='chatstate',
+            constraint=models.UniqueConstraint(fields=('chat_id', 'user_id'), name='unique_chat_state'),
+        ),
+    ]
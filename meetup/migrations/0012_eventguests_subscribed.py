@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meetup', '0011_chat_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='eventguests',
+            name='subscribed',
+            field=models.BooleanField(default=False, verbose_name='Следит за выступлениями'),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:31
+
+from datetime import datetime, time
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def fill_totals(apps, schema_editor):
+    """Старые донаты относим к дню мероприятия и считаем по ним итоги"""
+    Event = apps.get_model('meetup', 'Event')
+    Donation = apps.get_model('meetup', 'Donation')
+    DonationTotals = apps.get_model('meetup', 'DonationTotals')
+    DonationDayTotals = apps.get_model('meetup', 'DonationDayTotals')
+
+    for event in Event.objects.filter(donations__isnull=False).distinct():
+        created_at = django.utils.timezone.make_aware(datetime.combine(event.date, time(12)))
+        Donation.objects.filter(event=event).update(created_at=created_at)
+        totals = Donation.objects.filter(event=event).aggregate(count=Count('id'), amount=Sum('amount'))
+        DonationTotals.objects.create(event=event, **totals)
+        DonationDayTotals.objects.create(event=event, day=event.date, **totals)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meetup', '0012_eventguests_subscribed'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DonationTotals',
+            fields=[
+                ('event', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='donation_totals', serialize=False, to='meetup.event', verbose_name='Событие')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Количество')),
+                ('amount', models.BigIntegerField(default=0, verbose_name='Сумма')),
+            ],
+            options={
+                'verbose_name': 'итоги донатов',
+                'verbose_name_plural': 'итоги донатов',
+            },
+        ),
+        migrations.AddField(
+            model_name='donation',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Создан'),
+        ),
+        migrations.CreateModel(
+            name='DonationDayTotals',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Количество')),
+                ('amount', models.BigIntegerField(default=0, verbose_name='Сумма')),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='donation_days', to='meetup.event', verbose_name='Событие')),
+            ],
+            options={
+                'verbose_name': 'донаты за день',
+                'verbose_name_plural': 'донаты по дням',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='donationdaytotals',
+            constraint=models.UniqueConstraint(fields=('event', 'day'), name='unique_donation_day'),
+        ),
+        migrations.RunPython(fill_totals, migrations.RunPython.noop),
+    ]
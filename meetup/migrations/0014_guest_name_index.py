@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-18 20:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meetup', '0013_donation_totals'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='guest',
+            index=models.Index(fields=['name'], name='guest_name_idx'),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 
 
 class Guest(models.Model):
@@ -13,6 +14,10 @@ class Guest(models.Model):
     class Meta:
         verbose_name = 'посетитель'
         verbose_name_plural = 'посетители'
+        indexes = [
+            models.Index(fields=['id'], name='guest_open_for_contact_idx', condition=models.Q(open_for_contact=True)),
+            models.Index(fields=['name'], name='guest_name_idx'),
+        ]
         
     def __str__(self):
         return f'{self.name}, phone: {self.phone}'
@@ -39,6 +44,9 @@ class Event(models.Model):
     class Meta:
         verbose_name = 'мероприятие'
         verbose_name_plural = 'мероприятия'
+        indexes = [
+            models.Index(fields=['date'], name='event_active_date_idx', condition=models.Q(active=True)),
+        ]
 
     def __str__(self):
         return self.topic
@@ -47,10 +55,14 @@ class Event(models.Model):
 class EventGuests(models.Model):
     event = models.ForeignKey(Event, related_name='events', on_delete=models.CASCADE)
     guest = models.ForeignKey(Guest, related_name='events', on_delete=models.CASCADE)
+    subscribed = models.BooleanField('Следит за выступлениями', default=False)
 
     class Meta:
         verbose_name = 'гость мероприятия'
         verbose_name_plural = 'гости мероприятия'
+        constraints = [
+            models.UniqueConstraint(fields=['event', 'guest'], name='unique_event_guest'),
+        ]
 
 
 class Schedule(models.Model):
@@ -71,6 +83,10 @@ class Schedule(models.Model):
     class Meta:
         verbose_name = 'доклад'
         verbose_name_plural = 'доклады'
+        indexes = [
+            models.Index(fields=['event', 'start_at'], name='schedule_event_start_idx'),
+            models.Index(fields=['event'], name='schedule_event_active_idx', condition=models.Q(active=True)),
+        ]
 
     def __str__(self):
         return self.topic
@@ -98,6 +114,7 @@ class Donation(models.Model):
         null=True,
         related_name='donations'
     )
+    created_at = models.DateTimeField('Создан', default=timezone.now)
 
     class Meta:
         verbose_name = 'донат'
@@ -107,13 +124,110 @@ class Donation(models.Model):
         return f'{self.guest}: {self.amount}'
 
 
+class DonationTotals(models.Model):
+    """Итоги донатов мероприятия, обновляются вместе с каждым донатом"""
+    event = models.OneToOneField(
+        Event,
+        verbose_name='Событие',
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='donation_totals',
+    )
+    count = models.PositiveIntegerField('Количество', default=0)
+    amount = models.BigIntegerField('Сумма', default=0)
+
+    class Meta:
+        verbose_name = 'итоги донатов'
+        verbose_name_plural = 'итоги донатов'
+
+    def __str__(self):
+        return f'{self.event}: {self.amount}'
+
+
+class DonationDayTotals(models.Model):
+    event = models.ForeignKey(Event, verbose_name='Событие', on_delete=models.CASCADE, related_name='donation_days')
+    day = models.DateField('День')
+    count = models.PositiveIntegerField('Количество', default=0)
+    amount = models.BigIntegerField('Сумма', default=0)
+
+    class Meta:
+        verbose_name = 'донаты за день'
+        verbose_name_plural = 'донаты по дням'
+        constraints = [
+            models.UniqueConstraint(fields=['event', 'day'], name='unique_donation_day'),
+        ]
+
+    def __str__(self):
+        return f'{self.event}, {self.day}: {self.amount}'
 
 
+class Broadcast(models.Model):
+    title = models.CharField('Название', max_length=200)
+    report_chat_id = models.BigIntegerField('Чат для отчета', null=True, blank=True)
+    report_message_id = models.BigIntegerField('Сообщение с отчетом', null=True, blank=True)
+    created_at = models.DateTimeField('Создана', auto_now_add=True)
+    finished_at = models.DateTimeField('Завершена', null=True, blank=True)
 
+    class Meta:
+        verbose_name = 'рассылка'
+        verbose_name_plural = 'рассылки'
 
+    def __str__(self):
+        return f'{self.title} ({self.created_at:%d-%m-%Y %H:%M})'
+
+
+class OutgoingMessage(models.Model):
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Ожидает отправки'),
+        (SENT, 'Отправлено'),
+        (FAILED, 'Не доставлено'),
+    ]
+
+    broadcast = models.ForeignKey(
+        Broadcast,
+        verbose_name='Рассылка',
+        on_delete=models.CASCADE,
+        related_name='messages',
+        null=True,
+        blank=True
+    )
+    chat_id = models.BigIntegerField('Чат')
+    text = models.TextField('Текст')
+    reply_markup = models.TextField('Клавиатура', blank=True)
+    status = models.CharField('Статус', max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField('Попытки', default=0)
+    next_attempt_at = models.DateTimeField('Следующая попытка', default=timezone.now)
+    sent_at = models.DateTimeField('Отправлено', null=True, blank=True)
+    error = models.CharField('Ошибка', max_length=200, blank=True)
+    claim = models.CharField('Метка обработчика', max_length=32, blank=True)
 
+    class Meta:
+        verbose_name = 'исходящее сообщение'
+        verbose_name_plural = 'исходящие сообщения'
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
 
+    def __str__(self):
+        return f'{self.chat_id}: {self.text[:50]}'
 
 
+class ChatState(models.Model):
+    chat_id = models.BigIntegerField('Чат')
+    user_id = models.BigIntegerField('Пользователь')
+    state = models.CharField('Состояние', max_length=100, blank=True)
+    data = models.JSONField('Данные', default=dict, blank=True)
+    updated_at = models.DateTimeField('Изменено', default=timezone.now, db_index=True)
 
+    class Meta:
+        verbose_name = 'состояние диалога'
+        verbose_name_plural = 'состояния диалогов'
+        constraints = [
+            models.UniqueConstraint(fields=['chat_id', 'user_id'], name='unique_chat_state'),
+        ]
 
+    def __str__(self):
+        return f'{self.chat_id}: {self.state}'
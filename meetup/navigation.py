@@ -0,0 +1,56 @@
+import logging
+
+from telebot.asyncio_helper import ApiTelegramException
+
+
+logger = logging.getLogger(__name__)
+
+NOT_MODIFIED = 'message is not modified'
+
+
+class Navigator:
+    """Переходы по меню бота одним запросом к Bot API.
+
+    Новый экран показывается на месте сообщения, в котором нажали
+    кнопку (editMessageText), вместо отправки нового сообщения и
+    удаления старого. Новое сообщение отправляется, только если
+    старое отредактировать нельзя: это не текст, оно слишком старое
+    или уже удалено.
+    """
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.edited = 0
+        self.unchanged = 0
+        self.sent = 0
+
+    async def show(self, call, text, reply_markup=None, parse_mode=None):
+        message = call.message
+        if message and message.content_type == 'text':
+            try:
+                result = await self.bot.edit_message_text(
+                    text,
+                    chat_id=message.chat.id,
+                    message_id=message.message_id,
+                    reply_markup=reply_markup,
+                    parse_mode=parse_mode,
+                )
+                self.edited += 1
+                return result
+            except ApiTelegramException as error:
+                # Повторное нажатие той же кнопки: экран уже на месте
+                if NOT_MODIFIED in error.description:
+                    self.unchanged += 1
+                    return message
+                logger.info('Не удалось отредактировать сообщение: %s', error.description)
+
+        self.sent += 1
+        return await self.bot.send_message(
+            call.from_user.id,
+            text,
+            reply_markup=reply_markup,
+            parse_mode=parse_mode,
+        )
+
+    def stats(self):
+        return {'edited': self.edited, 'unchanged': self.unchanged, 'sent': self.sent}
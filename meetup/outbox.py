@@ -0,0 +1,223 @@
+import asyncio
+import logging
+import uuid
+from datetime import timedelta
+from textwrap import dedent
+
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .broadcast import RetryLater
+from .db_operations import to_async
+from .models import Broadcast, OutgoingMessage
+
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 100
+IDLE_INTERVAL = 1.0
+# Сколько времени сообщение считается взятым в работу. Если процесс
+# упал посреди отправки, по истечении аренды сообщение снова попадет в очередь.
+LEASE = timedelta(seconds=60)
+MAX_ATTEMPTS = 5
+MAX_BACKOFF = timedelta(minutes=10)
+
+
+def enqueue_messages(chat_ids, text, reply_markup=None, title='',
+                     report_chat_id=None, report_message_id=None) -> Broadcast:
+    """Ставит рассылку в очередь одной пакетной вставкой"""
+    markup = reply_markup.to_json() if reply_markup else ''
+    with transaction.atomic():
+        broadcast = Broadcast.objects.create(
+            title=title,
+            report_chat_id=report_chat_id,
+            report_message_id=report_message_id,
+        )
+        OutgoingMessage.objects.bulk_create(
+            [
+                OutgoingMessage(broadcast=broadcast, chat_id=chat_id, text=text, reply_markup=markup)
+                for chat_id in chat_ids
+            ],
+            batch_size=500,
+        )
+    return broadcast
+
+
+def claim_due_messages(limit=BATCH_SIZE) -> list[OutgoingMessage]:
+    """Берет в работу сообщения, время отправки которых подошло.
+
+    Выбор и продление аренды выполняются одним UPDATE, поэтому два
+    обработчика очереди не получат одно и то же сообщение.
+    """
+    now = timezone.now()
+    claim = uuid.uuid4().hex
+    due_ids = OutgoingMessage.objects.filter(
+        status=OutgoingMessage.PENDING,
+        next_attempt_at__lte=now,
+    ).order_by('next_attempt_at', 'id').values('id')[:limit]
+    OutgoingMessage.objects.filter(
+        id__in=due_ids,
+        status=OutgoingMessage.PENDING,
+        next_attempt_at__lte=now,
+    ).update(next_attempt_at=now + LEASE, claim=claim)
+    return list(OutgoingMessage.objects.filter(claim=claim, status=OutgoingMessage.PENDING))
+
+
+def mark_sent(message_ids) -> None:
+    OutgoingMessage.objects.filter(id__in=message_ids).update(
+        status=OutgoingMessage.SENT,
+        sent_at=timezone.now(),
+        error='',
+    )
+
+
+def mark_failed(message_ids, error='') -> None:
+    OutgoingMessage.objects.filter(id__in=message_ids).update(
+        status=OutgoingMessage.FAILED,
+        error=error[:200],
+    )
+
+
+def schedule_retry(message, error) -> None:
+    attempts = message.attempts + 1
+    if attempts >= MAX_ATTEMPTS:
+        OutgoingMessage.objects.filter(id=message.id).update(
+            status=OutgoingMessage.FAILED,
+            attempts=attempts,
+            error=error[:200],
+        )
+        return
+    backoff = min(timedelta(seconds=2 ** attempts), MAX_BACKOFF)
+    OutgoingMessage.objects.filter(id=message.id).update(
+        attempts=attempts,
+        next_attempt_at=timezone.now() + backoff,
+        error=error[:200],
+    )
+
+
+def get_broadcasts_progress(broadcast_ids) -> list[Broadcast]:
+    return list(
+        Broadcast.objects.filter(id__in=broadcast_ids, finished_at__isnull=True).annotate(
+            total=Count('messages'),
+            sent=Count('messages', filter=Q(messages__status=OutgoingMessage.SENT)),
+            failed=Count('messages', filter=Q(messages__status=OutgoingMessage.FAILED)),
+        )
+    )
+
+
+def finish_broadcast(broadcast_id) -> bool:
+    """Отмечает рассылку завершенной. Возвращает False, если это уже сделано"""
+    return bool(
+        Broadcast.objects.filter(id=broadcast_id, finished_at__isnull=True).update(finished_at=timezone.now())
+    )
+
+
+aenqueue_messages = to_async(enqueue_messages)
+aclaim_due_messages = to_async(claim_due_messages)
+amark_sent = to_async(mark_sent)
+amark_failed = to_async(mark_failed)
+aschedule_retry = to_async(schedule_retry)
+aget_broadcasts_progress = to_async(get_broadcasts_progress)
+afinish_broadcast = to_async(finish_broadcast)
+
+
+class OutboxWorker:
+    """Фоновая доставка сообщений из таблицы OutgoingMessage.
+
+    Очередь хранится в базе, поэтому после перезапуска бота рассылка
+    продолжится с того места, где остановилась.
+    """
+
+    def __init__(self, bot, broadcaster):
+        self.bot = bot
+        self.broadcaster = broadcaster
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+
+    def wake(self):
+        """Сообщает, что в очереди появились новые сообщения"""
+        self._wakeup.set()
+
+    async def run(self):
+        while True:
+            try:
+                processed = await self.process_batch()
+            except Exception:
+                logger.exception('Ошибка при обработке очереди сообщений')
+                processed = 0
+            if processed:
+                continue
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), IDLE_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def process_batch(self):
+        messages = await aclaim_due_messages()
+        if not messages:
+            return 0
+
+        semaphore = asyncio.Semaphore(self.broadcaster.concurrency)
+        sent, failed = [], []
+
+        async def deliver(message):
+            async with semaphore:
+                try:
+                    delivered = await self.broadcaster.send_one(
+                        message.chat_id,
+                        message.text,
+                        reply_markup=message.reply_markup or None,
+                    )
+                except RetryLater as error:
+                    await aschedule_retry(message, str(error))
+                    return
+            (sent if delivered else failed).append(message.id)
+
+        await asyncio.gather(*[deliver(message) for message in messages])
+        if sent:
+            await amark_sent(sent)
+        if failed:
+            await amark_failed(failed, 'Сообщение не может быть доставлено')
+
+        await self.report({message.broadcast_id for message in messages if message.broadcast_id})
+        return len(messages)
+
+    async def report(self, broadcast_ids):
+        for broadcast in await aget_broadcasts_progress(broadcast_ids):
+            finished = broadcast.sent + broadcast.failed == broadcast.total
+            if finished and not await afinish_broadcast(broadcast.id):
+                continue
+            if not broadcast.report_chat_id:
+                continue
+            if finished:
+                text = dedent(
+                    f'''
+                    {broadcast.title}: рассылка завершена.
+
+                    Доставлено: {broadcast.sent}
+                    Не доставлено: {broadcast.failed}
+                    '''
+                )
+            else:
+                text = f'{broadcast.title}: отправлено {broadcast.sent + broadcast.failed} из {broadcast.total}'
+            try:
+                if broadcast.report_message_id:
+                    await self.bot.edit_message_text(
+                        chat_id=broadcast.report_chat_id,
+                        message_id=broadcast.report_message_id,
+                        text=text,
+                    )
+                else:
+                    await self.bot.send_message(broadcast.report_chat_id, text)
+            except Exception:
+                logger.exception('Не удалось отправить отчет о рассылке %s', broadcast.id)
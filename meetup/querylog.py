@@ -0,0 +1,161 @@
+import asyncio
+import functools
+import logging
+import random
+import re
+import sys
+import threading
+import time
+
+from django.conf import settings
+
+
+logger = logging.getLogger(__name__)
+
+SLOW_MS = getattr(settings, 'SQL_SLOW_MS', 100)
+SAMPLE_RATE = getattr(settings, 'SQL_SAMPLE_RATE', 0.0)
+LOG_INTERVAL = getattr(settings, 'METRICS_LOG_INTERVAL', 60)
+LOG_TOP = 10
+MAX_SQL_LENGTH = 2000
+
+# Модули, из которых приходят запросы. Первый такой кадр стека
+# считается местом вызова
+CALLER_MODULES = ('meetup.', 'meetup_bot')
+SKIP_MODULES = (__name__, 'meetup.backends', 'meetup.sqlite', 'meetup.metrics', 'meetup.signals')
+
+NORMALIZERS = [
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'%s'), '?'),
+    # IN (?, ?, ?) и VALUES (?, ?), (?, ?) разной длины — один запрос
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(...)'),
+    (re.compile(r'\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+'), '(...), ...'),
+    (re.compile(r'\s+'), ' '),
+]
+
+
+@functools.lru_cache(maxsize=2048)
+def fingerprint(sql):
+    """Запрос без значений: одинаковые по форме запросы дают одну строку"""
+    for pattern, replacement in NORMALIZERS:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+def find_caller():
+    """Функция проекта, из которой выполняется запрос, например `db_operations.get_guest`"""
+    frame = sys._getframe(1)
+    while frame:
+        module = frame.f_globals.get('__name__', '')
+        if module.startswith(CALLER_MODULES) and not module.startswith(SKIP_MODULES):
+            return f'{module.rsplit(".", 1)[-1]}.{frame.f_code.co_name}'
+        frame = frame.f_back
+    return '?'
+
+
+class QueryStats:
+    __slots__ = ('count', 'seconds', 'max_seconds', 'callers')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.callers = {}
+
+
+class QueryLog:
+    """Журнал запросов к базе для поиска медленных и частых запросов.
+
+    Запросы дольше `slow_ms` пишутся в лог с функцией, из которой их
+    вызвали, остальные — с вероятностью `sample_rate`. Все запросы
+    группируются по форме (`fingerprint`): для каждой считаются число,
+    общее и наибольшее время и места вызова. Подключается ко всем
+    соединениям через `connection.execute_wrappers`, если включен
+    параметр SQL_LOG.
+    """
+
+    def __init__(self, slow_ms=SLOW_MS, sample_rate=SAMPLE_RATE, log_interval=LOG_INTERVAL):
+        self.slow_seconds = slow_ms / 1000
+        self.sample_rate = sample_rate
+        self.log_interval = log_interval
+        self.queries = {}
+        self.slow = 0
+        self._lock = threading.Lock()
+        self._task = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.record(sql, time.perf_counter() - started, many)
+
+    def record(self, sql, seconds, many=False):
+        caller = find_caller()
+        key = fingerprint(sql)
+        with self._lock:
+            stats = self.queries.get(key)
+            if stats is None:
+                stats = self.queries[key] = QueryStats()
+            stats.count += 1
+            stats.seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+            stats.callers[caller] = stats.callers.get(caller, 0) + 1
+            if seconds >= self.slow_seconds:
+                self.slow += 1
+
+        kind = ' (executemany)' if many else ''
+        if seconds >= self.slow_seconds:
+            logger.warning('Медленный запрос%s %.1f мс в %s: %s', kind, seconds * 1000, caller, sql[:MAX_SQL_LENGTH])
+        elif self.sample_rate and random.random() < self.sample_rate:
+            logger.info('Запрос%s %.1f мс в %s: %s', kind, seconds * 1000, caller, sql[:MAX_SQL_LENGTH])
+
+    def top(self, limit=LOG_TOP, by='seconds'):
+        """Самые тяжелые формы запросов: by — seconds, count или max_seconds"""
+        with self._lock:
+            items = [
+                {
+                    'fingerprint': key,
+                    'count': stats.count,
+                    'seconds': stats.seconds,
+                    'max_seconds': stats.max_seconds,
+                    'callers': dict(sorted(stats.callers.items(), key=lambda item: -item[1])),
+                }
+                for key, stats in self.queries.items()
+            ]
+        return sorted(items, key=lambda item: item[by], reverse=True)[:limit]
+
+    def reset(self):
+        with self._lock:
+            self.queries = {}
+            self.slow = 0
+
+    def start(self):
+        if self.log_interval:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        self.log_summary()
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.log_interval)
+            self.log_summary()
+
+    def log_summary(self):
+        top = self.top()
+        if not top:
+            return
+        lines = [
+            f'{item["seconds"] * 1000:.0f} мс, {item["count"]} шт., макс. {item["max_seconds"] * 1000:.1f} мс, '
+            f'{", ".join(item["callers"])}: {item["fingerprint"][:200]}'
+            for item in top
+        ]
+        logger.info('Самые тяжелые запросы (медленных: %s):\n%s', self.slow, '\n'.join(lines))
+
+
+query_log = QueryLog()
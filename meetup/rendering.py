@@ -0,0 +1,83 @@
+from django.conf import settings
+from telebot.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from .cache import KeyedCache
+from .models import Schedule
+from .router import make_callback_data
+
+
+GUEST_SCHEDULE = 'guest'
+EDIT_KEYBOARD = 'edit'
+CONTROL_KEYBOARD = 'control'
+
+# Какие спикеры попали в отрисованное расписание мероприятия — чтобы
+# при переименовании гостя сбрасывать только затронутые мероприятия
+event_speakers = {}
+
+
+def render_schedule_text(schedules) -> str:
+    schedules_info = ''
+    for schedule in schedules:
+        schedules_info += f'''
+                    Тема: {schedule.topic}
+                    \n  Спикер: {schedule.speaker}  активное {schedule.active}
+                    \n Время начала {schedule.start_at}  Время окончания {schedule.end_at}
+        '''
+    return schedules_info
+
+
+def render_speech_keyboard(event_id, schedules, control=False) -> str:
+    keyboard = InlineKeyboardMarkup()
+    for speech in schedules:
+        text_button = f'{speech.start_at:%H:%M}-{speech.end_at:%H:%M}'
+        if speech.speaker:
+            text_button += f' {speech.speaker.name}'
+
+        if not control:
+            text_button += f' "{speech.topic}"'
+            callback_data = make_callback_data('edit_schedule', speech.id)
+        else:
+            if speech.active:
+                text_button += ' ✅'
+            callback_data = make_callback_data('set_active_schedule', event_id, speech.id)
+
+        keyboard.add(InlineKeyboardButton(text_button, callback_data=callback_data))
+    if not control:
+        keyboard.add(InlineKeyboardButton('Добавить выступление', callback_data=make_callback_data('add_speech', event_id)))
+    keyboard.add(InlineKeyboardButton('Назад', callback_data=make_callback_data('admin_event', event_id)))
+
+    return keyboard.to_json()
+
+
+def render_event_view(event_id, mode):
+    schedules = list(Schedule.objects.filter(event_id=event_id).select_related('speaker').order_by('start_at'))
+    event_speakers[event_id] = {schedule.speaker_id for schedule in schedules if schedule.speaker_id}
+    if mode == GUEST_SCHEDULE:
+        return render_schedule_text(schedules)
+    return render_speech_keyboard(event_id, schedules, control=mode == CONTROL_KEYBOARD)
+
+
+event_views = KeyedCache(render_event_view, ttl=getattr(settings, 'ACTIVE_CACHE_TTL', 60))
+
+
+def get_schedule_text(event_id) -> str:
+    """Расписание для гостей, собранное один раз на мероприятие"""
+    return event_views.get(int(event_id), GUEST_SCHEDULE)
+
+
+def get_speech_keyboard(event_id, control=False) -> str:
+    """Клавиатура докладов для администратора в виде JSON"""
+    return event_views.get(int(event_id), CONTROL_KEYBOARD if control else EDIT_KEYBOARD)
+
+
+def invalidate_event_views(event_id=None):
+    if event_id is None:
+        event_views.invalidate()
+    else:
+        event_views.invalidate(int(event_id))
+
+
+def invalidate_speaker_views(guest_id):
+    for event_id, speaker_ids in list(event_speakers.items()):
+        if guest_id in speaker_ids:
+            invalidate_event_views(event_id)
@@ -0,0 +1,74 @@
+import logging
+from typing import NamedTuple
+
+from .metrics import set_handler
+
+
+logger = logging.getLogger(__name__)
+
+SEPARATOR = ':'
+# Ограничение Telegram на длину callback_data
+MAX_DATA_LENGTH = 64
+
+
+class Route(NamedTuple):
+    handler: object
+    arg_types: tuple
+
+
+def make_callback_data(prefix, *args) -> str:
+    """Собирает callback_data вида `prefix:arg1:arg2`"""
+    data = SEPARATOR.join([prefix, *map(str, args)])
+    if len(data.encode()) > MAX_DATA_LENGTH:
+        raise ValueError(f'callback_data длиннее {MAX_DATA_LENGTH} байт: {data}')
+    return data
+
+
+def parse_callback_data(data) -> tuple[str, list[str]]:
+    prefix, *args = data.split(SEPARATOR)
+    return prefix, args
+
+
+class CallbackRouter:
+    """Разбирает callback_data один раз и находит обработчик по словарю.
+
+    Стоимость выбора обработчика не зависит от числа зарегистрированных
+    префиксов, а совпадение префиксов только точное — порядок регистрации
+    не важен.
+    """
+
+    def __init__(self):
+        self.routes = {}
+
+    def route(self, prefix, *arg_types):
+        """Регистрирует обработчик `handler(call, *args)` для префикса"""
+        if SEPARATOR in prefix:
+            raise ValueError(f'Префикс не может содержать "{SEPARATOR}": {prefix}')
+
+        def decorator(handler):
+            if prefix in self.routes:
+                raise ValueError(f'Префикс уже зарегистрирован: {prefix}')
+            self.routes[prefix] = Route(handler, arg_types)
+            return handler
+        return decorator
+
+    def resolve(self, data):
+        """Возвращает обработчик и типизированные аргументы или None"""
+        prefix, raw_args = parse_callback_data(data)
+        route = self.routes.get(prefix)
+        if route is None or len(raw_args) != len(route.arg_types):
+            return None
+        try:
+            args = [arg_type(arg) for arg_type, arg in zip(route.arg_types, raw_args)]
+        except ValueError:
+            return None
+        return route.handler, args
+
+    async def dispatch(self, call):
+        resolved = self.resolve(call.data)
+        if resolved is None:
+            logger.warning('Неизвестный callback: %s', call.data)
+            return
+        handler, args = resolved
+        set_handler(handler.__name__, parse_callback_data(call.data)[0])
+        return await handler(call, *args)
@@ -0,0 +1,120 @@
+import asyncio
+import logging
+
+from django.conf import settings
+from telebot.async_telebot import AsyncTeleBot
+
+from .metrics import handler_metrics, labelled
+
+
+logger = logging.getLogger(__name__)
+
+UPDATE_WORKERS = getattr(settings, 'UPDATE_WORKERS', 64)
+STOP_TIMEOUT = 10
+
+
+def get_chat_id(update):
+    """Чат, к которому относится обновление, или None"""
+    if update.message:
+        return update.message.chat.id
+    if update.edited_message:
+        return update.edited_message.chat.id
+    for query in (update.callback_query, update.pre_checkout_query, update.shipping_query):
+        if query:
+            return query.from_user.id
+    return None
+
+
+class ChatScheduler:
+    """Очереди обновлений, разделенные по чатам.
+
+    Обновления одного чата всегда попадают в одну очередь и
+    обрабатываются строго по порядку, разные чаты обрабатываются
+    параллельно в `workers` очередях. Чаты из `isolated_chat_ids`
+    (администраторы) получают отдельную очередь, чтобы долгие
+    операции администратора не задерживали гостей.
+    """
+
+    def __init__(self, process, workers=UPDATE_WORKERS, isolated_chat_ids=()):
+        self.process = process
+        self.workers = workers
+        self.isolated_chat_ids = set(isolated_chat_ids)
+        shards = workers + (1 if self.isolated_chat_ids else 0)
+        self.queues = [asyncio.Queue() for _ in range(shards)]
+        self.processed = [0] * shards
+        self._tasks = []
+
+    @property
+    def running(self):
+        return bool(self._tasks)
+
+    def shard(self, chat_id):
+        if chat_id in self.isolated_chat_ids:
+            return self.workers
+        return hash(chat_id) % self.workers
+
+    def submit(self, update):
+        chat_id = get_chat_id(update)
+        self.queues[self.shard(chat_id if chat_id is not None else update.update_id)].put_nowait(update)
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self.run(number)) for number in range(len(self.queues))]
+
+    async def stop(self, timeout=STOP_TIMEOUT):
+        """Дожидается обработки уже принятых обновлений и останавливает очереди"""
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(asyncio.gather(*[queue.join() for queue in self.queues]), timeout)
+        except asyncio.TimeoutError:
+            logger.warning('Не обработано обновлений: %s', sum(queue.qsize() for queue in self.queues))
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def run(self, number):
+        queue = self.queues[number]
+        while True:
+            update = await queue.get()
+            try:
+                await self.process(update)
+            except Exception:
+                logger.exception('Ошибка при обработке обновления %s', update.update_id)
+            finally:
+                self.processed[number] += 1
+                queue.task_done()
+
+    def stats(self):
+        """Глубина очереди и число обработанных обновлений по каждой очереди"""
+        return [
+            {'shard': number, 'depth': queue.qsize(), 'processed': self.processed[number]}
+            for number, queue in enumerate(self.queues)
+        ]
+
+
+class MeetupBot(AsyncTeleBot):
+    """AsyncTeleBot, который обрабатывает обновления через ChatScheduler.
+
+    Пока очереди не запущены (например, в тестах), обновления
+    обрабатываются сразу, как в AsyncTeleBot. Обработка каждого
+    обновления из очереди замеряется в `metrics`.
+    """
+
+    def __init__(self, *args, workers=UPDATE_WORKERS, isolated_chat_ids=(), metrics=handler_metrics, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = metrics
+        self.scheduler = ChatScheduler(self.process_update, workers, isolated_chat_ids)
+
+    def _build_handler_dict(self, handler, pass_bot=False, **filters):
+        return super()._build_handler_dict(labelled(handler), pass_bot, **filters)
+
+    async def process_new_updates(self, updates):
+        if not self.scheduler.running:
+            return await super().process_new_updates(updates)
+        for update in updates:
+            self.scheduler.submit(update)
+
+    async def process_update(self, update):
+        with self.metrics.measure():
+            await super().process_new_updates([update])
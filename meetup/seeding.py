@@ -0,0 +1,188 @@
+import random
+from datetime import date, datetime, timedelta
+
+from django.db import connection, transaction
+
+from .db_operations import rebuild_donation_totals
+from .models import Donation, Event, EventGuests, Friend, Guest, Question, Schedule
+
+
+CHUNK_SIZE = 5000
+
+FIRST_NAMES = [
+    'Александр', 'Алексей', 'Анна', 'Антон', 'Дарья', 'Дмитрий', 'Екатерина', 'Елена', 'Иван',
+    'Ирина', 'Кирилл', 'Мария', 'Михаил', 'Наталья', 'Никита', 'Ольга', 'Павел', 'Сергей',
+    'Татьяна', 'Юлия',
+]
+LAST_NAMES = [
+    'Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Петров', 'Соколов', 'Михайлов',
+    'Новиков', 'Федоров', 'Морозов', 'Волков', 'Алексеев', 'Лебедев', 'Семенов', 'Егоров',
+]
+ACTIVITIES = [
+    'Backend-разработчик', 'Data Scientist', 'DevOps-инженер', 'Тимлид', 'QA-инженер',
+    'Студент', 'Fullstack-разработчик', 'ML-инженер', 'Аналитик данных', 'CTO',
+]
+PROJECTS = [
+    'Интернет-магазин на Django', 'Телеграм-бот для записи к врачу', 'Сервис рекомендаций',
+    'Парсер вакансий', 'Платформа онлайн-курсов', 'CRM для салонов красоты', '',
+]
+TALK_TOPICS = [
+    'Асинхронный Python на практике', 'Django ORM без N+1', 'Профилирование и оптимизация',
+    'Типизация в большом проекте', 'Тестирование с pytest', 'Очереди задач и Celery',
+    'FastAPI в продакшене', 'Pandas для больших данных', 'Packaging и зависимости',
+    'Observability для Python-сервисов',
+]
+QUESTIONS = [
+    'Как это масштабируется?', 'Где посмотреть код из доклада?', 'Какие есть альтернативы?',
+    'Как вы это тестируете?', 'Сколько это стоит в поддержке?', 'Что бы вы сделали иначе?',
+]
+DONATION_AMOUNTS = [100, 200, 300, 500, 1000, 2000]
+TALK_MINUTES = 40
+
+
+def bulk_insert(model, fields, rows, chunk_size=CHUNK_SIZE):
+    """Вставляет кортежи значений `fields` пачками через executemany.
+
+    На миллионах строк в разы быстрее bulk_create, потому что не
+    создает объекты моделей. Значения должны быть уже в виде,
+    понятном базе: даты и время — строками ISO.
+    """
+    columns = [model._meta.get_field(field).column for field in fields]
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        connection.ops.quote_name(model._meta.db_table),
+        ', '.join(connection.ops.quote_name(column) for column in columns),
+        ', '.join(['%s'] * len(columns)),
+    )
+    count = 0
+    chunk = []
+    with connection.cursor() as cursor:
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                cursor.executemany(sql, chunk)
+                count += len(chunk)
+                chunk = []
+        if chunk:
+            cursor.executemany(sql, chunk)
+            count += len(chunk)
+    return count
+
+
+def seed_dataset(guests=1000, events=10, talks_per_event=7, attendance=0.3,
+                 open_for_contact=0.3, questions_per_talk=0, donations=0.0,
+                 friends_per_guest=0, seed=0, chunk_size=CHUNK_SIZE):
+    """Наполняет базу синтетическими данными для замеров и подбора индексов.
+
+    `attendance` — доля всех гостей на каждом мероприятии, `donations` —
+    доля гостей мероприятия, сделавших донат. Вопросы задают гости
+    того же мероприятия. Последнее мероприятие становится активным,
+    первый доклад на нем — текущим. При одинаковом `seed` данные
+    получаются одинаковыми.
+    """
+    rng = random.Random(seed)
+    first_telegram_id = (Guest.objects.order_by('-telegram_id').values_list('telegram_id', flat=True).first() or 0) + 1
+    rows = {}
+
+    with transaction.atomic():
+        rows['guests'] = bulk_insert(
+            Guest,
+            ['name', 'phone', 'kind_activity', 'open_for_contact', 'projects', 'telegram_id'],
+            (
+                (
+                    f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+                    f'+79{rng.randrange(10 ** 9):09d}',
+                    rng.choice(ACTIVITIES),
+                    rng.random() < open_for_contact,
+                    rng.choice(PROJECTS),
+                    first_telegram_id + number,
+                )
+                for number in range(guests)
+            ),
+            chunk_size,
+        )
+        guest_ids = list(
+            Guest.objects.filter(telegram_id__gte=first_telegram_id).order_by('id').values_list('id', flat=True)
+        )
+
+        rows['friends'] = bulk_insert(
+            Friend,
+            ['guest', 'friend'],
+            (
+                (guest_id, friend_id)
+                for guest_id in guest_ids
+                for friend_id in rng.sample(guest_ids, min(friends_per_guest, len(guest_ids)))
+                if friend_id != guest_id
+            ),
+            chunk_size,
+        )
+
+        first_date = date.today() - timedelta(days=7 * events)
+        Event.objects.bulk_create(
+            Event(topic=f'Python Meetup #{number + 1}', date=first_date + timedelta(days=7 * (number + 1)))
+            for number in range(events)
+        )
+        event_ids = list(Event.objects.order_by('-id').values_list('id', flat=True)[:events])
+        rows['events'] = len(event_ids)
+        Event.objects.filter(active=True).update(active=False)
+        Event.objects.filter(id=event_ids[0]).update(active=True)
+
+        day_start = datetime(2000, 1, 1, 10)
+        rows['schedules'] = bulk_insert(
+            Schedule,
+            ['event', 'topic', 'start_at', 'end_at', 'speaker', 'active'],
+            (
+                (
+                    event_id,
+                    rng.choice(TALK_TOPICS),
+                    (day_start + timedelta(minutes=TALK_MINUTES * number)).time().isoformat(),
+                    (day_start + timedelta(minutes=TALK_MINUTES * (number + 1))).time().isoformat(),
+                    rng.choice(guest_ids),
+                    event_id == event_ids[0] and number == 0,
+                )
+                for event_id in event_ids
+                for number in range(talks_per_event)
+            ),
+            chunk_size,
+        )
+
+        attendees = max(int(len(guest_ids) * attendance), 1)
+        event_guests = {event_id: rng.sample(guest_ids, attendees) for event_id in event_ids}
+        rows['attendance'] = bulk_insert(
+            EventGuests,
+            ['event', 'guest', 'subscribed'],
+            (
+                (event_id, guest_id, False)
+                for event_id, event_guest_ids in event_guests.items()
+                for guest_id in event_guest_ids
+            ),
+            chunk_size,
+        )
+
+        schedules = list(Schedule.objects.filter(event_id__in=event_ids).order_by('id').values_list('id', 'event_id'))
+        rows['questions'] = bulk_insert(
+            Question,
+            ['question', 'schedule', 'guest'],
+            (
+                (rng.choice(QUESTIONS), schedule_id, rng.choice(event_guests[event_id]))
+                for schedule_id, event_id in schedules
+                for _ in range(questions_per_talk)
+            ),
+            chunk_size,
+        )
+
+        # Донаты приходят в день мероприятия
+        event_dates = dict(Event.objects.filter(id__in=event_ids).values_list('id', 'date'))
+        donors = int(attendees * donations)
+        rows['donations'] = bulk_insert(
+            Donation,
+            ['amount', 'event', 'guest', 'created_at'],
+            (
+                (rng.choice(DONATION_AMOUNTS), event_id, guest_id, f'{event_dates[event_id]} 12:00:00')
+                for event_id, event_guest_ids in event_guests.items()
+                for guest_id in event_guest_ids[:donors]
+            ),
+            chunk_size,
+        )
+        rebuild_donation_totals(event_ids)
+
+    return rows
@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import metrics
+from .cache import active_event_cache, active_schedule_cache
+from .querylog import query_log
+from .models import Event, Guest, Schedule
+from .rendering import invalidate_event_views, invalidate_speaker_views
+from .sqlite import apply_pragmas
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor == 'sqlite':
+        apply_pragmas(connection, getattr(settings, 'SQLITE_PRAGMAS', {}))
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    # Сигнал приходит при каждом переподключении того же DatabaseWrapper,
+    # а список оберток живет вместе с ним
+    if metrics.execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(metrics.execute_wrapper)
+    if getattr(settings, 'SQL_LOG', False) and query_log not in connection.execute_wrappers:
+        connection.execute_wrappers.append(query_log)
+
+
+@receiver([post_save, post_delete], sender=Event)
+def invalidate_active_event(sender, instance, **kwargs):
+    # Текущий доклад загружается для активного мероприятия
+    active_event_cache.invalidate()
+    active_schedule_cache.invalidate()
+    invalidate_event_views(instance.id)
+
+
+@receiver([post_save, post_delete], sender=Schedule)
+def invalidate_active_schedule(sender, instance, **kwargs):
+    active_schedule_cache.invalidate()
+    invalidate_event_views(instance.event_id)
+
+
+@receiver(post_save, sender=Guest)
+def invalidate_active_speaker(sender, instance, created, **kwargs):
+    if created:
+        return
+    # Активный доклад хранится вместе со спикером
+    schedule = active_schedule_cache.peek()
+    if schedule and schedule.speaker_id == instance.id:
+        active_schedule_cache.invalidate()
+    invalidate_speaker_views(instance.id)
@@ -0,0 +1,9 @@
+def apply_pragmas(connection, pragmas):
+    """Выставляет PRAGMA на новом соединении с SQLite.
+
+    Режим журнала WAL сохраняется в самом файле базы, остальные
+    настройки действуют только на это соединение.
+    """
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
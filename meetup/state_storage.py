@@ -0,0 +1,146 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from telebot.asyncio_storage import StateStorageBase, StateContext
+
+from .db_operations import to_async
+from .models import ChatState
+
+
+STATE_TTL = getattr(settings, 'STATE_TTL', 24 * 60 * 60)
+STATE_CACHE_SIZE = getattr(settings, 'STATE_CACHE_SIZE', 10000)
+PURGE_INTERVAL = 10 * 60
+
+
+def load_chat_state(chat_id, user_id, ttl=STATE_TTL):
+    return ChatState.objects.filter(
+        chat_id=chat_id,
+        user_id=user_id,
+        updated_at__gte=timezone.now() - timedelta(seconds=ttl),
+    ).values('state', 'data').first()
+
+
+def save_chat_state(chat_id, user_id, state, data):
+    ChatState.objects.update_or_create(
+        chat_id=chat_id,
+        user_id=user_id,
+        defaults={'state': state, 'data': data, 'updated_at': timezone.now()},
+    )
+
+
+def delete_chat_state(chat_id, user_id):
+    ChatState.objects.filter(chat_id=chat_id, user_id=user_id).delete()
+
+
+def purge_chat_states(ttl=STATE_TTL) -> int:
+    """Удаляет брошенные диалоги, например недописанные регистрации"""
+    deleted, _ = ChatState.objects.filter(updated_at__lt=timezone.now() - timedelta(seconds=ttl)).delete()
+    return deleted
+
+
+aload_chat_state = to_async(load_chat_state)
+asave_chat_state = to_async(save_chat_state)
+adelete_chat_state = to_async(delete_chat_state)
+apurge_chat_states = to_async(purge_chat_states)
+
+
+class DatabaseStateStorage(StateStorageBase):
+    """Состояния диалогов в таблице ChatState с LRU-кэшем в памяти.
+
+    Каждое изменение сразу пишется в базу, поэтому после перезапуска
+    бота пользователи продолжают диалог с того же шага. В памяти
+    хранятся не больше `cache_size` последних чатов, включая те, у
+    которых состояния нет. Диалоги без изменений дольше `ttl` секунд
+    считаются брошенными и удаляются.
+    """
+
+    def __init__(self, ttl=STATE_TTL, cache_size=STATE_CACHE_SIZE):
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._next_purge = time.monotonic() + PURGE_INTERVAL
+
+    async def get_state(self, chat_id, user_id):
+        entry = await self._get(chat_id, user_id)
+        return entry['state'] if entry else None
+
+    async def get_data(self, chat_id, user_id):
+        entry = await self._get(chat_id, user_id)
+        return entry['data'] if entry else None
+
+    async def set_state(self, chat_id, user_id, state):
+        if hasattr(state, 'name'):
+            state = state.name
+        entry = await self._get(chat_id, user_id)
+        await self._save(chat_id, user_id, state, entry['data'] if entry else {})
+        return True
+
+    async def delete_state(self, chat_id, user_id):
+        entry = await self._get(chat_id, user_id)
+        self._remember(chat_id, user_id, None)
+        await adelete_chat_state(chat_id, user_id)
+        return entry is not None
+
+    async def reset_data(self, chat_id, user_id):
+        entry = await self._get(chat_id, user_id)
+        if not entry:
+            return False
+        await self._save(chat_id, user_id, entry['state'], {})
+        return True
+
+    async def set_data(self, chat_id, user_id, key, value):
+        entry = await self._get(chat_id, user_id)
+        if not entry:
+            raise RuntimeError(f'chat_id {chat_id} and user_id {user_id} does not exist')
+        await self._save(chat_id, user_id, entry['state'], {**entry['data'], key: value})
+        return True
+
+    def get_interactive_data(self, chat_id, user_id):
+        return StateContext(self, chat_id, user_id)
+
+    async def save(self, chat_id, user_id, data):
+        entry = await self._get(chat_id, user_id)
+        if entry:
+            await self._save(chat_id, user_id, entry['state'], data)
+
+    def cache_info(self):
+        with self._lock:
+            return {'size': len(self._cache), 'max_size': self.cache_size}
+
+    async def _get(self, chat_id, user_id):
+        key = (chat_id, user_id)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                entry = self._cache[key]
+                if entry is None or time.monotonic() - entry['touched'] <= self.ttl:
+                    return entry
+        entry = await aload_chat_state(chat_id, user_id, self.ttl)
+        if entry:
+            entry['touched'] = time.monotonic()
+        self._remember(chat_id, user_id, entry)
+        return entry
+
+    async def _save(self, chat_id, user_id, state, data):
+        # Данные проходят через JSON и в памяти, чтобы до и после
+        # перезапуска бота обработчики получали одни и те же типы
+        data = json.loads(json.dumps(data, cls=DjangoJSONEncoder))
+        self._remember(chat_id, user_id, {'state': state, 'data': data, 'touched': time.monotonic()})
+        await asave_chat_state(chat_id, user_id, state, data)
+        if time.monotonic() > self._next_purge:
+            self._next_purge = time.monotonic() + PURGE_INTERVAL
+            await apurge_chat_states(self.ttl)
+
+    def _remember(self, chat_id, user_id, entry):
+        with self._lock:
+            self._cache[(chat_id, user_id)] = entry
+            self._cache.move_to_end((chat_id, user_id))
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
@@ -1,3 +1,1139 @@
-from django.test import TestCase
+import asyncio
+import csv
+import io
+import json
+import sys
+import threading
+import time as time_module
+import types
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, time, timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import IntegrityError, OperationalError, connection, connections, models
+from django.test.utils import CaptureQueriesContext
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from aiohttp import ClientConnectionError, ClientSession
+from django.urls import reverse
+from django.utils import timezone
+from telebot.asyncio_helper import ApiTelegramException
+from telebot.types import CallbackQuery, Update
+
+import meetup.db_operations as db
+from meetup import outbox
+from meetup.broadcast import Broadcaster, ChatRateLimiter, RateLimiter, RetryLater
+from meetup.batching import BatchWriter, Debouncer
+from meetup.exports import stream_export
+from meetup.fake_telegram import FakeTelegram
+from meetup.cache import active_event_cache, active_schedule_cache
+from meetup.models import ChatState, Donation, DonationDayTotals, DonationTotals, Event, EventGuests, Friend, Guest, OutgoingMessage, Question, Schedule
+from meetup.management.commands.explain_indexes import explain
+from meetup import metrics
+from meetup.metrics import HandlerMetrics, set_handler
+from meetup.navigation import Navigator
+from meetup.querylog import QueryLog, fingerprint, query_log
+from meetup.rendering import invalidate_event_views
+from meetup.router import CallbackRouter, make_callback_data
+from meetup.scheduler import ChatScheduler
+from meetup.seeding import seed_dataset
+from meetup.state_storage import DatabaseStateStorage
+from meetup.webhook import BotRunner
+
+
+def create_event(talks, guests=3):
+    event = Event.objects.create(topic='Python Meetup', date=date.today(), active=True)
+    for number in range(talks):
+        speaker = Guest.objects.create(name=f'Спикер {number}', telegram_id=1000 + number)
+        schedule = Schedule.objects.create(
+            event=event,
+            topic=f'Доклад {number}',
+            start_at=time(10 + number % 10),
+            end_at=time(11 + number % 10),
+            speaker=speaker,
+            active=number == 0,
+        )
+        Question.objects.create(question='Вопрос', schedule=schedule, guest=speaker)
+        db.save_payment(100, event, speaker)
+    for number in range(guests):
+        guest = Guest.objects.create(name=f'Гость {number}', telegram_id=5000 + number, open_for_contact=True)
+        EventGuests.objects.create(event=event, guest=guest)
+    return event
+
+
+class QueryCountTestCase(TestCase):
+    """Число запросов не должно зависеть от числа докладов мероприятия"""
+
+    def setUp(self):
+        active_event_cache.invalidate()
+        active_schedule_cache.invalidate()
+        invalidate_event_views()
+
+    def assertConstantQueries(self, num, func):
+        for talks in (2, 15):
+            with self.subTest(talks=talks):
+                Event.objects.all().delete()
+                Guest.objects.all().delete()
+                self.setUp()
+                event = create_event(talks)
+                with self.assertNumQueries(num):
+                    func(event)
+
+    def test_schedule_text(self):
+        self.assertConstantQueries(1, lambda event: db.get_schedule_text(event.id))
+
+    def test_speech_keyboard(self):
+        self.assertConstantQueries(1, lambda event: db.get_speech_keyboard(event.id))
+
+    def test_control_keyboard(self):
+        self.assertConstantQueries(1, lambda event: db.get_speech_keyboard(event.id, control=True))
+
+    def test_event_schedules(self):
+        def render(event):
+            for speech in db.get_event_schedules(event.id):
+                str(speech.speaker)
+        self.assertConstantQueries(1, render)
+
+    def test_speaker_questions(self):
+        speaker = Guest.objects.create(name='Спикер', telegram_id=1)
+        for talks in (2, 15):
+            with self.subTest(talks=talks):
+                event = create_event(0, guests=0)
+                for number in range(talks):
+                    schedule = Schedule.objects.create(event=event, topic=f'Доклад {number}', speaker=speaker)
+                    Question.objects.create(question='Вопрос', schedule=schedule, guest=speaker)
+                with self.assertNumQueries(2):
+                    db.get_speaker_questions(event, speaker)
+                Event.objects.all().delete()
+
+    def test_event_speakers_ids(self):
+        self.assertConstantQueries(1, lambda event: db.get_event_speakers_ids(event.id))
+
+    def test_event_guests_ids(self):
+        self.assertConstantQueries(1, lambda event: db.get_event_guests_ids(event.id))
+
+    def test_contacts(self):
+        self.assertConstantQueries(2, lambda event: db.get_contacts(5000, limit=5))
+
+    def test_all_events(self):
+        self.assertConstantQueries(1, lambda event: db.get_all_events())
+
+    def test_report_donations(self):
+        self.assertConstantQueries(1, lambda event: db.report_donations(event.id))
+
+    def test_active_event_is_cached(self):
+        event = create_event(3)
+        with self.assertNumQueries(1):
+            self.assertEqual(db.get_active_event(), event)
+        with self.assertNumQueries(0):
+            self.assertEqual(db.get_active_event(), event)
+
+    def test_active_schedule_is_cached(self):
+        create_event(3)
+        with self.assertNumQueries(2):
+            schedule = db.get_active_schedule()
+        with self.assertNumQueries(0):
+            self.assertEqual(db.get_active_schedule(), schedule)
+            str(schedule.speaker)
+
+    def test_cached_views_are_free(self):
+        event = create_event(3)
+        db.get_schedule_text(event.id)
+        with self.assertNumQueries(0):
+            db.get_schedule_text(event.id)
+
+
+class CacheInvalidationTestCase(TestCase):
+
+    def setUp(self):
+        active_event_cache.invalidate()
+        active_schedule_cache.invalidate()
+        invalidate_event_views()
+        self.event = create_event(3)
+
+    def test_set_active_schedule(self):
+        speech = Schedule.objects.filter(event=self.event).last()
+        db.get_active_schedule()
+        db.set_active_schedule(self.event.id, speech.id)
+        self.assertEqual(db.get_active_schedule(), speech)
+
+    def test_event_save(self):
+        db.get_active_event()
+        self.event.topic = 'Новая тема'
+        self.event.save()
+        self.assertEqual(db.get_active_event().topic, 'Новая тема')
+
+    def test_schedule_save_updates_view(self):
+        speech = Schedule.objects.filter(event=self.event).first()
+        self.assertNotIn('Новый доклад', db.get_schedule_text(self.event.id))
+        speech.topic = 'Новый доклад'
+        speech.save()
+        self.assertIn('Новый доклад', db.get_schedule_text(self.event.id))
+
+    def test_update_speech_updates_keyboard(self):
+        speech = Schedule.objects.filter(event=self.event).first()
+        db.get_speech_keyboard(self.event.id)
+        db.update_speech(speech.id, {'topic': 'Другой доклад'})
+        self.assertIn('Другой доклад', json.loads(db.get_speech_keyboard(self.event.id))['inline_keyboard'][0][0]['text'])
+
+    def test_speaker_rename_updates_view(self):
+        speech = Schedule.objects.filter(event=self.event).first()
+        db.get_schedule_text(self.event.id)
+        db.update_speech_speaker(speech.id, {'speaker_id': speech.speaker.telegram_id, 'speaker_name': 'Новое имя'})
+        self.assertIn('Новое имя', db.get_schedule_text(self.event.id))
+
+    def test_deactivated_event_drops_schedule(self):
+        self.assertIsNotNone(db.get_active_schedule())
+        self.event.active = False
+        self.event.save()
+        self.assertIsNone(db.get_active_schedule())
+
+    def test_expired_event_drops_schedule(self):
+        self.assertIsNotNone(db.get_active_schedule())
+        yesterday = date.today() - timedelta(days=1)
+        Event.objects.filter(id=self.event.id).update(date=yesterday)
+        # Наступила полночь: в кэше то же мероприятие, но уже прошедшее
+        db.get_active_event().date = yesterday
+        self.assertIsNone(db.get_active_event())
+        self.assertIsNone(db.get_active_schedule())
+
+
+class IndexTestCase(TestCase):
+
+    def test_active_event_uses_partial_index(self):
+        plan = explain(Event.objects.filter(date__gte=date.today(), active=True))
+        self.assertIn('event_active_date_idx', ' '.join(plan))
+
+    def test_event_schedules_are_sorted_by_index(self):
+        plan = ' '.join(explain(Schedule.objects.filter(event_id=1).order_by('start_at')))
+        self.assertIn('schedule_event_start_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_event_guest_is_unique(self):
+        event = create_event(0, guests=1)
+        with self.assertRaises(IntegrityError):
+            EventGuests.objects.create(event=event, guest=Guest.objects.get())
+
+
+class SeedingTestCase(TestCase):
+
+    def test_dataset_sizes(self):
+        rows = seed_dataset(
+            guests=100, events=2, attendance=0.5, questions_per_talk=3, donations=0.2, friends_per_guest=2,
+        )
+        self.assertEqual(rows['attendance'], EventGuests.objects.count())
+        self.assertEqual(rows['friends'], Friend.objects.count())
+        self.assertEqual(Schedule.objects.get(active=True).event, Event.objects.get(active=True))
+        self.assertEqual(Question.objects.count(), 2 * 7 * 3)
+        self.assertEqual(Donation.objects.count(), 2 * 10)
+        self.assertEqual(DonationTotals.objects.aggregate(count=models.Sum('count'))['count'], 2 * 10)
+        self.assertFalse(Question.objects.exclude(guest__events__event=models.F('schedule__event')).exists())
+
+
+class ActiveSwitchTestCase(TestCase):
+
+    def setUp(self):
+        active_event_cache.invalidate()
+        active_schedule_cache.invalidate()
+        self.archive = create_event(3, guests=0)
+        self.archive.active = False
+        self.archive.save()
+        self.event = Event.objects.create(topic='Текущее', date=date.today())
+        self.speeches = [
+            Schedule.objects.create(event=self.event, topic=f'Доклад {number}', active=number == 0)
+            for number in range(3)
+        ]
+
+    def test_set_active_schedule_is_one_statement(self):
+        with self.assertNumQueries(1):
+            db.set_active_schedule(self.event.id, self.speeches[2].id)
+        self.assertEqual(
+            list(Schedule.objects.filter(event=self.event, active=True)),
+            [self.speeches[2]],
+        )
+
+    def test_set_active_schedule_keeps_other_events(self):
+        db.set_active_schedule(self.event.id, self.speeches[1].id)
+        self.assertTrue(Schedule.objects.filter(event=self.archive, active=True).exists())
+
+    def test_set_active_event(self):
+        with self.assertNumQueries(2):
+            event = db.set_active_event(self.event.id)
+        self.assertTrue(event.active)
+        self.assertEqual(list(Event.objects.filter(active=True)), [self.event])
+        self.assertEqual(db.get_active_schedule(), self.speeches[0])
+
+
+class CheckinTestCase(TestCase):
+
+    def test_checkins_are_written_in_one_batch(self):
+        event = create_event(0, guests=1)
+        known = Guest.objects.get()
+        checkins = [(known.telegram_id, event.id), (1, event.id), (2, event.id), (1, event.id)]
+        with self.assertNumQueries(6):
+            db.add_guests_to_events(checkins)
+        self.assertEqual(event.guests.count(), 3)
+        self.assertEqual(Guest.objects.count(), 3)
+
+    def test_repeated_checkin_is_ignored(self):
+        event = create_event(0, guests=0)
+        db.add_guests_to_events([(1, event.id)])
+        db.add_guests_to_events([(1, event.id)])
+        self.assertEqual(EventGuests.objects.count(), 1)
+
+    def test_checkin_to_deleted_event(self):
+        event = create_event(0, guests=0)
+        deleted = Event.objects.create(topic='Отменено', date=date.today())
+        deleted_id = deleted.id
+        deleted.delete()
+        with self.assertLogs('meetup.db_operations', 'WARNING'):
+            db.add_guests_to_events([(1, event.id), (2, deleted_id)])
+        self.assertEqual(list(EventGuests.objects.values_list('guest__telegram_id', 'event')), [(1, event.id)])
+        with self.assertLogs('meetup.db_operations', 'WARNING'):
+            db.add_guests_to_events([(2, deleted_id)])
+        self.assertFalse(Guest.objects.filter(telegram_id=2).exists())
+
+
+class DonationTotalsTestCase(TestCase):
+
+    def test_totals_follow_payments(self):
+        event = create_event(3, guests=0)
+        guest = Guest.objects.first()
+        db.save_payment(500, event, guest)
+        with self.assertNumQueries(1):
+            self.assertEqual(db.report_donations(event.id), {'count': 4, 'summa': 800})
+        day = DonationDayTotals.objects.get(event=event)
+        self.assertEqual((day.day, day.count, day.amount), (date.today(), 4, 800))
+
+    def test_rebuild(self):
+        event = create_event(2, guests=0)
+        other = Event.objects.create(topic='Python Meetup', date=date.today())
+        db.save_payment(100, other, None)
+        Donation.objects.filter(event=event).update(amount=1000)
+        DonationTotals.objects.filter(event=other).update(count=0)
+
+        self.assertEqual(db.rebuild_donation_totals(), 2)
+        self.assertEqual(db.report_donations(event.id), {'count': 2, 'summa': 2000})
+        self.assertEqual(db.report_donations(other.id), {'count': 1, 'summa': 100})
+        self.assertEqual(DonationDayTotals.objects.count(), 2)
+
+    def test_report_without_donations(self):
+        event = create_event(0, guests=0)
+        self.assertEqual(db.report_donations(event.id), {'count': 0, 'summa': 0})
+
+
+class AdminTestCase(TestCase):
+    """Число запросов страниц admin не должно зависеть от числа гостей"""
+
+    maxDiff = None
+
+    PAGES = [
+        ('admin:meetup_guest_changelist', (), {}),
+        ('admin:meetup_guest_changelist', (), {'q': '5001'}),
+        ('admin:meetup_guest_changelist', (), {'q': 'Гость 1'}),
+        ('admin:meetup_eventguests_changelist', (), {}),
+        ('admin:meetup_eventguests_add', (), {}),
+        ('admin:meetup_friend_changelist', (), {}),
+        ('admin:meetup_question_changelist', (), {}),
+        ('admin:meetup_question_add', (), {}),
+        ('admin:meetup_donation_changelist', (), {}),
+        ('admin:meetup_donation_add', (), {}),
+        ('admin:meetup_schedule_changelist', (), {}),
+        ('admin:autocomplete', (), {'app_label': 'meetup', 'model_name': 'donation', 'field_name': 'guest', 'term': 'Гость'}),
+    ]
+
+    def setUp(self):
+        self.client.force_login(User.objects.create(username='admin', is_staff=True, is_superuser=True))
+
+    def count_queries(self):
+        counts = {}
+        for name, args, query in self.PAGES:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse(name, args=args), query)
+            self.assertEqual(response.status_code, 200, name)
+            counts[name, tuple(query.items())] = len(queries)
+        return counts
+
+    def add_guests(self, event, first, count):
+        guests = Guest.objects.bulk_create(
+            Guest(name=f'Гость {number}', telegram_id=5000 + number) for number in range(first, first + count)
+        )
+        EventGuests.objects.bulk_create(EventGuests(event=event, guest=guest) for guest in guests)
+        Friend.objects.bulk_create(Friend(guest=guest, friend=guests[0]) for guest in guests[1:])
+        Question.objects.bulk_create(Question(question='Вопрос', guest=guest) for guest in guests)
+        Donation.objects.bulk_create(Donation(amount=100, event=event, guest=guest) for guest in guests)
+
+    def test_query_count_does_not_grow(self):
+        event = create_event(2, guests=0)
+        self.add_guests(event, 0, 3)
+        # Первый проход заполняет кеш ContentType
+        self.count_queries()
+        small = self.count_queries()
+        self.add_guests(event, 3, 300)
+        self.assertEqual(self.count_queries(), small)
+
+    def test_donation_edits_keep_totals(self):
+        event = create_event(2, guests=0)
+        other = Event.objects.create(topic='Другое мероприятие', date=date.today())
+        donation = Donation.objects.filter(event=event).first()
+        url = reverse('admin:meetup_donation_change', args=[donation.id])
+        data = {
+            'amount': 700,
+            'guest': donation.guest_id,
+            'event': event.id,
+            'created_at_0': donation.created_at.strftime('%Y-%m-%d'),
+            'created_at_1': donation.created_at.strftime('%H:%M:%S'),
+        }
+        self.assertEqual(self.client.post(url, data).status_code, 302)
+        self.assertEqual(db.report_donations(event.id), {'count': 2, 'summa': 800})
+
+        self.client.post(url, {**data, 'event': other.id})
+        self.assertEqual(db.report_donations(event.id), {'count': 1, 'summa': 100})
+        self.assertEqual(db.report_donations(other.id), {'count': 1, 'summa': 700})
+
+        self.client.post(reverse('admin:meetup_donation_delete', args=[donation.id]), {'post': 'yes'})
+        self.assertEqual(db.report_donations(other.id), {'count': 0, 'summa': 0})
+        self.client.post(reverse('admin:meetup_donation_changelist'), {
+            'action': 'delete_selected',
+            '_selected_action': list(Donation.objects.values_list('id', flat=True)),
+            'post': 'yes',
+        })
+        self.assertEqual(db.report_donations(event.id), {'count': 0, 'summa': 0})
+        self.assertFalse(DonationDayTotals.objects.exists())
+
+    def test_totals_are_read_only(self):
+        event = create_event(1, guests=0)
+        totals = DonationTotals.objects.get(event=event)
+        self.assertEqual(self.client.get(reverse('admin:meetup_donationtotals_add')).status_code, 403)
+        response = self.client.post(reverse('admin:meetup_donationtotals_change', args=[event.id]), {'count': 5, 'amount': 5})
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(self.client.get(reverse('admin:meetup_donationtotals_changelist')).status_code, 200)
+        totals.refresh_from_db()
+        self.assertEqual((totals.count, totals.amount), (1, 100))
+
+    def test_search_by_telegram_id(self):
+        create_event(0, guests=3)
+        response = self.client.get(reverse('admin:meetup_eventguests_changelist'), {'q': '5001'})
+        self.assertEqual([row.guest.telegram_id for row in response.context['cl'].result_list], [5001])
+
+    def test_search_by_odd_numbers(self):
+        create_event(0, guests=1)
+        Guest.objects.create(name='9' * 30, telegram_id=1)
+        for term, names in (('²', []), ('9' * 30, ['9' * 30]), ('9' * 5000, [])):
+            with self.subTest(term=term):
+                response = self.client.get(reverse('admin:meetup_guest_changelist'), {'q': term})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual([guest.name for guest in response.context['cl'].result_list], names)
+
+
+class ExportTestCase(TestCase):
+
+    def test_csv_in_chunks(self):
+        create_event(0, guests=5)
+        chunks = list(stream_export('guests', chunk_size=2))
+        # Заголовок, две полные пачки и остаток
+        self.assertEqual(len(chunks), 4)
+        rows = list(csv.DictReader(io.StringIO(''.join(chunks))))
+        self.assertEqual([row['telegram_id'] for row in rows], [str(5000 + number) for number in range(5)])
+
+    def test_ndjson_for_event(self):
+        event = create_event(2, guests=0)
+        Event.objects.create(topic='Другое мероприятие', date=date.today())
+        lines = ''.join(stream_export('questions', 'ndjson', event_id=event.id)).splitlines()
+        questions = [json.loads(line) for line in lines]
+        self.assertEqual([question['talk_topic'] for question in questions], ['Доклад 0', 'Доклад 1'])
+        self.assertEqual(questions[0]['speaker'], 'Спикер 0')
+
+    def test_view_is_staff_only(self):
+        url = reverse('export', args=['donations'])
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(User.objects.create(username='admin', is_staff=True))
+        response = self.client.get(url, {'format': 'ndjson'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(b''.join(response.streaming_content), b'')
+        self.assertEqual(self.client.get(reverse('export', args=['passwords'])).status_code, 404)
+
+
+class SubscriptionTestCase(TestCase):
+
+    def test_subscribers(self):
+        event = create_event(0, guests=1)
+        guest = Guest.objects.get()
+        db.set_subscription(guest.telegram_id, event.id, True)
+        db.set_subscription(100, event.id, True)
+        self.assertCountEqual(db.get_subscribers_ids(event.id), [guest.telegram_id, 100])
+
+        db.set_subscription(100, event.id, False)
+        self.assertFalse(db.is_subscribed(100, event.id))
+        self.assertEqual(db.get_subscribers_ids(event.id), [guest.telegram_id])
+        self.assertEqual(EventGuests.objects.filter(event=event).count(), 2)
+
+
+class QuestionIntakeTestCase(TestCase):
+
+    def test_questions_are_written_in_one_batch(self):
+        create_event(1, guests=0)
+        schedule = Schedule.objects.get()
+        speaker = schedule.speaker
+        with self.assertNumQueries(3):
+            db.create_questions([
+                (speaker.telegram_id, schedule.id, 'Первый'),
+                (1, schedule.id, 'Второй'),
+            ])
+        self.assertEqual(
+            list(Question.objects.filter(question__in=['Первый', 'Второй']).values_list('question', 'guest')),
+            [('Первый', speaker.id), ('Второй', None)],
+        )
+
+    def test_question_to_deleted_talk(self):
+        create_event(1, guests=0)
+        schedule = Schedule.objects.get()
+        schedule_id = schedule.id
+        schedule.questions.all().delete()
+        schedule.delete()
+        with self.assertLogs('meetup.db_operations', 'WARNING'):
+            db.create_questions([(1, schedule_id, 'Вопрос')])
+        self.assertEqual(list(Question.objects.values_list('question', 'schedule')), [('Вопрос', None)])
+
+
+class SqliteProfileTestCase(TestCase):
+
+    def test_pragmas_are_applied(self):
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)
+            cursor.execute('PRAGMA temp_store')
+            self.assertEqual(cursor.fetchone()[0], 2)
+
+
+class WebhookTestCase(SimpleTestCase):
+
+    @override_settings(WEBHOOK_SECRET='')
+    def test_disabled_without_secret(self):
+        response = self.client.post(reverse('telegram_webhook'), '{}', content_type='application/json')
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(WEBHOOK_SECRET='secret')
+    def test_wrong_secret(self):
+        response = self.client.post(
+            reverse('telegram_webhook'),
+            '{}',
+            content_type='application/json',
+            HTTP_X_TELEGRAM_BOT_API_SECRET_TOKEN='wrong',
+        )
+        self.assertEqual(response.status_code, 403)
+
+    def test_only_post(self):
+        self.assertEqual(self.client.get(reverse('telegram_webhook')).status_code, 405)
+
+    @override_settings(WEBHOOK_SECRET='secret')
+    def test_update_is_processed(self):
+        processed = []
+        done = threading.Event()
+
+        class Bot:
+            async def process_new_updates(self, updates):
+                processed.extend(updates)
+                done.set()
+
+        async def noop():
+            pass
+
+        bot_module = types.ModuleType('meetup_bot')
+        bot_module.bot = Bot()
+        bot_module.start_workers = bot_module.stop_workers = noop
+        runner = BotRunner()
+        update = {'update_id': 1, 'message': {'message_id': 1, 'date': 0, 'chat': {'id': 7, 'type': 'private'}, 'text': '/start'}}
+        with mock.patch.dict(sys.modules, {'meetup_bot': bot_module}), mock.patch('meetup.views.runner', runner):
+            try:
+                response = self.client.post(
+                    reverse('telegram_webhook'),
+                    json.dumps(update),
+                    content_type='application/json',
+                    HTTP_X_TELEGRAM_BOT_API_SECRET_TOKEN='secret',
+                )
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(done.wait(5))
+            finally:
+                runner.stop()
+        self.assertEqual([(update.update_id, update.message.text) for update in processed], [(1, '/start')])
+
+
+class HandlerMetricsTestCase(TestCase):
+
+    def test_handler_queries_are_counted(self):
+        metrics = HandlerMetrics()
+        with metrics.measure():
+            set_handler('guest_menu', 'schedule')
+            Guest.objects.count()
+            Event.objects.count()
+        Guest.objects.count()
+
+        stats = metrics.stats[('guest_menu', 'schedule')]
+        self.assertEqual((stats.count, stats.db_queries, stats.api_calls), (1, 2, 0))
+        text = metrics.render()
+        self.assertIn('meetup_handler_seconds_count{handler="guest_menu",prefix="schedule"} 1', text)
+        self.assertIn('meetup_handler_db_queries_total{handler="guest_menu",prefix="schedule"} 2', text)
+
+    def test_sampling(self):
+        metrics = HandlerMetrics(sample_rate=0)
+        with metrics.measure() as sample:
+            self.assertIsNone(sample)
+            Guest.objects.count()
+        self.assertEqual((metrics.sampled, metrics.skipped, metrics.stats), (0, 1, {}))
+
+    def test_collectors(self):
+        metrics = HandlerMetrics()
+        metrics.register('meetup_queue_depth', 'Глубина', 'gauge', lambda: [({'shard': 0}, 3)])
+        self.assertIn('meetup_queue_depth{shard="0"} 3', metrics.render())
+
+    @override_settings(METRICS_TOKEN='')
+    def test_view_disabled_without_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+
+    @override_settings(METRICS_TOKEN='token')
+    def test_view_requires_token(self):
+        self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer token')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'meetup_metrics_sample_rate', response.content)
+
+
+class QueryLogTestCase(TestCase):
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            fingerprint('SELECT * FROM "meetup_guest"\n WHERE "id" IN (%s, %s, %s) AND name = \'Ann\' LIMIT 21'),
+            'SELECT * FROM "meetup_guest" WHERE "id" IN (...) AND name = ? LIMIT ?',
+        )
+        self.assertEqual(
+            fingerprint('INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s), (%s, %s)'),
+            'INSERT INTO t (a, b) VALUES (...), ...',
+        )
+
+    def test_queries_are_grouped_by_caller(self):
+        guest = Guest.objects.create(name='Гость', telegram_id=1)
+        query_log = QueryLog(slow_ms=0)
+        with connection.execute_wrapper(query_log), self.assertLogs('meetup.querylog', 'WARNING') as logs:
+            db.get_guest(guest.telegram_id)
+            db.get_guest(guest.telegram_id + 1)
+
+        [top] = query_log.top()
+        self.assertEqual(top['count'], 2)
+        self.assertEqual(top['callers'], {'db_operations.get_guest': 2})
+        self.assertEqual(query_log.slow, 2)
+        self.assertIn('db_operations.get_guest', logs.output[0])
+
+
+class ConnectionWrappersTestCase(TransactionTestCase):
+
+    @override_settings(SQL_LOG=True)
+    def test_wrappers_survive_reconnects(self):
+        wrapper = connections.create_connection('default')
+        try:
+            for _ in range(3):
+                # close() не закрывает тестовую базу в памяти, поэтому
+                # переподключаемся, как после CONN_MAX_AGE, вручную
+                if wrapper.connection is not None:
+                    wrapper.connection.close()
+                wrapper.connect()
+            self.assertEqual(wrapper.execute_wrappers.count(query_log), 1)
+            self.assertEqual(wrapper.execute_wrappers.count(metrics.execute_wrapper), 1)
+        finally:
+            wrapper.connection.close()
+
+
+class RecordingBot:
+    """Запоминает вызовы Bot API; edit_message_text отвечает ошибкой `edit_error`"""
+
+    def __init__(self, edit_error=None):
+        self.edit_error = edit_error
+        self.calls = []
+        self.texts = []
+
+    async def edit_message_text(self, text, **kwargs):
+        self.calls.append('editMessageText')
+        self.texts.append(text)
+        if self.edit_error:
+            raise ApiTelegramException('editMessageText', None, {'error_code': 400, 'description': self.edit_error})
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.calls.append('sendMessage')
+        self.texts.append(text)
+
+
+def make_call(data='guest_menu', chat_id=1, **message):
+    return CallbackQuery.de_json({
+        'id': '1',
+        'chat_instance': '1',
+        'data': data,
+        'from': {'id': chat_id, 'is_bot': False, 'first_name': 'Гость'},
+        'message': {'message_id': 10, 'date': 0, 'chat': {'id': chat_id, 'type': 'private'}, **message},
+    })
+
+
+class RouterTestCase(SimpleTestCase):
+
+    def setUp(self):
+        self.router = CallbackRouter()
+
+        @self.router.route('event', int)
+        async def event(call, event_id):
+            return 'event', event_id
+
+        @self.router.route('event_delete', int, str)
+        async def event_delete(call, event_id, answer):
+            return 'event_delete', event_id, answer
+
+        @self.router.route('menu')
+        async def menu(call):
+            return 'menu'
+
+    def test_exact_prefix(self):
+        handler, args = self.router.resolve('event:5')
+        self.assertEqual((handler.__name__, args), ('event', [5]))
+        handler, args = self.router.resolve('event_delete:5:yes')
+        self.assertEqual((handler.__name__, args), ('event_delete', [5, 'yes']))
+        self.assertIsNone(self.router.resolve('even:5'))
+        self.assertIsNone(self.router.resolve('events:5'))
+
+    def test_wrong_number_of_args(self):
+        self.assertIsNone(self.router.resolve('event'))
+        self.assertIsNone(self.router.resolve('event:5:6'))
+        self.assertIsNone(self.router.resolve('menu:1'))
+        self.assertEqual(self.router.resolve('menu')[1], [])
+
+    def test_bad_arg_type(self):
+        self.assertIsNone(self.router.resolve('event:пять'))
+
+    def test_registration_errors(self):
+        with self.assertRaises(ValueError):
+            self.router.route('event', int)(lambda call, event_id: None)
+        with self.assertRaises(ValueError):
+            self.router.route('event:delete')
+
+    async def test_dispatch(self):
+        self.assertEqual(await self.router.dispatch(make_call('event_delete:7:no')), ('event_delete', 7, 'no'))
+        with self.assertLogs('meetup.router', 'WARNING'):
+            self.assertIsNone(await self.router.dispatch(make_call('unknown:1')))
+
+    def test_callback_data_limit(self):
+        self.assertEqual(make_callback_data('event_delete', 7, 'yes'), 'event_delete:7:yes')
+        self.assertEqual(len(make_callback_data('q', 'x' * 62)), 64)
+        with self.assertRaises(ValueError):
+            make_callback_data('q', 'x' * 63)
+        # Ограничение в байтах, а не в символах
+        with self.assertRaises(ValueError):
+            make_callback_data('q', 'ы' * 32)
+
+
+class NavigatorTestCase(SimpleTestCase):
+
+    async def test_message_is_edited_in_place(self):
+        bot = RecordingBot()
+        navigator = Navigator(bot)
+        await navigator.show(make_call(text='Меню'), 'Расписание')
+        self.assertEqual(bot.calls, ['editMessageText'])
+
+    async def test_same_screen_is_not_sent_again(self):
+        bot = RecordingBot('Bad Request: message is not modified')
+        navigator = Navigator(bot)
+        await navigator.show(make_call(text='Меню'), 'Меню')
+        self.assertEqual(bot.calls, ['editMessageText'])
+        self.assertEqual(navigator.stats()['unchanged'], 1)
+
+    async def test_fallback_to_new_message(self):
+        bot = RecordingBot("Bad Request: message can't be edited")
+        navigator = Navigator(bot)
+        with self.assertLogs('meetup.navigation', 'INFO'):
+            await navigator.show(make_call(text='Меню'), 'Расписание')
+        # Сообщение без текста (например, счет на оплату) не редактируется
+        await navigator.show(make_call(invoice={
+            'title': 'Донат', 'description': '', 'start_parameter': '', 'currency': 'RUB', 'total_amount': 100,
+        }), 'Расписание')
+        self.assertEqual(bot.calls, ['editMessageText', 'sendMessage', 'sendMessage'])
+        self.assertEqual(navigator.stats(), {'edited': 0, 'unchanged': 0, 'sent': 2})
+
+
+class FakeTelegramTestCase(SimpleTestCase):
+
+    async def call(self, telegram, method, **params):
+        async with ClientSession() as session:
+            async with session.post(f'{telegram.url}/bot1:token/{method}', data=params) as response:
+                return await response.json()
+
+    async def test_updates_and_replies(self):
+        telegram = FakeTelegram()
+        await telegram.start()
+        try:
+            telegram.push_message(7, '/start')
+            updates = (await self.call(telegram, 'getUpdates', offset=0))['result']
+            self.assertEqual(updates[0]['message']['text'], '/start')
+            self.assertEqual(
+                (await self.call(telegram, 'getUpdates', offset=updates[0]['update_id'] + 1))['result'],
+                [],
+            )
+            await self.call(telegram, 'sendMessage', chat_id=7, text='Привет')
+            method, text, _ = telegram.replies[7].get_nowait()
+            self.assertEqual((method, text), ('sendMessage', 'Привет'))
+        finally:
+            await telegram.stop()
+
+    async def test_too_many_requests(self):
+        telegram = FakeTelegram(error_rate=1)
+        await telegram.start()
+        try:
+            response = await self.call(telegram, 'sendMessage', chat_id=7, text='Привет')
+            self.assertEqual(response['error_code'], 429)
+            self.assertEqual(telegram.throttled, 1)
+        finally:
+            await telegram.stop()
+
+
+class BatchWriterTestCase(SimpleTestCase):
+
+    async def test_stop_flushes_pending(self):
+        batches = []
+
+        async def flush(items):
+            batches.append(items)
+
+        writer = BatchWriter(flush, interval=60)
+        writer.start()
+        writer.add(1)
+        writer.add(2)
+        await writer.stop()
+        self.assertEqual(batches, [[1, 2]])
+        self.assertEqual(writer.pending, 0)
+
+    async def test_failed_flush_keeps_items(self):
+        async def flush(items):
+            raise RuntimeError
+
+        writer = BatchWriter(flush)
+        writer.add(1)
+        with self.assertRaises(RuntimeError):
+            await writer.flush()
+        self.assertEqual(writer.pending, 1)
+
+    async def test_bad_item_is_dropped_after_retries(self):
+        written = []
+
+        async def flush(items):
+            if 'плохая' in items:
+                raise RuntimeError
+            written.extend(items)
+
+        writer = BatchWriter(flush, max_retries=3)
+        for item in (1, 'плохая', 2):
+            writer.add(item)
+        for _ in range(2):
+            with self.assertRaises(RuntimeError):
+                await writer.flush()
+        with self.assertLogs('meetup.batching', 'ERROR'):
+            self.assertEqual(await writer.flush(), 2)
+        self.assertEqual(written, [1, 2])
+        self.assertEqual((writer.pending, writer.stats()['dropped']), (0, 1))
+
+        writer.add(3)
+        self.assertEqual(await writer.flush(), 1)
+
+
+class DebouncerTestCase(SimpleTestCase):
+
+    async def test_changes_are_coalesced(self):
+        fired = []
+
+        async def action(key):
+            fired.append(key)
+
+        debouncer = Debouncer(action, interval=0.02)
+        for _ in range(5):
+            debouncer.trigger(1)
+        debouncer.trigger(2)
+        await asyncio.sleep(0.05)
+        self.assertEqual(sorted(fired), [1, 2])
+
+        debouncer.trigger(1)
+        await asyncio.sleep(0.05)
+        self.assertEqual(fired.count(1), 2)
+
+    async def test_stop_fires_pending(self):
+        fired = []
+
+        async def action(key):
+            fired.append(key)
+
+        debouncer = Debouncer(action, interval=60)
+        debouncer.trigger(1)
+        await debouncer.stop()
+        self.assertEqual(fired, [1])
+        self.assertEqual(debouncer.stats()['pending'], 0)
+
+
+class StateStorageTestCase(TransactionTestCase):
+
+    async def test_state_survives_restart(self):
+        storage = DatabaseStateStorage()
+        await storage.set_state(1, 1, 'guest_kind')
+        await storage.set_data(1, 1, 'date', date(2024, 5, 1))
+        restarted = DatabaseStateStorage()
+        self.assertEqual(await restarted.get_state(1, 1), 'guest_kind')
+        self.assertEqual(await restarted.get_data(1, 1), {'date': '2024-05-01'})
+
+    async def test_expired_state_is_dropped(self):
+        storage = DatabaseStateStorage(ttl=0)
+        await storage.set_state(1, 1, 'guest_kind')
+        self.assertIsNone(await DatabaseStateStorage(ttl=0).get_state(1, 1))
+
+    async def test_cache_is_bounded(self):
+        storage = DatabaseStateStorage(cache_size=10)
+        for chat_id in range(50):
+            await storage.set_state(chat_id, chat_id, 'guest_phone')
+        self.assertEqual(storage.cache_info()['size'], 10)
+        self.assertEqual(await storage.get_state(0, 0), 'guest_phone')
+
+    async def test_delete_state(self):
+        storage = DatabaseStateStorage()
+        await storage.set_state(1, 1, 'make_payment')
+        self.assertTrue(await storage.delete_state(1, 1))
+        self.assertIsNone(await storage.get_state(1, 1))
+        self.assertFalse(await ChatState.objects.filter(chat_id=1).aexists())
+
+
+def api_error(error_code, description, **parameters):
+    result = {'ok': False, 'error_code': error_code, 'description': description}
+    if parameters:
+        result['parameters'] = parameters
+    return ApiTelegramException('sendMessage', None, result)
+
+
+class ScriptedBot:
+    """Отвечает на send_message ошибками из `errors` по очереди, потом успехом"""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append(chat_id)
+        if self.errors:
+            raise self.errors.pop(0)
+
+
+class RateLimitTestCase(SimpleTestCase):
+
+    async def elapsed(self, *coroutines):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        for coroutine in coroutines:
+            await coroutine
+        return loop.time() - started
+
+    async def test_global_rate(self):
+        limiter = RateLimiter(rate=100)
+        self.assertGreaterEqual(await self.elapsed(*[limiter.acquire() for _ in range(6)]), 0.05)
+
+    async def test_pause(self):
+        limiter = RateLimiter(rate=1000)
+        limiter.pause(0.05)
+        self.assertGreaterEqual(await self.elapsed(limiter.acquire()), 0.05)
+
+    async def test_per_chat_interval(self):
+        limiter = ChatRateLimiter(interval=0.05)
+        self.assertLess(await self.elapsed(*[limiter.acquire(chat_id) for chat_id in range(5)]), 0.05)
+        self.assertGreaterEqual(await self.elapsed(limiter.acquire(0), limiter.acquire(0)), 0.1)
+
+    async def test_retry_after_429(self):
+        bot = ScriptedBot(api_error(429, 'Too Many Requests', retry_after=0.05))
+        broadcaster = Broadcaster(bot, rate=1000, per_chat_interval=0)
+        with self.assertLogs('meetup.broadcast', 'INFO'):
+            self.assertGreaterEqual(await self.elapsed(broadcaster.send_one(1, 'Привет')), 0.05)
+        self.assertEqual(bot.sent, [1, 1])
+
+    async def test_too_many_429(self):
+        bot = ScriptedBot(*[api_error(429, 'Too Many Requests', retry_after=0.01) for _ in range(3)])
+        broadcaster = Broadcaster(bot, rate=1000, per_chat_interval=0, max_retries=3)
+        with self.assertLogs('meetup.broadcast', 'INFO'), self.assertRaises(RetryLater):
+            await broadcaster.send_one(1, 'Привет')
+        self.assertEqual(len(bot.sent), 3)
+
+    async def test_permanent_errors(self):
+        for error in (
+            api_error(403, 'Forbidden: bot was blocked by the user'),
+            api_error(403, 'Forbidden: user is deactivated'),
+            api_error(400, 'Bad Request: chat not found'),
+        ):
+            with self.subTest(error=error.description):
+                bot = ScriptedBot(error)
+                with self.assertLogs('meetup.broadcast', 'WARNING'):
+                    self.assertFalse(await Broadcaster(bot, per_chat_interval=0).send_one(1, 'Привет'))
+                self.assertEqual(bot.sent, [1])
+
+    async def test_network_error_is_retryable(self):
+        bot = ScriptedBot(ClientConnectionError('Соединение разорвано'))
+        with self.assertRaises(RetryLater):
+            await Broadcaster(bot, per_chat_interval=0).send_one(1, 'Привет')
+        self.assertEqual(bot.sent, [1])
+
+
+class OutboxTestCase(TestCase):
+
+    def test_claim_takes_a_lease(self):
+        outbox.enqueue_messages([1, 2, 3], 'Привет')
+        first = outbox.claim_due_messages(limit=2)
+        second = outbox.claim_due_messages(limit=2)
+        self.assertEqual([message.chat_id for message in first], [1, 2])
+        self.assertEqual([message.chat_id for message in second], [3])
+        self.assertEqual(outbox.claim_due_messages(), [])
+        self.assertNotEqual(first[0].claim, second[0].claim)
+        self.assertGreater(first[0].next_attempt_at, timezone.now() + outbox.LEASE - timedelta(seconds=5))
+
+    def test_expired_lease_is_redelivered(self):
+        outbox.enqueue_messages([1], 'Привет')
+        message, = outbox.claim_due_messages()
+        # Процесс упал, не отметив отправку: аренда истекла
+        OutgoingMessage.objects.update(next_attempt_at=timezone.now() - timedelta(seconds=1))
+        redelivered, = outbox.claim_due_messages()
+        self.assertEqual(redelivered.id, message.id)
+        self.assertNotEqual(redelivered.claim, message.claim)
+
+    def test_retry_backoff(self):
+        outbox.enqueue_messages([1], 'Привет')
+        message = OutgoingMessage.objects.get()
+        for attempts, backoff in ((0, 2), (2, 8)):
+            message.attempts = attempts
+            before = timezone.now()
+            outbox.schedule_retry(message, 'Сеть недоступна')
+            message.refresh_from_db()
+            self.assertEqual((message.attempts, message.status), (attempts + 1, OutgoingMessage.PENDING))
+            delay = message.next_attempt_at - before
+            self.assertTrue(timedelta(seconds=backoff) <= delay < timedelta(seconds=backoff + 5), delay)
+
+        message.attempts = outbox.MAX_ATTEMPTS - 1
+        outbox.schedule_retry(message, 'Сеть недоступна')
+        message.refresh_from_db()
+        self.assertEqual((message.attempts, message.status), (outbox.MAX_ATTEMPTS, OutgoingMessage.FAILED))
+        self.assertEqual(message.error, 'Сеть недоступна')
+
+
+class OutboxClaimRaceTestCase(TransactionTestCase):
+
+    def test_workers_do_not_share_messages(self):
+        outbox.enqueue_messages(range(200), 'Привет')
+
+        def claim():
+            # Тестовая база в памяти не ждет блокировку, как busy timeout
+            # файловой базы, поэтому повторяем запрос сами
+            while True:
+                try:
+                    return outbox.claim_due_messages(limit=7)
+                except OperationalError:
+                    time_module.sleep(0.001)
+
+        def work():
+            claimed = []
+            while messages := claim():
+                claimed.extend(message.id for message in messages)
+            connection.close()
+            return claimed
+
+        with ThreadPoolExecutor(4) as pool:
+            claimed = [message_id for ids in pool.map(lambda _: work(), range(4)) for message_id in ids]
+        self.assertEqual(len(claimed), 200)
+        self.assertEqual(len(set(claimed)), 200)
+
+
+class FakeBroadcaster:
+    """Доставляет сообщения в чаты из `delivered`, для чатов из `retry` просит повторить"""
+
+    concurrency = 5
+
+    def __init__(self, delivered, retry=()):
+        self.delivered = set(delivered)
+        self.retry = set(retry)
+
+    async def send_one(self, chat_id, text, **kwargs):
+        if chat_id in self.retry:
+            raise RetryLater('Сеть недоступна')
+        return chat_id in self.delivered
+
+
+class OutboxWorkerTestCase(TransactionTestCase):
+
+    async def test_progress_report(self):
+        bot = RecordingBot()
+        broadcast = await outbox.aenqueue_messages([0, 1, 2], 'Привет', title='Рассылка', report_chat_id=99)
+        broadcaster = FakeBroadcaster(delivered={1}, retry={0})
+        worker = outbox.OutboxWorker(bot, broadcaster)
+
+        self.assertEqual(await worker.process_batch(), 3)
+        self.assertEqual(bot.texts, ['Рассылка: отправлено 2 из 3'])
+
+        # Сообщение в чат 0 ждет повтора и уходит после отсрочки
+        broadcaster.retry.clear()
+        broadcaster.delivered.add(0)
+        await OutgoingMessage.objects.filter(chat_id=0).aupdate(next_attempt_at=timezone.now())
+        self.assertEqual(await worker.process_batch(), 1)
+        self.assertIn('рассылка завершена', bot.texts[-1])
+        self.assertIn('Доставлено: 2', bot.texts[-1])
+        self.assertIn('Не доставлено: 1', bot.texts[-1])
+
+        await broadcast.arefresh_from_db()
+        self.assertIsNotNone(broadcast.finished_at)
+        await worker.report({broadcast.id})
+        self.assertEqual(len(bot.texts), 2)
+
+
+def make_update(update_id, chat_id):
+    return Update.de_json({
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': 0,
+            'chat': {'id': chat_id, 'type': 'private'},
+            'text': str(update_id),
+        },
+    })
+
+
+class ChatSchedulerTestCase(SimpleTestCase):
+
+    async def test_chat_order_is_kept(self):
+        processed = []
+
+        async def process(update):
+            # Первые сообщения обрабатываются дольше последних
+            await asyncio.sleep((10 - update.update_id % 10) / 1000)
+            processed.append((update.message.chat.id, update.update_id))
+
+        scheduler = ChatScheduler(process, workers=4)
+        scheduler.start()
+        for update_id in range(30):
+            scheduler.submit(make_update(update_id, chat_id=update_id % 3))
+        await scheduler.stop()
+        for chat_id in range(3):
+            self.assertEqual(
+                [update_id for chat, update_id in processed if chat == chat_id],
+                list(range(chat_id, 30, 3)),
+            )
+
+    async def test_chats_run_in_parallel(self):
+        release = asyncio.Event()
+
+        async def process(update):
+            if update.message.chat.id == 1:
+                await release.wait()
+
+        scheduler = ChatScheduler(process, workers=2, isolated_chat_ids=[1])
+        scheduler.start()
+        scheduler.submit(make_update(1, chat_id=1))
+        scheduler.submit(make_update(2, chat_id=1))
+        scheduler.submit(make_update(3, chat_id=2))
+        await asyncio.sleep(0.01)
+        stats = scheduler.stats()
+        self.assertEqual(stats[2]['depth'], 1)
+        self.assertEqual(sum(shard['processed'] for shard in stats), 1)
+        release.set()
+        await scheduler.stop()
@@ -1,3 +1,60 @@
-from django.shortcuts import render
+import hmac
 
-# Create your views here.
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404, HttpResponse, HttpResponseForbidden, HttpResponseNotFound, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+
+from .exports import EXPORTS, FORMATS, stream_export
+from .metrics import handler_metrics
+from .webhook import runner
+
+
+SECRET_HEADER = 'HTTP_X_TELEGRAM_BOT_API_SECRET_TOKEN'
+
+
+@csrf_exempt
+@require_POST
+def telegram_webhook(request):
+    """Принимает обновления от Telegram и сразу отвечает, обработка идет в фоне"""
+    secret = settings.WEBHOOK_SECRET
+    if not secret:
+        return HttpResponseNotFound()
+    if not hmac.compare_digest(request.META.get(SECRET_HEADER, ''), secret):
+        return HttpResponseForbidden()
+
+    runner.submit(request.body.decode())
+    return HttpResponse()
+
+
+@require_GET
+def metrics(request):
+    """Показатели бота этого процесса в текстовом формате Prometheus"""
+    token = settings.METRICS_TOKEN
+    if not token:
+        return HttpResponseNotFound()
+    if not hmac.compare_digest(request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'):
+        return HttpResponseForbidden()
+
+    return HttpResponse(handler_metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@staff_member_required
+@require_GET
+def export(request, name):
+    """Выгрузка для организаторов: /exports/guests/?format=ndjson&event=1"""
+    export_format = request.GET.get('format', 'csv')
+    if name not in EXPORTS or export_format not in FORMATS:
+        raise Http404
+    event_id = request.GET.get('event')
+    if event_id is not None and not event_id.isdigit():
+        raise Http404
+
+    response = StreamingHttpResponse(
+        stream_export(name, export_format, event_id and int(event_id)),
+        content_type=FORMATS[export_format],
+    )
+    filename = f'{name}-{event_id}' if event_id else name
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{export_format}"'
+    return response
@@ -0,0 +1,71 @@
+import asyncio
+import atexit
+import logging
+import threading
+
+from telebot.types import Update
+
+
+logger = logging.getLogger(__name__)
+
+STOP_TIMEOUT = 10
+
+
+class BotRunner:
+    """Цикл событий бота в отдельном потоке процесса Django.
+
+    Запросы к webhook только передают обновление в этот цикл и сразу
+    отвечают Telegram, поэтому вид одинаково работает под WSGI и ASGI.
+    Webhook должен обслуживать один процесс: порядок сообщений чата
+    (ChatScheduler) и кеш состояний диалогов действуют внутри процесса.
+    """
+
+    def __init__(self):
+        self.loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread:
+                return
+            import meetup_bot
+
+            self.bot_module = meetup_bot
+            self.loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(target=self.loop.run_forever, name='meetup-bot', daemon=True)
+            self._thread.start()
+            asyncio.run_coroutine_threadsafe(meetup_bot.start_workers(), self.loop).result()
+            atexit.register(self.stop)
+
+    def stop(self):
+        with self._lock:
+            if not self._thread:
+                return
+            future = asyncio.run_coroutine_threadsafe(self.bot_module.stop_workers(), self.loop)
+            try:
+                future.result(STOP_TIMEOUT)
+            except Exception:
+                logger.exception('Фоновые задачи бота не остановились')
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(STOP_TIMEOUT)
+            self._thread = None
+
+    def submit(self, update_json):
+        """Ставит обновление в обработку, не дожидаясь результата"""
+        self.start()
+        update = Update.de_json(update_json)
+        future = asyncio.run_coroutine_threadsafe(
+            self.bot_module.bot.process_new_updates([update]),
+            self.loop,
+        )
+        future.add_done_callback(log_failure)
+        return future
+
+
+def log_failure(future):
+    if not future.cancelled() and future.exception():
+        logger.error('Ошибка при обработке обновления', exc_info=future.exception())
+
+
+runner = BotRunner()
@@ -1,17 +1,29 @@
+import asyncio
+
 from environs import Env
 from textwrap import dedent
 from dateparser import parse
 from datetime import datetime
 
-from telebot import TeleBot, custom_filters
+from telebot import asyncio_filters, asyncio_helper
 from telebot.types import InlineKeyboardMarkup, InlineKeyboardButton
-from telebot.handler_backends import State, StatesGroup
-from telebot.storage import StateMemoryStorage
+from telebot.asyncio_handler_backends import State, StatesGroup
 from telebot.formatting import hbold, hcode
 
 import meetup.db_operations as db
+from meetup.batching import BatchWriter, Debouncer
+from meetup.broadcast import Broadcaster
+from meetup.cache import active_event_cache, active_schedule_cache
+from meetup import outbox
+from meetup.metrics import handler_metrics, instrument_telegram_api
+from meetup.navigation import Navigator
+from meetup.querylog import query_log
+from meetup.router import CallbackRouter, make_callback_data
+from meetup.scheduler import MeetupBot
+from meetup.state_storage import DatabaseStateStorage
 from telebot.types import LabeledPrice
 from meetup.models import Donation, Event
+from django.conf import settings
 from django.shortcuts import get_object_or_404
 from django.http import Http404
 
@@ -19,14 +31,67 @@ env = Env()
 env.read_env()
 
 API_TOKEN = env.str('BOT_TOKEN')
+# Другой адрес Bot API, например локальной замены для нагрузочного теста
+# (python manage.py loadtest --external)
+TELEGRAM_API_URL = env.str('TELEGRAM_API_URL', '')
+if TELEGRAM_API_URL:
+    asyncio_helper.API_URL = TELEGRAM_API_URL.rstrip('/') + '/bot{0}/{1}'
+instrument_telegram_api()
 PAYMENTS_TOKEN = env.str('PAYMENTS_TOKEN')
-state_storage = StateMemoryStorage()
-bot = TeleBot(API_TOKEN, state_storage=state_storage)
-
 admin_ids = env.list('ADMIN_IDS', default=[], subcast=int)
 
-guest_data = {}
-payment_data = {}
+state_storage = DatabaseStateStorage()
+# Обновления одного чата обрабатываются по порядку, у администраторов своя очередь
+bot = MeetupBot(API_TOKEN, state_storage=state_storage, isolated_chat_ids=admin_ids)
+
+broadcaster = Broadcaster(bot)
+# Переходы по меню редактируют сообщение вместо отправки нового
+navigator = Navigator(bot)
+outbox_worker = outbox.OutboxWorker(bot, broadcaster)
+router = CallbackRouter()
+# Отметки гостей на мероприятии пишутся в базу пачками в фоне
+checkin_writer = BatchWriter(db.aadd_guests_to_events)
+# Вопросы спикерам — тоже, чтобы после доклада не упираться в запись
+question_writer = BatchWriter(db.acreate_questions, interval=0.1, max_size=100)
+
+
+def register_metrics():
+    """Очереди, пакетная запись и кэши в показателях /metrics/"""
+    handler_metrics.register(
+        'meetup_update_queue_depth', 'Обновлений в очереди', 'gauge',
+        lambda: [({'shard': shard['shard']}, shard['depth']) for shard in bot.scheduler.stats()],
+    )
+    handler_metrics.register(
+        'meetup_updates_processed_total', 'Обработано обновлений', 'counter',
+        lambda: [({'shard': shard['shard']}, shard['processed']) for shard in bot.scheduler.stats()],
+    )
+    writers = {'checkins': checkin_writer, 'questions': question_writer}
+    for field, metric_type in (('written', 'counter'), ('pending', 'gauge'), ('dropped', 'counter'), ('max_latency_ms', 'gauge')):
+        handler_metrics.register(
+            f'meetup_batch_{field}', f'Пакетная запись: {field}', metric_type,
+            lambda field=field: [({'writer': name}, writer.stats()[field]) for name, writer in writers.items()],
+        )
+    handler_metrics.register(
+        'meetup_now_speaking_total', 'Переключений выступления и рассылок о них', 'counter',
+        lambda: [({'kind': kind}, now_speaking.stats()[kind]) for kind in ('triggered', 'fired')],
+    )
+    handler_metrics.register(
+        'meetup_navigation_total', 'Переходов по меню: отредактировано, без изменений, отправлено заново', 'counter',
+        lambda: [({'result': result}, count) for result, count in navigator.stats().items()],
+    )
+    caches = {'active_event': active_event_cache, 'active_schedule': active_schedule_cache}
+    for field in ('hits', 'misses'):
+        handler_metrics.register(
+            f'meetup_cache_{field}_total', f'Кэш: {field}', 'counter',
+            lambda field=field: [({'cache': name}, cache.stats()[field]) for name, cache in caches.items()],
+        )
+    handler_metrics.register(
+        'meetup_chat_states_cached', 'Диалогов в кэше', 'gauge',
+        lambda: [({}, state_storage.cache_info()['size'])],
+    )
+
+
+register_metrics()
 
 
 class EventEditStates(StatesGroup):
@@ -40,15 +105,57 @@ class SpeechEditStates(StatesGroup):
     speech_edit_speaker_name = State()
 
 
-class AdminCallBackData(object):
-    def __init__(self, call, data):
-        self.message = call.message  # либо call.message
-        self.data = data
-        self.from_user = call.from_user
+async def broadcast_with_report(admin_chat_id, title, ids, text, reply_markup):
+    """Ставит рассылку в очередь, отчет о ходе придет в чат администратора"""
+    status = await bot.send_message(admin_chat_id, f'{title}: в очереди {len(ids)} сообщений...')
+    await outbox.aenqueue_messages(
+        ids,
+        text,
+        reply_markup=reply_markup,
+        title=title,
+        report_chat_id=admin_chat_id,
+        report_message_id=status.message_id,
+    )
+    outbox_worker.wake()
+
+
+# Последнее выступление, о котором сообщили подписчикам, по мероприятиям
+announced_speeches = {}
+
+
+async def notify_now_speaking(event_id):
+    """Сообщает подписчикам мероприятия, кто сейчас выступает"""
+    schedule = await db.aget_active_schedule()
+    if not schedule or schedule.event_id != event_id or announced_speeches.get(event_id) == schedule.id:
+        return
+    announced_speeches[event_id] = schedule.id
+    ids = await db.aget_subscribers_ids(event_id)
+    if not ids:
+        return
+    speaker = schedule.speaker.name if schedule.speaker else ''
+    text = dedent(
+        f'''
+        Сейчас выступает: {speaker}
+        Тема: {schedule.topic}
+        '''
+    )
+    keyboard = get_keyboard(
+        [
+            ('Задать вопрос спикеру', 'question'),
+            ('Расписание', 'schedule'),
+        ]
+    )
+    await outbox.aenqueue_messages(ids, text, reply_markup=keyboard, title='Сейчас выступает')
+    outbox_worker.wake()
+
+
+# Администратор может быстро пролистать несколько выступлений,
+# подписчики получат одно сообщение о последнем
+now_speaking = Debouncer(notify_now_speaking, settings.NOW_SPEAKING_DEBOUNCE)
 
 
 @bot.message_handler(commands=['help', 'start'])
-def send_welcome(message):
+async def send_welcome(message):
     start_keyboard = InlineKeyboardMarkup(
         keyboard=[
             [InlineKeyboardButton('Присоединиться', callback_data='guest_menu')],
@@ -56,10 +163,10 @@ def send_welcome(message):
         ]
     )
 
-    active_event = db.get_active_event()
+    active_event = await db.aget_active_event()
 
     if active_event:
-        db.add_guest_to_event(message.chat.id, active_event)
+        checkin_writer.add((message.chat.id, active_event.id))
         text = dedent(
             f'''
             Привествую тебя в Python Meetup!
@@ -77,7 +184,7 @@ def send_welcome(message):
     else:
         text = 'На сегодня активных мероприятий нет'
 
-    bot.send_message(
+    await bot.send_message(
         chat_id=message.chat.id,
         text=text,
         reply_markup=start_keyboard
@@ -85,21 +192,21 @@ def send_welcome(message):
 
 
 # меню выбора мероприятия
-@bot.callback_query_handler(func=lambda call: call.data == 'admin')
-def admin_root(call):
+@router.route('admin')
+async def admin_root(call):
     chat_id = call.from_user.id
     if chat_id in admin_ids:
-        events = db.get_all_events()
+        events = await db.aget_all_events()
         event_keyboard = InlineKeyboardMarkup(row_width=1)
         for event in events:
             text = f'{event.date:%d-%m-%Y} "{event.topic}"'
             if event.active:
                 text = '✅ ' + text
             event_keyboard.add(
-                InlineKeyboardButton(text, callback_data=f'event_{event.id}')
+                InlineKeyboardButton(text, callback_data=make_callback_data('admin_event', event.id))
             )
 
-        event_keyboard.add(InlineKeyboardButton('Создать новое мероприятие', callback_data='edit_event_new'))
+        event_keyboard.add(InlineKeyboardButton('Создать новое мероприятие', callback_data='new_event'))
 
         text = dedent(
             f'''
@@ -109,24 +216,19 @@ def admin_root(call):
             '''
         )
 
-        bot.send_message(
-            chat_id=chat_id,
-            text=text,
-            reply_markup=event_keyboard
-        )
+        await navigator.show(call, text, reply_markup=event_keyboard)
     else:
-        bot.send_message(chat_id, 'Доступ только для администратора')
-    bot.delete_message(call.from_user.id, call.message.id)
+        await navigator.show(call, 'Доступ только для администратора')
 
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('edit_event'))
-def admin_request_edit_event(call):
+@router.route('new_event')
+@router.route('edit_event', int)
+async def admin_request_edit_event(call, event_id='new'):
     """запрос создания нового мероприятия"""
-    *_, event_id = call.data.split('_')
     chat_id = call.from_user.id
-    bot.set_state(chat_id, EventEditStates.date, chat_id)
-    bot.add_data(chat_id, chat_id, event_id=event_id)
-    bot.send_message(
+    await bot.set_state(chat_id, EventEditStates.date, chat_id)
+    await bot.add_data(chat_id, chat_id, event_id=event_id)
+    await bot.send_message(
         chat_id=chat_id,
         text=dedent(
             '''
@@ -139,12 +241,12 @@ def admin_request_edit_event(call):
 
 
 @bot.message_handler(state=EventEditStates.date)
-def admin_request_new_event_date(message):
+async def admin_request_new_event_date(message):
     """Создание нового мероприятия - Шаг.1 Получение даты"""
 
-    bot.send_message(message.chat.id, 'Введите название мероприятия')
-    bot.set_state(message.from_user.id, EventEditStates.name, message.chat.id)
-    with bot.retrieve_data(message.from_user.id, message.chat.id) as data:
+    await bot.send_message(message.chat.id, 'Введите название мероприятия')
+    await bot.set_state(message.from_user.id, EventEditStates.name, message.chat.id)
+    async with bot.retrieve_data(message.from_user.id, message.chat.id) as data:
         parsed_data = parse(
             message.text,
             languages=['ru', ],
@@ -154,7 +256,7 @@ def admin_request_new_event_date(message):
 
 
 @bot.message_handler(state=EventEditStates.name)
-def admin_request_new_event_name(message):
+async def admin_request_new_event_name(message):
     """Создание нового мероприятия - Шаг.2 Получение наименования"""
 
     keyboard = InlineKeyboardMarkup(
@@ -165,9 +267,9 @@ def admin_request_new_event_name(message):
             ]
         ]
     )
-    with bot.retrieve_data(message.from_user.id, message.chat.id) as data:
+    async with bot.retrieve_data(message.from_user.id, message.chat.id) as data:
         data['name'] = message.text
-        bot.send_message(
+        await bot.send_message(
             chat_id=message.chat.id,
             text=dedent(
                 f'''
@@ -184,25 +286,25 @@ def admin_request_new_event_name(message):
     #
 
 
-@bot.callback_query_handler(func=lambda call: call.data == 'create_event')
-def admin_create_new_event(call):
+@router.route('create_event')
+async def admin_create_new_event(call):
     """Создание нового мероприятия"""
     chat_id = call.from_user.id
-    with bot.retrieve_data(chat_id, chat_id) as data:
+    async with bot.retrieve_data(chat_id, chat_id) as data:
         # Запись мероприятия в базу данных
         if data['event_id'] == 'new':
-            db.create_new_event(topic=data['name'], date=data['date'])
+            await db.acreate_new_event(topic=data['name'], date=data['date'])
         else:
-            db.update_event(
+            await db.aupdate_event(
                 event_id=data['event_id'],
                 topic=data['name'],
                 date=data['date']
             )
-    bot.answer_callback_query(call.id, 'Мероприятие сохранено')
-    bot.delete_state(chat_id, chat_id)
+    await bot.answer_callback_query(call.id, 'Мероприятие сохранено')
+    await bot.delete_state(chat_id, chat_id)
 
     # Переход на меню выбора мероприятий
-    admin_root(AdminCallBackData(call, 'admin'))
+    await admin_root(call)
 
 
 # меню работы с мероприятиями
@@ -211,39 +313,39 @@ def admin_keyboard(event):
 
     keyboard = InlineKeyboardMarkup(row_width=1)
     if not event.active:
-        keyboard.add(InlineKeyboardButton('✅ Сделать активным', callback_data=f'activate_event_{event_id}'))
+        keyboard.add(InlineKeyboardButton('✅ Сделать активным', callback_data=make_callback_data('activate_event', event_id)))
     keyboard.add(
         InlineKeyboardButton(
             'Редактировать',
-            callback_data=f'edit_event_{event_id}'
+            callback_data=make_callback_data('edit_event', event_id)
         ),
         InlineKeyboardButton(
             'Изменить расписание',
-            callback_data=f'show_schedule_{event_id}'
+            callback_data=make_callback_data('show_schedule', event_id)
         ),
         InlineKeyboardButton(
             'Контроль выступлений',
-            callback_data=f'control_schedule_{event_id}'
+            callback_data=make_callback_data('control_schedule', event_id)
         ),
         InlineKeyboardButton(
             'Уведомление спикеров',
-            callback_data=f'notify_speakers_{event_id}'
+            callback_data=make_callback_data('notify_speakers', event_id)
         ),
         InlineKeyboardButton(
             'Уведомления гостей об изменениях',
-            callback_data=f'notify_guests_{event_id}'
+            callback_data=make_callback_data('notify_guests', event_id)
         ),
         InlineKeyboardButton(
             'Массовая рассылка сообщений',
-            callback_data=f'send_common_message'
+            callback_data='send_common_message'
         ),
         InlineKeyboardButton(
             'Отчет по донатам на мероприятии',
-            callback_data=f'donates_event_{event_id}'
+            callback_data=make_callback_data('donates_event', event_id)
         ),
         InlineKeyboardButton(
             'Удалить мероприятие',
-            callback_data=f'delete_event_{event_id}'
+            callback_data=make_callback_data('delete_event', event_id)
         ),
         InlineKeyboardButton('Назад', callback_data='admin'),
     )
@@ -251,19 +353,17 @@ def admin_keyboard(event):
     return keyboard
 
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('donates_event'))
-def admin_notify_speakers(call):
-    chat_id = call.from_user.id
-    *_, event_id = call.data.split('_')
-    donates = db.report_donations(event_id)
+@router.route('donates_event', int)
+async def admin_report_donations(call, event_id):
+    donates = await db.areport_donations(event_id)
     
     keyboard = get_keyboard(
         [
-            ('Назад', f'event_{event_id}'),
+            ('Назад', make_callback_data('admin_event', event_id)),
         ]
     )
-    bot.send_message(
-        chat_id=chat_id,
+    await navigator.show(
+        call,
         text=dedent(
             f'''
             Отчет о донатах.
@@ -275,14 +375,12 @@ def admin_notify_speakers(call):
             ),
         reply_markup=keyboard
     )
-    bot.delete_message(call.from_user.id, call.message.id)
 
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('notify_speakers'))
-def admin_notify_speakers(call):
-    *_, event_id = call.data.split('_')
-    event = db.get_event(event_id)
-    ids = db.get_event_speakers_ids(event_id)
+@router.route('notify_speakers', int)
+async def admin_notify_speakers(call, event_id):
+    event = await db.aget_event(event_id)
+    ids = await db.aget_event_speakers_ids(event_id)
     
     text = dedent(
         f'''
@@ -302,20 +400,14 @@ def admin_notify_speakers(call):
             ('Перейти в мероприятие', 'guest_menu')
         ]
     )
-    for id in ids:
-        bot.send_message(
-            chat_id=id,
-            text=text,
-            reply_markup=keyboard
-        )
-    bot.answer_callback_query(call.id, 'Уведомления отправлены!')
+    await broadcast_with_report(call.from_user.id, 'Уведомление спикеров', ids, text, keyboard)
+    await bot.answer_callback_query(call.id, 'Уведомления отправляются!')
 
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('notify_guests'))
-def admin_notify_guests(call):
-    *_, event_id = call.data.split('_')
-    event = db.get_event(event_id)
-    ids = db.get_event_guests_ids(event_id)
+@router.route('notify_guests', int)
+async def admin_notify_guests(call, event_id):
+    event = await db.aget_event(event_id)
+    ids = await db.aget_event_guests_ids(event_id)
     
     text = dedent(
         f'''
@@ -334,20 +426,13 @@ def admin_notify_guests(call):
             ('Перейти к расписанию', 'schedule')
         ]
     )
-    for id in ids:
-        bot.send_message(
-            chat_id=id,
-            text=text,
-            reply_markup=keyboard
-        )
-    bot.answer_callback_query(call.id, 'Уведомления об изменении расписания отправлены!')
+    await broadcast_with_report(call.from_user.id, 'Уведомление гостей', ids, text, keyboard)
+    await bot.answer_callback_query(call.id, 'Уведомления об изменении расписания отправляются!')
 
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('event_'))
-def admin_event_menu(call):
-    chat_id = call.from_user.id
-    event_id = call.data.split('_')[-1]
-    event = db.get_event(event_id)
+@router.route('admin_event', int)
+async def admin_event_menu(call, event_id):
+    event = await db.aget_event(event_id)
     active = '✅ Текущее' if event.active else 'Архивное'
 
     text = dedent(
@@ -359,24 +444,21 @@ def admin_event_menu(call):
         '''
     )
 
-    bot.send_message(
-        chat_id=chat_id,
+    await navigator.show(
+        call,
         text=text,
         parse_mode='HTML',
         reply_markup=admin_keyboard(event)
     )
-    bot.delete_message(call.from_user.id, call.message.id)
 
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('activate_event'))
-def admin_set_active_event(call):
-    event_id = call.data.split('_')[-1]
-    event = db.set_active_event(event_id)
+@router.route('activate_event', int)
+async def admin_set_active_event(call, event_id):
+    event = await db.aset_active_event(event_id)
     active = '✅ Текущее' if event.active else 'Архивное'
 
-    bot.edit_message_text(
-        chat_id=call.from_user.id,
-        message_id=call.message.id,
+    await navigator.show(
+        call,
         text=dedent(
             f'''
             Меню мероприятия:
@@ -390,22 +472,21 @@ def admin_set_active_event(call):
     )
 
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('delete_event'))
-def admin_request_delete_event(call):
-    event_id = call.data.split('_')[-1]
-    event = db.get_event(event_id)
+@router.route('delete_event', int)
+async def admin_request_delete_event(call, event_id):
+    event = await db.aget_event(event_id)
 
     yes_no_keyboard = InlineKeyboardMarkup(
         [
             [
-                InlineKeyboardButton('Да', callback_data=f'confirm_delete_event_{event.id}'),
+                InlineKeyboardButton('Да', callback_data=make_callback_data('confirm_delete_event', event.id)),
                 InlineKeyboardButton('Отмена', callback_data='admin')
             ]
         ]
     )
 
-    bot.send_message(
-        chat_id=call.from_user.id,
+    await navigator.show(
+        call,
         text=dedent(
             f'''
             Вы уверены, что хотите удалить мероприятие:
@@ -416,55 +497,18 @@ def admin_request_delete_event(call):
         reply_markup=yes_no_keyboard,
         parse_mode='HTML'
     )
-    bot.delete_message(call.from_user.id, call.message.id)
 
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('confirm_delete_event'))
-def admin_delete_event(call):
-    db.delete_event(call.data.split('_')[-1])
-    bot.answer_callback_query(call.id, 'Мероприятие успешно удалено')
-    admin_root(AdminCallBackData(call, 'admin'))
+@router.route('confirm_delete_event', int)
+async def admin_delete_event(call, event_id):
+    await db.adelete_event(event_id)
+    await bot.answer_callback_query(call.id, 'Мероприятие успешно удалено')
+    await admin_root(call)
 
 
-def speech_keyboard(event_id, control=False):
-    schedules = db.get_event_schedules(event_id)
-    if control:
-        active_speech = db.get_active_event_schedule(event_id)
-
-    keyboard = InlineKeyboardMarkup()
-    for speech in schedules:
-        text_button = f'{speech.start_at:%H:%M}-{speech.end_at:%H:%M}'
-        if speech.speaker:
-            text_button += f' {speech.speaker.name}'
-
-        if not control:
-            text_button += f' "{speech.topic}"'
-            callback_data = f'edit_schedule_{event_id}_{speech.id}'
-        else:
-            if speech == active_speech:
-                text_button += ' ✅'
-            callback_data = f'set_active_schedule_{event_id}_{speech.id}'
-
-        buttons = [
-            InlineKeyboardButton(
-                text_button,
-                callback_data=callback_data
-            ),
-        ]
-
-        keyboard.add(*buttons)
-    if not control:
-        keyboard.add(InlineKeyboardButton('Добавить выступление', callback_data=f'edit_schedule_{event_id}_new'))
-    keyboard.add(InlineKeyboardButton('Назад', callback_data=f'event_{event_id}'))
-
-    return keyboard
-
-
-@bot.callback_query_handler(func=lambda call: call.data.startswith('show_schedule'))
-def admin_edit_event_schedules(call):
-    chat_id = call.from_user.id
-    event_id = call.data.split('_')[-1]
-    event = db.get_event(event_id)
+@router.route('show_schedule', int)
+async def admin_edit_event_schedules(call, event_id):
+    event = await db.aget_event(event_id)
 
     text = dedent(
         f'''
@@ -476,21 +520,17 @@ def admin_edit_event_schedules(call):
         '''
     )
 
-    bot.send_message(
-        chat_id=chat_id,
+    await navigator.show(
+        call,
         text=text,
         parse_mode='HTML',
-        reply_markup=speech_keyboard(event_id)
+        reply_markup=await db.aget_speech_keyboard(event_id)
     )
-    bot.delete_message(call.from_user.id, call.message.id)
 
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('control_schedule'))
-def admin_control_event_schedules(call):
-    chat_id = call.from_user.id
-    event_id = call.data.split('_')[-1]
-    event = db.get_event(event_id)
-    bot.delete_message(call.from_user.id, call.message.id)
+@router.route('control_schedule', int)
+async def admin_control_event_schedules(call, event_id):
+    event = await db.aget_event(event_id)
 
     text = dedent(
         f'''
@@ -500,20 +540,19 @@ def admin_control_event_schedules(call):
         '''
     )
 
-    bot.send_message(
-        chat_id=chat_id,
+    await navigator.show(
+        call,
         text=text,
         parse_mode='HTML',
-        reply_markup=speech_keyboard(event_id, control=True)
+        reply_markup=await db.aget_speech_keyboard(event_id, control=True)
     )
 
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('set_active_schedule'))
-def admin_set_active_schedule(call):
-    chat_id = call.from_user.id
-    *_, event_id, speech_id = call.data.split('_')
-    event = db.get_event(event_id)
-    db.set_active_schedule(speech_id)
+@router.route('set_active_schedule', int, int)
+async def admin_set_active_schedule(call, event_id, speech_id):
+    event = await db.aget_event(event_id)
+    await db.aset_active_schedule(event_id, speech_id)
+    now_speaking.trigger(event_id)
 
     text = dedent(
         f'''
@@ -523,12 +562,11 @@ def admin_set_active_schedule(call):
         '''
     )
 
-    bot.edit_message_text(
-        chat_id=chat_id,
+    await navigator.show(
+        call,
         text=text,
-        message_id=call.message.id,
         parse_mode='HTML',
-        reply_markup=speech_keyboard(event_id, control=True)
+        reply_markup=await db.aget_speech_keyboard(event_id, control=True)
     )
 
 
@@ -536,29 +574,28 @@ def speech_edit_keyboard(speech):
     return InlineKeyboardMarkup(
         [
             [
-                InlineKeyboardButton('Изменить начало', callback_data=f'edit_speech_start_{speech.id}'),
-                InlineKeyboardButton('Изменить окончание', callback_data=f'edit_speech_end_{speech.id}')
+                InlineKeyboardButton('Изменить начало', callback_data=make_callback_data('edit_speech', 'start', speech.id)),
+                InlineKeyboardButton('Изменить окончание', callback_data=make_callback_data('edit_speech', 'end', speech.id))
             ],
             [
-                InlineKeyboardButton('Изменить спикера', callback_data=f'edit_speech_speaker_{speech.id}'),
-                InlineKeyboardButton('Изменить тему', callback_data=f'edit_speech_topic_{speech.id}')
+                InlineKeyboardButton('Изменить спикера', callback_data=make_callback_data('edit_speech', 'speaker', speech.id)),
+                InlineKeyboardButton('Изменить тему', callback_data=make_callback_data('edit_speech', 'topic', speech.id))
             ],
-            [InlineKeyboardButton('Назад', callback_data=f'show_schedule_{speech.event.id}'), ],
-            [InlineKeyboardButton('Удалить', callback_data=f'delete_speech_{speech.id}'), ],
+            [InlineKeyboardButton('Назад', callback_data=make_callback_data('show_schedule', speech.event_id)), ],
+            [InlineKeyboardButton('Удалить', callback_data=make_callback_data('delete_speech', speech.id)), ],
         ]
     )
 
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('edit_schedule'))
-def admin_edit_schedule(call):
-    chat_id = call.from_user.id
-    *_, event_id, speech_id = call.data.split('_')
+@router.route('add_speech', int)
+async def admin_add_speech(call, event_id):
+    speech = await db.acreate_speech(event_id)
+    await admin_edit_schedule(call, speech.id)
 
-    if speech_id == 'new':
-        speech = db.create_speech(event_id)
-        speech_id = speech.id
 
-    speech = db.get_speech(speech_id)
+@router.route('edit_schedule', int)
+async def admin_edit_schedule(call, speech_id):
+    speech = await db.aget_speech(speech_id)
 
     speaker = speech.speaker.name if speech.speaker else ''
 
@@ -572,59 +609,57 @@ def admin_edit_schedule(call):
         '''
     )
 
-    bot.send_message(
-        chat_id=chat_id,
+    await navigator.show(
+        call,
         text=text,
         parse_mode='HTML',
         reply_markup=speech_edit_keyboard(speech)
     )
 
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('edit_speech'))
-def admin_edit_speech(call):
+@router.route('edit_speech', str, int)
+async def admin_edit_speech(call, action, speech_id):
     chat_id = call.from_user.id
-    *_, action, speech_id = call.data.split('_')
-    speech = db.get_speech(speech_id)
+    speech = await db.aget_speech(speech_id)
 
     if action == 'start':
         action = 'start_at'
         text = 'Введите время начала выступления (формат НН:ММ):'
-        bot.set_state(chat_id, SpeechEditStates.speech_edit)
+        await bot.set_state(chat_id, SpeechEditStates.speech_edit)
 
     elif action == 'end':
         action = 'end_at'
         text = 'Введите время окончания выступления (формат НН:ММ):'
-        bot.set_state(chat_id, SpeechEditStates.speech_edit)
+        await bot.set_state(chat_id, SpeechEditStates.speech_edit)
 
     elif action == 'speaker':
         text = 'Введите Телеграм ID спикера:'
-        bot.set_state(chat_id, SpeechEditStates.speech_edit_speaker_id)
+        await bot.set_state(chat_id, SpeechEditStates.speech_edit_speaker_id)
 
     elif action == 'topic':
         text = 'Введите тему выступления:'
-        bot.set_state(chat_id, SpeechEditStates.speech_edit)
+        await bot.set_state(chat_id, SpeechEditStates.speech_edit)
 
-    bot.add_data(chat_id, chat_id, speech=speech, message_id=call.message.id, action=action)
-    bot.send_message(chat_id=chat_id, text=text)
+    await bot.add_data(chat_id, chat_id, speech_id=speech.id, message_id=call.message.id, action=action)
+    await bot.send_message(chat_id=chat_id, text=text)
 
 
 @bot.message_handler(
     state=[SpeechEditStates.speech_edit, SpeechEditStates.speech_edit_speaker_id]
 )
-def admin_speech_edit(message):
+async def admin_speech_edit(message):
     chat_id = message.chat.id
-    with bot.retrieve_data(chat_id, chat_id) as data:
+    async with bot.retrieve_data(chat_id, chat_id) as data:
         if data['action'] == 'speaker':
             data['speaker_id'] = message.text
-            bot.set_state(chat_id, SpeechEditStates.speech_edit_speaker_name)
-            bot.send_message(chat_id=chat_id, text='Введите ФИО спикера')
+            await bot.set_state(chat_id, SpeechEditStates.speech_edit_speaker_name)
+            await bot.send_message(chat_id=chat_id, text='Введите ФИО спикера')
 
         else:
-            speech = data['speech']
             update_speech_data = {
                 data['action']: message.text
             }
-            speech = db.update_speech(speech.id, update_speech_data)
+            speech = await db.aupdate_speech(data['speech_id'], update_speech_data)
 
             speaker = speech.speaker.name if speech.speaker else ''
 
@@ -638,28 +673,27 @@ def admin_speech_edit(message):
                 '''
             )
 
-            bot.send_message(
+            await bot.send_message(
                 chat_id=chat_id,
                 text=text,
                 parse_mode='HTML',
                 reply_markup=speech_edit_keyboard(speech)
             )
 
-            bot.delete_state(chat_id, chat_id)
+            await bot.delete_state(chat_id, chat_id)
 
 
 @bot.message_handler(state=SpeechEditStates.speech_edit_speaker_name)
-def admin_speech_edit_speaker(message):
+async def admin_speech_edit_speaker(message):
     chat_id = message.chat.id
-    with bot.retrieve_data(chat_id, chat_id) as data:
+    async with bot.retrieve_data(chat_id, chat_id) as data:
         data['speaker_name'] = message.text
 
-        speech = data['speech']
         update_speech_data = {
             'speaker_id': int(data['speaker_id']),
             'speaker_name': data['speaker_name'],
         }
-        speech = db.update_speech_speaker(speech.id, update_speech_data)
+        speech = await db.aupdate_speech_speaker(data['speech_id'], update_speech_data)
 
         speaker = speech.speaker.name if speech.speaker else ''
 
@@ -673,82 +707,94 @@ def admin_speech_edit_speaker(message):
             '''
         )
 
-        bot.send_message(
+        await bot.send_message(
             chat_id=chat_id,
             text=text,
             parse_mode='HTML',
             reply_markup=speech_edit_keyboard(speech)
         )
 
-    bot.delete_state(chat_id, chat_id)
+    await bot.delete_state(chat_id, chat_id)
 
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('delete_speech'))
-def admin_delete_speech(call):
-    speech_id = call.data.split('_')[-1]
-    speech = db.get_speech(speech_id)
+@router.route('delete_speech', int)
+async def admin_delete_speech(call, speech_id):
+    speech = await db.aget_speech(speech_id)
 
-    db.delete_speech(speech_id)
-    bot.answer_callback_query(call.id, 'Выступление удалено')
-    bot.delete_message(call.from_user.id, call.message.id)
-    admin_edit_event_schedules(AdminCallBackData(call, f'show_schedule_{speech.event.id}'))
+    await db.adelete_speech(speech_id)
+    await bot.answer_callback_query(call.id, 'Выступление удалено')
+    await admin_edit_event_schedules(call, speech.event_id)
 
 
-@bot.callback_query_handler(func=lambda call: call.data == 'register')
-def guest_registration(call):
-    guest_data = {}
+async def guest_registration_expired(call):
+    """Данные незавершенной регистрации удалены по сроку давности"""
+    keyboard = get_keyboard(
+        [
+            ('Заполнить заново', 'register'),
+        ]
+    )
+    await navigator.show(
+        call,
+        text='Регистрация не завершена вовремя, данные не сохранились.',
+        reply_markup=keyboard
+    )
+
+
+@router.route('register')
+async def guest_registration(call):
     chat_id = call.from_user.id
-    bot.set_state(chat_id, state='guest_phone')
-    bot.send_message(chat_id, 'Введите ваше имя и фамилию. ')
+    await bot.set_state(chat_id, state='guest_phone')
+    await bot.reset_data(chat_id)
+    await bot.send_message(chat_id, 'Введите ваше имя и фамилию. ')
 
 
 @bot.message_handler(state='guest_phone')
-def guest_registration(message):
-    guest_data['name'] = message.text
+async def guest_registration(message):
     chat_id = message.chat.id
-    bot.set_state(chat_id, state='guest_kind')
-    bot.send_message(chat_id, 'Введите ваш телефон. ')
+    await bot.add_data(chat_id, name=message.text)
+    await bot.set_state(chat_id, state='guest_kind')
+    await bot.send_message(chat_id, 'Введите ваш телефон. ')
 
 
 @bot.message_handler(state='guest_kind')
-def guest_registration(message):
-    guest_data['phone'] = message.text
+async def guest_registration(message):
     chat_id = message.chat.id
-    bot.set_state(chat_id, state='guest_projects')
-    bot.send_message(chat_id, 'Введите ваш вид деятельности. ')
+    await bot.add_data(chat_id, phone=message.text)
+    await bot.set_state(chat_id, state='guest_projects')
+    await bot.send_message(chat_id, 'Введите ваш вид деятельности. ')
 
 
 @bot.message_handler(state='guest_projects')
-def guest_registration(message):
-    guest_data['kind'] = message.text
+async def guest_registration(message):
     chat_id = message.chat.id
-    bot.set_state(chat_id, state='guest_public')
-    bot.send_message(chat_id, 'Введите ваши текущие проекты. ')
+    await bot.add_data(chat_id, kind=message.text)
+    await bot.set_state(chat_id, state='guest_public')
+    await bot.send_message(chat_id, 'Введите ваши текущие проекты. ')
 
 
 @bot.message_handler(state='guest_public')
-def guest_registration(message):
-    guest_data['projects'] = message.text
+async def guest_registration(message):
+    await bot.add_data(message.chat.id, projects=message.text)
     keyboard = get_keyboard(
         [
-            ('Да', 'create_guest_yes'),
-            ('Нет', 'create_guest_no')
+            ('Да', make_callback_data('create_guest', 'yes')),
+            ('Нет', make_callback_data('create_guest', 'no'))
         ]
     )
-    bot.send_message(
+    await bot.send_message(
         chat_id=message.chat.id,
         text='Вы готовы к обмену данными?.',
         reply_markup=keyboard
     ),
 
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('create_guest'))
-def guest_registration(call):
+@router.route('create_guest', str)
+async def guest_registration(call, answer):
     telegram_id = call.from_user.id
-    if call.data == 'create_guest_yes':
-        guest_data['public'] = True
-    else:
-        guest_data['public'] = False
+    async with bot.retrieve_data(telegram_id) as guest_data:
+        if guest_data is None:
+            return await guest_registration_expired(call)
+        guest_data['public'] = answer == 'yes'
 
     keyboard = get_keyboard(
         [
@@ -756,8 +802,8 @@ def guest_registration(call):
             ('Нет', 'register')
         ]
     )
-    bot.send_message(
-        chat_id=telegram_id,
+    await navigator.show(
+        call,
         text=dedent(
             f'''
             Проверьте ваши данные, и нажмите Да чтобы продолжить: 
@@ -771,10 +817,13 @@ def guest_registration(call):
     )
 
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('db_create_guest'))
-def guest_registration(call):
+@router.route('db_create_guest')
+async def guest_registration(call):
     telegram_id = call.from_user.id
-    db.create_guest(
+    guest_data = await state_storage.get_data(telegram_id, telegram_id)
+    if not guest_data or 'public' not in guest_data:
+        return await guest_registration_expired(call)
+    await db.acreate_guest(
         guest_data['name'],
         guest_data['phone'],
         guest_data['kind'],
@@ -782,13 +831,14 @@ def guest_registration(call):
         guest_data['public'],
         call.from_user.id
     )
+    await bot.delete_state(telegram_id)
     keyboard = get_keyboard(
         [
             ('ОК', 'guest_menu'),
         ]
     )
-    bot.send_message(
-        chat_id=telegram_id,
+    await navigator.show(
+        call,
         text=dedent(
             f'''Регистрация прошла успешно'''
         ),
@@ -796,16 +846,17 @@ def guest_registration(call):
     )
 
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('guest_menu'))
-def guest_menu(call):
+@router.route('guest_menu')
+async def guest_menu(call):
     telegram_id = call.from_user.id
-    event = db.get_active_event()
-    speakers_ids = db.get_event_speakers_ids(event.id)
+    event = await db.aget_active_event()
+    speakers_ids = await db.aget_event_speakers_ids(event.id)
 
     guest_menu = [
         ('Расписание выступления спикеров', 'schedule'),
         ('Задать вопрос выступающему спикеру', 'question'),
         ('Информация о следующих мероприятиях.', 'next_event'),
+        ('Следить за выступлениями', 'now_speaking'),
         ('Заполнить анкету', 'register'),
         ('Найти новые деловые контакты', 'find_contacts'),
         ('"Поблагодарить" организаторов', 'make_donate'),
@@ -817,8 +868,8 @@ def guest_menu(call):
     
     keyboard = get_keyboard(guest_menu)
     
-    bot.send_message(
-        chat_id=telegram_id,
+    await navigator.show(
+        call,
         text=dedent(
             f'''
             Главное меню.
@@ -829,13 +880,13 @@ def guest_menu(call):
     )
 
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('view_questions'))
-def speaker_view_questions(call):
+@router.route('view_questions')
+async def speaker_view_questions(call):
     speaker_id = call.from_user.id
 
-    speaker_questions = db.get_speaker_questions(
-        event=db.get_active_event(),
-        speaker=db.get_guest(speaker_id)
+    speaker_questions = await db.aget_speaker_questions(
+        event=await db.aget_active_event(),
+        speaker=await db.aget_guest(speaker_id)
     )   
     
     keyboard = get_keyboard(
@@ -844,8 +895,8 @@ def speaker_view_questions(call):
         ]
     )
 
-    bot.send_message(
-        chat_id=speaker_id,
+    await navigator.show(
+        call,
         text=dedent(
             f'''
             Вопросы, поступившие по ходу Вашего выступления:
@@ -856,10 +907,9 @@ def speaker_view_questions(call):
     )
 
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('event'))
-def guest_menu(call):
-    event = db.get_active_event()
-    telegram_id = call.from_user.id
+@router.route('event')
+async def guest_menu(call):
+    event = await db.aget_active_event()
     keyboard = get_keyboard(
         [
             ('Назад', 'guest_menu'),
@@ -870,8 +920,8 @@ def guest_menu(call):
     else:
         event_about = 'Сегодня встреч нет.'
 
-    bot.send_message(  # TODO: Брать информацию из базы
-        chat_id=telegram_id,
+    await navigator.show(  # TODO: Брать информацию из базы
+        call,
         text=dedent(
             f'''
             Информация о мероприятии {event_about}
@@ -880,28 +930,21 @@ def guest_menu(call):
     )
 
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('schedule'))
-def guest_menu(call):
-    event = db.get_active_event()
-    schedules_info = ''
+@router.route('schedule')
+async def guest_menu(call):
+    event = await db.aget_active_event()
     if event:
-        for schedule in event.schedules.all():
-            schedules_info += f'''
-                        Тема: {schedule.topic}
-                        \n  Спикер: {schedule.speaker}  активное {schedule.active}
-                        \n Время начала {schedule.start_at}  Время окончания {schedule.end_at}
-            '''
+        schedules_info = await db.aget_schedule_text(event.id)
     else:
         schedules_info = 'На сегодня докладов нет'
 
-    telegram_id = call.from_user.id
     keyboard = get_keyboard(
         [
             ('Назад', 'guest_menu'),
         ]
     )
-    bot.send_message(
-        chat_id=telegram_id,
+    await navigator.show(
+        call,
         text=dedent(
             f'''
             Расписание: \n {schedules_info}
@@ -910,21 +953,47 @@ def guest_menu(call):
     )
 
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('next_event'))
-def guest_menu(call):
-    events = db.get_all_events()
+@router.route('now_speaking')
+@router.route('subscribe', str)
+async def guest_subscription(call, answer=None):
+    telegram_id = call.from_user.id
+    event = await db.aget_active_event()
+    if not event:
+        return await navigator.show(
+            call,
+            text='Сегодня мероприятий нет',
+            reply_markup=get_keyboard([('Назад', 'guest_menu')]),
+        )
+
+    if answer is None:
+        subscribed = await db.ais_subscribed(telegram_id, event.id)
+    else:
+        subscribed = answer == 'yes'
+        await db.aset_subscription(telegram_id, event.id, subscribed)
+
+    if subscribed:
+        text = 'Бот сообщит, когда на сцену выйдет следующий спикер.'
+        toggle = ('Не сообщать', make_callback_data('subscribe', 'no'))
+    else:
+        text = 'Включите уведомления, чтобы узнавать, кто сейчас выступает.'
+        toggle = ('Сообщать о выступлениях', make_callback_data('subscribe', 'yes'))
+    await navigator.show(call, text=text, reply_markup=get_keyboard([toggle, ('Назад', 'guest_menu')]))
+
+
+@router.route('next_event')
+async def guest_menu(call):
+    events = await db.aget_all_events()
     events_about = ''
     for event in events:
         events_about += f'Дата {event.date}, Тема {event.topic} \n'
 
-    telegram_id = call.from_user.id
     keyboard = get_keyboard(
         [
             ('Назад', 'guest_menu'),
         ]
     )
-    bot.send_message(  # TODO: Брать информацию из базы
-        chat_id=telegram_id,
+    await navigator.show(  # TODO: Брать информацию из базы
+        call,
         text=dedent(
             f'''
             Информацию о следующих мероприятиях {events_about}
@@ -933,9 +1002,8 @@ def guest_menu(call):
     )
 
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('donat'))
-def guest_menu(call):
-    telegram_id = call.from_user.id
+@router.route('donate')
+async def guest_menu(call):
     keyboard = get_keyboard(
         [
             # ('100', 'make_donate'),
@@ -945,8 +1013,8 @@ def guest_menu(call):
             ('Назад', 'guest_menu'),
         ]
     )
-    bot.send_message(  # TODO: подключить оплату
-        chat_id=telegram_id,
+    await navigator.show(  # TODO: подключить оплату
+        call,
         text=dedent(
             f'''
             Укажите сумму доната
@@ -955,45 +1023,41 @@ def guest_menu(call):
     )
 
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('question'))
-def guest_menu(call):
+@router.route('question')
+async def guest_menu(call):
     chat_id = call.from_user.id
-    schedule = db.get_active_schedule()
+    schedule = await db.aget_active_schedule()
     if schedule:
         speaker = schedule.speaker
-        bot.set_state(chat_id, state=f'make_question')
+        await bot.set_state(chat_id, state=f'make_question')
         speaker_text = f'Введите вопрос для докладчика {speaker}'
     else:
-        bot.set_state(chat_id, state='guest_menu')
+        await bot.set_state(chat_id, state='guest_menu')
         speaker_text = 'Нет активных докладчиков'
 
-    bot.send_message(chat_id, speaker_text)
+    await bot.send_message(chat_id, speaker_text)
 
 
 @bot.message_handler(state='make_question')
-def make_question(message):
+async def make_question(message):
     chat_id = message.chat.id
-    question = message.text
-    guest = db.get_guest(chat_id)
-    schedule = db.get_active_schedule()
-
-    db.create_question(question, schedule, guest)
+    schedule = await db.aget_active_schedule()
+    question_writer.add((chat_id, schedule.id if schedule else None, message.text))
     keyboard = get_keyboard(
         [
             ('Назад', 'guest_menu'),
         ]
     )
-    bot.send_message(chat_id, 'Ваш вопрос успешно отправлен.', reply_markup=keyboard)
+    await bot.send_message(chat_id, 'Ваш вопрос успешно отправлен.', reply_markup=keyboard)
 
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('find_contacts'))
-def guest_menu(call):
+@router.route('find_contacts')
+async def guest_menu(call):
     telegram_id = call.from_user.id
-    contacts_per_iteration = 1
-    contacts = db.get_contacts(telegram_id)
+    contacts = await db.aget_contacts(telegram_id, limit=5)
 
     text = 'Контакты:'
-    for contact in contacts[:5]:
+    for contact in contacts:
         text += f'\n{contact.name}\n{contact.phone}\n{contact.kind_activity}\nПроекты: {contact.projects}\n'
 
 
@@ -1007,33 +1071,28 @@ def guest_menu(call):
         ]
     )
 
-    bot.send_message(
-        chat_id=telegram_id,
-        text=text,
-        reply_markup=keyboard
-    )
+    await navigator.show(call, text, reply_markup=keyboard)
 
 
 # start payment block
-@bot.callback_query_handler(func=lambda call: call.data == 'make_donate')
-def donat_payment(call):
-    payment_data = {}
+@router.route('make_donate')
+async def donat_payment(call):
     chat_id = call.from_user.id
-    bot.set_state(chat_id, state='make_payment')
-    bot.send_message(chat_id, 'Введите сумму. ')
+    await bot.set_state(chat_id, state='make_payment')
+    await bot.send_message(chat_id, 'Введите сумму. ')
 
 
 @bot.message_handler(state='make_payment')
-def donat_payment(message):
-    payment_data['amount'] = int(message.text)
+async def donat_payment(message):
     chat_id = message.chat.id
-    amount = payment_data['amount']
+    amount = int(message.text)
+    await bot.delete_state(chat_id)
     price = []
     price.append(LabeledPrice(label=f'Пожертвование ', amount=amount * 100))
-    bot.send_invoice(
+    await bot.send_invoice(
         chat_id,
         'Пожертвование',
-        f'{db.get_active_event()}',
+        f'{await db.aget_active_event()}',
         'HAPPY FRIDAYS COUPON',
         PAYMENTS_TOKEN,
         'rub',
@@ -1047,25 +1106,27 @@ def donat_payment(message):
 
 
 @bot.shipping_query_handler(func=lambda query: True)
-def shipping(shipping_query):
+async def shipping(shipping_query):
     pass
 
 
 @bot.pre_checkout_query_handler(func=lambda query: True)
-def checkout(pre_checkout_query):
-    bot.answer_pre_checkout_query(pre_checkout_query.id, ok=True,
+async def checkout(pre_checkout_query):
+    await bot.answer_pre_checkout_query(pre_checkout_query.id, ok=True,
                                   error_message="Произошла ошибка при оплате, попробуйте еще раз.")
 
 
 @bot.message_handler(content_types=['successful_payment'])
-def got_payment(message):
-    db.save_payment(payment_data['amount'], db.get_active_event(), db.get_guest(message.chat.id))
+async def got_payment(message):
+    # Сумму берем из самого платежа: между счетом и оплатой гость мог начать другой диалог
+    amount = message.successful_payment.total_amount // 100
+    await db.asave_payment(amount, await db.aget_active_event(), await db.aget_guest(message.chat.id))
     keyboard = get_keyboard(
         [
             ('Назад', 'guest_menu'),
         ]
     )    
-    bot.send_message(
+    await bot.send_message(
         message.chat.id,
         text='Спасибо за платеж!\nМы будем рады видеть вас на наших мероприятих! '.format(
                          message.successful_payment.total_amount / 100, message.successful_payment.currency),
@@ -1076,9 +1137,8 @@ def got_payment(message):
 
 # end payment block
 
-@bot.callback_query_handler(func=lambda call: call.data.startswith('bot_about'))
-def guest_menu(call):
-    telegram_id = call.from_user.id
+@router.route('bot_about')
+async def guest_menu(call):
     keyboard = get_keyboard(
         [
             ('Назад', 'guest_menu'),
@@ -1086,13 +1146,18 @@ def guest_menu(call):
     )
     with open('about.txt', 'r') as file:
         text_about = file.read()
-    bot.send_message(
-        chat_id=telegram_id,
+    await navigator.show(
+        call,
         text=dedent(text_about),
         reply_markup=keyboard
     )
 
 
+@bot.callback_query_handler(func=lambda call: True)
+async def dispatch_callback(call):
+    await router.dispatch(call)
+
+
 def get_keyboard(keys):
     buttons = []
     for key in keys:
@@ -1100,6 +1165,38 @@ def get_keyboard(keys):
     return InlineKeyboardMarkup(keyboard=buttons)
 
 
-bot.add_custom_filter(custom_filters.StateFilter(bot))
+bot.add_custom_filter(asyncio_filters.StateFilter(bot))
+
+
+async def start_workers():
+    """Фоновые задачи бота: очереди обновлений, доставка рассылок и пакетная запись в базу"""
+    bot.scheduler.start()
+    handler_metrics.start()
+    if settings.SQL_LOG:
+        query_log.start()
+    outbox_worker.start()
+    checkin_writer.start()
+    question_writer.start()
+
+
+async def stop_workers():
+    await bot.scheduler.stop()
+    await now_speaking.stop()
+    await question_writer.stop()
+    await checkin_writer.stop()
+    await outbox_worker.stop()
+    await handler_metrics.stop()
+    if settings.SQL_LOG:
+        await query_log.stop()
+
+
+async def main():
+    await start_workers()
+    try:
+        await bot.infinity_polling()
+    finally:
+        await stop_workers()
+
 
-bot.infinity_polling()
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -69,11 +69,80 @@ WSGI_APPLICATION = 'pythonmeetup.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        # django.db.backends.sqlite3 с BEGIN IMMEDIATE для транзакций
+        'ENGINE': 'meetup.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            # Сколько секунд ждать, пока другой процесс отпустит блокировку,
+            # прежде чем выдать "database is locked"
+            'timeout': env.int('SQLITE_BUSY_TIMEOUT', 20),
+        },
     }
 }
 
+# PRAGMA, которые выставляются на каждом соединении с SQLite (meetup/signals.py).
+# WAL позволяет админке читать, пока бот пишет, а synchronous=NORMAL
+# в режиме WAL не теряет целостность базы при сбое процесса.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'cache_size': -env.int('SQLITE_CACHE_KB', 64000),
+    'mmap_size': env.int('SQLITE_MMAP_SIZE', 256 * 1024 * 1024),
+    'temp_store': 'memory',
+} if env.bool('SQLITE_TUNING', True) else {}
+
+# Размер пула потоков, в котором бот выполняет запросы к ORM
+DB_THREAD_POOL_SIZE = env.int('DB_THREAD_POOL_SIZE', 8)
+
+# Сколько чатов бот обрабатывает параллельно. Сообщения одного чата
+# всегда обрабатываются по порядку.
+UPDATE_WORKERS = env.int('UPDATE_WORKERS', 64)
+
+# Сколько секунд бот держит в памяти активное мероприятие и доклад.
+# Внутри процесса кэш сбрасывается сразу при изменениях, срок нужен
+# для правок, сделанных в админке из другого процесса.
+ACTIVE_CACHE_TTL = env.int('ACTIVE_CACHE_TTL', 60)
+
+# Через сколько секунд бездействия диалог с ботом (например, недописанная
+# регистрация) считается брошенным, и сколько чатов держать в памяти
+STATE_TTL = env.int('STATE_TTL', 24 * 60 * 60)
+STATE_CACHE_SIZE = env.int('STATE_CACHE_SIZE', 10000)
+
+# За сколько секунд переключения выступлений сводятся в одно
+# сообщение подписчикам "Сейчас выступает"
+NOW_SPEAKING_DEBOUNCE = env.int('NOW_SPEAKING_DEBOUNCE', 15)
+
+# Режим webhook: Telegram присылает обновления на /telegram/webhook/
+# с этим секретом в заголовке. Пустой секрет отключает webhook.
+WEBHOOK_SECRET = env.str('WEBHOOK_SECRET', '')
+
+# Замеры обработчиков бота: доля замеряемых обновлений и как часто
+# писать сводку в лог (0 — не писать). Показатели отдаются на
+# /metrics/ с заголовком "Authorization: Bearer METRICS_TOKEN",
+# пустой токен отключает адрес.
+METRICS_SAMPLE_RATE = env.float('METRICS_SAMPLE_RATE', 1.0)
+METRICS_LOG_INTERVAL = env.int('METRICS_LOG_INTERVAL', 60)
+METRICS_TOKEN = env.str('METRICS_TOKEN', '')
+
+# Журнал запросов к базе (выключен по умолчанию): запросы дольше
+# SQL_SLOW_MS миллисекунд пишутся в лог с функцией, откуда их вызвали,
+# остальные — с вероятностью SQL_SAMPLE_RATE. Раз в METRICS_LOG_INTERVAL
+# секунд в лог пишутся самые тяжелые запросы.
+SQL_LOG = env.bool('SQL_LOG', False)
+SQL_SLOW_MS = env.float('SQL_SLOW_MS', 100)
+SQL_SAMPLE_RATE = env.float('SQL_SAMPLE_RATE', 0.0)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'meetup': {'handlers': ['console'], 'level': env.str('LOG_LEVEL', 'INFO')},
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -3,11 +3,16 @@ from django.contrib import admin
 from django.urls import path
 from django.urls import reverse
 
+from meetup.views import export, metrics, telegram_webhook
+
 
 def redirect2admin(request):
     return HttpResponseRedirect(reverse('admin:index'))
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('telegram/webhook/', telegram_webhook, name='telegram_webhook'),
+    path('metrics/', metrics, name='metrics'),
+    path('exports/<str:name>/', export, name='export'),
     path('', redirect2admin),
 ]
\ No newline at end of file